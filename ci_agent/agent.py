@@ -1,107 +1,271 @@
 import json
 import os
 import datetime
-from boto3.dynamodb.conditions import Key, Attr
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Generator, Optional, Union
 from ci_agent.models.agent_models import AgentResponse
 from dotenv import load_dotenv
-from openai import OpenAI
-from ci_agent.dependencies import public_companies_table
+from ci_agent.services.filing_store import SessionFilingStore, filing_store
+from ci_agent.services.ledger import token_ledger
+from ci_agent.services.llm_scheduler import DEFAULT_COMPLETION_TOKENS, llm_scheduler
+from ci_agent.services.prompts import PromptAssembler, record_usage
+from ci_agent.services.raw_filings import LazyReport, raw_filing_cache
 from ci_agent.services.retrieval import RetrievalLayer
+from ci_agent.services.router import model_family, model_router
+from ci_agent.services.speculation import covers
+from ci_agent.services.summarization import MapReduceSummarizer, SummaryText, source_hash
+from ci_agent.services.text_index import text_index
+from ci_agent.services.xbrl import xbrl_extractor
+from ci_agent.services.tools import tools
+from ci_agent.utils.codec import encode_item, encode_summaries, encode_text
+from ci_agent.utils.financials import COLUMNAR_VERSION
+from ci_agent.utils.metrics import metrics
 from ci_agent.utils.mappings import FUNCTION_MAPPINGS, section_enums_mappings, tenq_section_enum_mappings
+from ci_agent.utils.tokens import estimate_message_tokens, estimate_tokens
 
 load_dotenv("./.env")
 
+# Shared by all agents; retrieval tool calls are I/O bound (DynamoDB / local cache).
+TOOL_CALL_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tool-call")
+
+# Assumed answer length for cancellation reports until an agent has completed answers.
+DEFAULT_EXPECTED_ANSWER_TOKENS = 500
+
+# Most recent filings per form loaded into the session store while the user types.
+WARM_UP_FILINGS = {"10-K": 1, "10-Q": 1, "8-K": 3}
+
+# An 8-K is keyed by its date of report, which the listing lacks; it is due within four
+# business days of the event, so a stored 8-K is looked for among those filed this soon after.
+EIGHTK_FILING_WINDOW = datetime.timedelta(days=7)
+
+# Version of the summary prompts in generate_summary. Bump it whenever they change:
+# summaries made with another version are regenerated on re-ingest (see ci_agent.reingest).
+SUMMARY_PROMPT_VERSION = "2"
+
 class Agent:
-    def __init__(self, ent, start_date, data_sources):
+    def __init__(self, ent, start_date, data_sources, speculative=True):
         self.ent = ent
         self.start_date = start_date
         self.data_sources = data_sources
-        self.system_prompt = f"""
-        You are an agent that produces competitive intelligence on {ent.display_name}.
-        The current date is {datetime.date.today()}.
+        # Select tools from the raw user message in parallel with the planner.
+        self.speculative = speculative
+        # Filings read during this session are kept in memory (see warm_up).
+        self.store = SessionFilingStore(filing_store)
+
+        self.retrieval_layer_system_prompt = """You are a data assistant. You are to take in an ordered list of pieces of information to retrieve. \\
+        You are to return a list of tool calls that correspond to each of the pieces of information requested.""".strip()
+
+        # Most stable first (see PromptAssembler): shared instructions, then company facts, then the history.
+        self.messages = [
+          {"role": "system", "content": self._static_instructions()},
+          {"role": "system", "content": self._company_facts()}
+        ]
+        self.prompts = PromptAssembler()
+
+        from openai import OpenAI
+        # Retries are handled by llm_scheduler, which also knows about the rate limits.
+        self.client = OpenAI(api_key=os.environ["OPENAI_API_KEY"], max_retries=0)
+        self.rl = RetrievalLayer(self.retrieval_layer_system_prompt, tools=self._tools())
+        self.summarizer = MapReduceSummarizer(self._summary_completion)
+        # Picks the model of every stage (planning, retrieval, answer, summary).
+        self.router = model_router
+        # Who token usage is attributed to (and whose budgets apply); see attribute_to.
+        self.owner = {"user_id": None, "agent_id": None}
+        self.MAX_CHAT_TURNS = 30
+
+        # Per-turn cancellation state (turns of one agent never overlap).
+        self._cancel_event = threading.Event()
+        self._active_stream = None
+        self._tool_calls_cancelled = 0
+        self._unsent_prompt_tokens = 0
+        self._answer_tokens = []
+        self.cancellation_report = None
+        self._turn_query = ""
+
+    def _static_instructions(self):
+        """
+        Planner instructions shared by every agent. Nothing company- or date-specific goes
+        here, so the provider can serve this prefix from its prompt cache.
+        """
+        return """
+        You are an agent that produces competitive intelligence on a public company. \
+        The company, the current date and the filings available are given in the next message.
 
-        Your job is to answer the user to the best of your ability. \\
-        If you are unable to answer a question, you must say so. \\
+        Your job is to answer the user to the best of your ability. \
+        If you are unable to answer a question, you must say so. \
         If you need more clarification on the user's request, you must ask.
 
         You have the ability to do the following:
           - Retrieve entire 8-K document summaries by date range or latest entries.
-            -- For 8-Ks, you have filing(s) available {self.readable_date_range("8-K")}.
           - Retrieve specific financial statements from 10-K filings (balance sheet, income statement, cash flow statement)."
           - Retrieve specific item summaries of 10-K documents by date range or latest entries (these are standard items like 1. Business, 1A. Risk, , etc.).
             -- Note: for financial information, do not retrieve Item 8. That is what the previous function is for.
-            -- For 10-Ks, you have filing(s) available {self.readable_date_range("10-K")}.
           - Retrieve specific financial statements from 10-Q filings (balance sheet, income statement, cash flow statement)."
           - Retrieve specific item summaries of 10-Q documents by date range or latest entries (these are standard items like 1. Business, 1A. Risk, , etc.).
             -- Note: for financial information, do not retrieve Item 1. That is what the previous function is for.
-            -- For 10-Qs, you have filing(s) available {self.readable_date_range("10-Q")}.
+          - Compare financial metrics (revenue, margins, cash from operations, etc.) and their growth across the last N quarters or years.
+            -- Prefer this over retrieving full financial statements when the user asks how a metric changed over time.
+          - Search the raw text of filings for specific facts that summaries may leave out (named customers, case numbers, products, contract terms).
 
         If a user query pertains to more than one of these items, put multiple entries in the information_needed field, as you will synethesize the data together.
 
         After receiving context from the data retrieval mechanism, you will be penalized for not citing your sources in the format: 'Source: <source name>, <section name (if available)>, <date (if available)>'.
         """.strip()
 
-        self.retrieval_layer_system_prompt = """You are a data assistant. You are to take in an ordered list of pieces of information to retrieve. \\
-        You are to return a list of tool calls that correspond to each of the pieces of information requested.""".strip()
-
-        self.messages = [
-          {"role": "system", "content": self.system_prompt}
-        ]
+    def _company_facts(self):
+        """The company, the current date and the filing dates available per form."""
+        return f"""
+        The company is {self.ent.display_name}.
+        The current date is {datetime.date.today()}.
 
-        self.client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-        self.rl = RetrievalLayer(self.retrieval_layer_system_prompt)
-        self.MAX_CHAT_TURNS = 30
+        For 8-Ks, you have filing(s) available {self.readable_date_range("8-K")}.
+        For 10-Ks, you have filing(s) available {self.readable_date_range("10-K")}.
+        For 10-Qs, you have filing(s) available {self.readable_date_range("10-Q")}.
+        """.strip()
 
-    def get_completion(self, messages, model="gpt-4o-mini", format=None):
-      completion = self.client.beta.chat.completions.parse(
-          model=model,
-          messages=messages,
-          response_format=format,
+    def get_completion(self, messages, model="gpt-4o-mini", format=None, stage="planning"):
+      completion = llm_scheduler.run(
+          stage,
+          lambda: self.client.beta.chat.completions.parse(
+              model=model,
+              messages=messages,
+              response_format=format,
+          ),
+          estimate_message_tokens(messages) + DEFAULT_COMPLETION_TOKENS
       )
       response = completion.choices[0].message.parsed
       print(f"used: {completion.usage.total_tokens}")
+      record_usage(stage, completion.usage, completion.model, **self.owner)
       print("*" * 100)
       return response
 
-    def get_completion_stream(self, messages, model="gpt-4o-mini"):
-      response = self.client.chat.completions.create(
-          model=model,
-          messages=messages,
-          temperature=0,
-          stream=True  # this time, we set stream=True
-      )
-
-      for chunk in response:
-          yield chunk.choices[0].delta.content
+    def get_completion_stream(self, messages, model="gpt-4o-mini", decision=None):
+      def open_stream(model):
+          return llm_scheduler.run(
+              "answer",
+              lambda: self.client.chat.completions.create(
+                  model=model,
+                  messages=messages,
+                  temperature=0,
+                  stream=True,  # this time, we set stream=True
+                  # The final chunk carries usage (including cached prompt tokens) and no choices.
+                  stream_options={"include_usage": True}
+              ),
+              estimate_message_tokens(messages) + DEFAULT_COMPLETION_TOKENS
+          )
+
+      # With a routing decision, the time to open the stream is recorded and failures fall back to a faster model.
+      response = self.router.run(decision, open_stream) if decision else open_stream(model)
+
+      # Kept so that cancel() can close the connection and stop generation upstream.
+      self._active_stream = response
+      try:
+          for chunk in response:
+              if self._cancel_event.is_set():
+                  break
+              if chunk.usage is not None:
+                  record_usage("answer", chunk.usage, chunk.model, **self.owner)
+              if chunk.choices:
+                  yield chunk.choices[0].delta.content
+      except Exception:
+          # Closing the stream from cancel() aborts the read in this thread.
+          if not self._cancel_event.is_set():
+              raise
+      finally:
+          self._active_stream = None
+          response.close()
     
     def generate_summary(self, filing, raw_text, doc_type, section_name=None):
         system_message = f"""Extract the key information from this {doc_type}. 
         Include financial information and key data if they exist. You will be penalized for generally describing and 
         summarizing as opposed to explicitly gathering particular information."""
-        
+
+        # Only used when the text is too large for one request and was summarized in parts.
+        reduce_message = f"""Combine the key information extracted from consecutive parts of this {doc_type} into one result. 
+        Keep every specific figure, name and date, and remove repetition. You will be penalized for generally describing and 
+        summarizing as opposed to explicitly gathering particular information."""
+
+        summary = self.summarizer.summarize(raw_text, system_message, reduce_message)
+        return SummaryText(
+            f"""# KEY INFO FROM {filing}{", " + section_name if section_name else ""} #\n""" + summary,
+            getattr(summary, "model", None)
+        )
+
+    def attribute_to(self, user_id, agent_id=None):
+        """Attributes this agent's token usage to a user and agent, whose budgets then apply."""
+        self.owner = {"user_id": user_id, "agent_id": agent_id}
+
+    def _choose(self, stage, query="", context_tokens=0):
+        """
+        Routes a request (see ModelRouter.choose), on the cheapest model once the owner's
+        token budget runs low.
+
+        Raises:
+            BudgetExceeded: If the owner's budget is used up.
+        """
+        downgrade = token_ledger.check(**self.owner)
+        return self.router.choose(stage, query=query, context_tokens=context_tokens, downgrade=downgrade)
+
+    def summary_metadata(self, raw_text, summary=None):
+        """
+        What a summary of raw_text depends on: prompt version, model and the source text.
+
+        Args:
+            raw_text (str): The source text.
+            summary (str, optional): The generated summary. Its model is recorded when it
+                                     knows one (a SummaryText); otherwise, and when no
+                                     summary is given, the stage's preferred model is.
+        """
+        return {
+            'prompt_version': SUMMARY_PROMPT_VERSION,
+            'model': getattr(summary, "model", None) or self.router.policies["summary"]["models"][0],
+            'source_hash': source_hash(raw_text),
+        }
+
+    def summary_is_current(self, metadata, raw_text):
+        """
+        True if a summary stored with metadata would be generated the same way today. A
+        summary written by a fallback model is not, so it is redone with the preferred one.
+        """
+        if not isinstance(metadata, dict):
+            return False
+        current = self.summary_metadata(raw_text)
+        # The answering model is recorded with its snapshot date.
+        return model_family(metadata.get('model')) == current['model'] and all(
+            metadata.get(key) == current[key] for key in ('prompt_version', 'source_hash')
+        )
+
+    def _summary_completion(self, system_message, content):
         messages = [
             {"role": "system", "content": system_message},
-            {"role": "user", "content": raw_text},
+            {"role": "user", "content": content},
         ]
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",  # Change model as needed
-            messages=messages
-        )
+        decision = self._choose("summary", context_tokens=estimate_tokens(content))
+        response = self.router.run(decision, lambda model: llm_scheduler.run(
+            "summary",
+            lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages
+            ),
+            estimate_message_tokens(messages) + DEFAULT_COMPLETION_TOKENS
+        ))
+        record_usage("summary", response.usage, response.model, **self.owner)
 
-        return f"""# KEY INFO FROM {filing}{", " + section_name if section_name else ""} #\n""" + response.choices[0].message.content
+        return SummaryText(response.choices[0].message.content or "", response.model)
 
-    def dates_available(self, filing_type):
+    def dates_available(self, filing_type, ent=None):
         """
         Retrieves an ordered list of available filing dates for the specified filing type (10-K, 10-Q, or 8-K)
-        for the current company (based on self.ent.cik).
+        for the current company (based on self.ent.cik), or for ent if given.
 
         Assumes that each filing is stored as a separate item in DynamoDB and that the table has a Global Secondary Index (GSI)
         with 'cik' as the partition key and 'filing_date' as the sort key (e.g., "cik-filing_date-index").
 
         Args:
             filing_type (str): The type of filing ('10-K', '10-Q', or '8-K').
+            ent (object, optional): The company to look up. Defaults to self.ent.
 
         Returns:
             list: A list of ordered dates (as strings in "YYYY-MM-DD" format) for the specified filing type.
@@ -110,27 +274,18 @@ class Agent:
             raise ValueError("Invalid filing type. Must be one of: '10-K', '10-Q', or '8-K'.")
 
         # Query the DynamoDB table using a GSI that indexes on 'cik' (and sorts by 'filing_date').
-        response = public_companies_table.query(
-            IndexName='cik-filing_date-index',  # Adjust the index name as configured in your table
-            KeyConditionExpression=Key('cik').eq(str(self.ent.cik)),
-            FilterExpression=Attr('filing_type').eq(filing_type)
-        )
-
-        items = response.get('Items', [])
-        if not items:
+        stubs = self.store.list_filings((ent or self.ent).cik, filing_type)
+        if not stubs:
             return []  # Return an empty list if no filings are found
 
-        # Extract filing dates from the returned items.
-        dates = [item['filing_date'] for item in items]
-
-        # Sort the dates (assuming the dates are stored as "YYYY-MM-DD").
-        dates.sort(key=lambda date_str: datetime.datetime.strptime(date_str, "%Y-%m-%d"))
+        # Listings come back most recent first; return the dates in ascending order.
+        dates = [stub['filing_date'] for stub in reversed(stubs)]
 
         return dates
 
 
-    def readable_date_range(self, filing_type):
-      available_dates = self.dates_available(filing_type)
+    def readable_date_range(self, filing_type, ent=None):
+      available_dates = self.dates_available(filing_type, ent)
       if not available_dates:
           return "for NO AVAILABLE DATES"
       elif len(available_dates) == 1:
@@ -140,24 +295,36 @@ class Agent:
 
 
     def chat(self, message: str, streaming: bool = False) -> Union[str, Generator[str, None, None]]:
-        """Main chat function that handles both streaming and non-streaming responses."""
+        """
+        Main chat function that handles both streaming and non-streaming responses.
+
+        Raises:
+            BudgetExceeded: If the user or agent has used up its daily token budget.
+        """
+        # Refuse before the message enters the history.
+        token_ledger.check(**self.owner)
         self.messages.append({"role": "user", "content": message})
+        self._turn_query = message
         
         # Get initial completion and handle information needs
         context = self._handle_information_needs()
         
-        # If we have context, create a generator with it
-        if context:
-            messages_with_context = self._create_messages_with_context(context)
-            response_generator = self.get_completion_stream(
-                messages=messages_with_context, 
-                model="gpt-4o-mini"
-            )
+        # Retrieved context goes after the history and is never kept in it.
+        messages = self.prompts.assemble("answer", self.messages, context)
+
+        if self._cancel_event.is_set():
+            # Cancelled while planning or retrieving: never send the answer request.
+            self._unsent_prompt_tokens = estimate_message_tokens(messages)
+            response_generator = iter(())
         else:
-            # No context needed, use original messages
+            decision = self._choose(
+                "answer",
+                query=message,
+                context_tokens=estimate_tokens(context)
+            )
             response_generator = self.get_completion_stream(
-                messages=self.messages, 
-                model="gpt-4o-mini"
+                messages=messages, 
+                decision=decision
             )
 
         if streaming:
@@ -165,21 +332,112 @@ class Agent:
         else:
             return self._collect_response(response_generator)
 
+    def begin_turn(self):
+        """
+        Resets cancellation state for the next turn.
+
+        Callers run this before scheduling chat() on a worker thread, so a cancel that
+        arrives between scheduling and the thread starting still applies to the turn.
+        """
+        self._cancel_event.clear()
+        self._tool_calls_cancelled = 0
+        self._unsent_prompt_tokens = 0
+        self.cancellation_report = None
+
+    def cancel(self):
+        """
+        Cancels the in-flight turn. Pending tool calls are dropped and the upstream
+        answer stream is closed. Safe to call from another thread.
+        """
+        self._cancel_event.set()
+        stream = self._active_stream
+        if stream is not None:
+            stream.close()
+
+    def _finish_turn(self, answer: str):
+        """Records the assistant answer (partial if cancelled) so the history stays consistent."""
+        if self._cancel_event.is_set():
+            streamed = estimate_tokens(answer)
+            expected = (
+                sum(self._answer_tokens) // len(self._answer_tokens)
+                if self._answer_tokens else DEFAULT_EXPECTED_ANSWER_TOKENS
+            )
+            self.cancellation_report = {
+                "tokens_streamed": streamed,
+                "estimated_tokens_saved": max(0, expected - streamed) + self._unsent_prompt_tokens,
+                "tool_calls_cancelled": self._tool_calls_cancelled,
+            }
+            answer = (answer + "\n\n" if answer else "") + "[Response cancelled by the user]"
+        else:
+            self._answer_tokens.append(estimate_tokens(answer))
+        self.messages.append({"role": "assistant", "content": answer})
+
     def _handle_information_needs(self) -> Optional[str]:
         """Handle information needs and return context if any."""
-        response: AgentResponse = self.get_completion(self.messages, "gpt-4o", AgentResponse)
+        # Speculatively select tools from the raw user message while the planner runs.
+        speculation = None
+        if self.speculative:
+            speculation = TOOL_CALL_EXECUTOR.submit(
+                self._select_tools, self._format_information_needs([self._turn_query])
+            )
+
+        decision = self._choose("planning", query=self._turn_query)
+        response: AgentResponse = self.router.run(
+            decision, lambda model: self.get_completion(
+                self.prompts.assemble("planning", self.messages), model, AgentResponse, stage="planning"
+            )
+        )
         
-        if not response.information_needed:
+        if not response.information_needed or self._cancel_event.is_set():
+            self._discard_speculation(speculation, "not_needed")
             return None
-            
-        user_content = self._format_information_needs(response.information_needed)
-        rl_message = self.rl.get_completion(user_content, "gpt-4o-mini")
+
+        rl_message = self._resolve_speculation(speculation, response.information_needed) if speculation else None
+        if rl_message is None:
+            rl_message = self._select_tools(self._format_information_needs(response.information_needed))
         
-        if not rl_message:
+        if not rl_message or not rl_message.tool_calls or self._cancel_event.is_set():
             return None
             
         return self._build_context(rl_message)
 
+    def _select_tools(self, user_content):
+        """Ask the retrieval layer for the tool calls that gather the requested information."""
+        decision = self._choose("retrieval", query=self._turn_query)
+        return self.router.run(decision, lambda model: self.rl.get_completion(user_content, model, self.owner))
+
+    def _resolve_speculation(self, speculation, information_needed):
+        """Returns the speculative tool selection if it covers the planner's needs, otherwise None."""
+        try:
+            rl_message = speculation.result()
+        except Exception as e:
+            print(f"Speculative tool selection failed: {e}")
+            metrics.increment("speculation_total", outcome="failed")
+            return None
+
+        tool_calls = rl_message.tool_calls if rl_message else None
+        if covers(information_needed, tool_calls):
+            metrics.increment("speculation_total", outcome="used")
+            return rl_message
+
+        metrics.increment("speculation_total", outcome="rejected")
+        metrics.increment("speculation_wasted_tool_calls_total", len(tool_calls or []))
+        return None
+
+    def _discard_speculation(self, speculation, outcome):
+        """Drops a speculative tool selection that is no longer needed."""
+        if speculation is None:
+            return
+        metrics.increment("speculation_total", outcome=outcome)
+        def count_wasted(future):
+            rl_message = None if future.exception() else future.result()
+            if rl_message and rl_message.tool_calls:
+                metrics.increment("speculation_wasted_tool_calls_total", len(rl_message.tool_calls))
+
+        if not speculation.cancel():
+            # Already running; count its tool calls as wasted once it completes.
+            speculation.add_done_callback(count_wasted)
+
     def _format_information_needs(self, info_needed: list) -> str:
         """Format the information needs into a string."""
         content = "##Information Needed\n"
@@ -187,46 +445,62 @@ class Agent:
             content += f"{idx}. {step}\n"
         return content
 
-    def _build_context(self, rl_message) -> str:
-        """Build context string from tool calls."""
-        context = ""
-        for tool_call in rl_message.tool_calls:
-            context += f"# FROM : {tool_call.function.name}({tool_call.function.arguments})\n"
-            context += f"{FUNCTION_MAPPINGS[tool_call.function.name](ent=self.ent, **json.loads(tool_call.function.arguments))}"
+    def _build_context(self, rl_message) -> Optional[str]:
+        """Build context string from tool calls, running them concurrently."""
+        futures = [
+            TOOL_CALL_EXECUTOR.submit(self._run_tool_call, *job)
+            for job in self._tool_jobs(rl_message)
+        ]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            if self._cancel_event.is_set():
+                # Running calls finish in the background; their results are discarded.
+                self._tool_calls_cancelled = sum(future.cancel() for future in pending)
+                return None
+
+        context = self._merge_context([future.result() for future in futures])
         print(context)
         return context
 
-    def _create_messages_with_context(self, context: str) -> list:
-        """Create messages list with context."""
-        ephemeral_message = {
-            "role": "system",
-            "content": f"""The data retrieval mechanism for the assistant has \
-            retrieved the following context which the assistant shall use to \
-            answer the user's question. The assistant should be advised that the user cannot see this context:\n {context}""".strip()
-        }
-        
-        messages = self.messages.copy()
-        messages.append(ephemeral_message)
-        
-        # Add opaque context marker to original messages
-        self.messages.append({
-            "role": "system",
-            "content": '<Context Made Opaque For This Step Due To Length>'
-        })
-        
-        return messages
+    def _tools(self) -> list:
+        """Tool schemas offered to the retrieval layer."""
+        return tools
+
+    def _tool_jobs(self, rl_message) -> list:
+        """Expand the retrieval layer's tool calls into (ent, function name, arguments) jobs."""
+        return [
+            (self.ent, tool_call.function.name, json.loads(tool_call.function.arguments))
+            for tool_call in rl_message.tool_calls
+        ]
+
+    def _run_tool_call(self, ent, name, arguments) -> str:
+        """Run a single retrieval tool call and return its context block."""
+        result = FUNCTION_MAPPINGS[name](ent=ent, store=self.store, **arguments)
+        return f"# FROM : {name}({json.dumps(arguments)})\n{result}"
+
+    def _merge_context(self, blocks: list) -> str:
+        """Merge the context blocks of a turn."""
+        return "".join(blocks)
 
     def _stream_response(self, generator) -> Generator[str, None, None]:
         """Stream response chunks."""
-        for chunk in generator:
-            if chunk:
-                yield chunk
+        chunks = []
+        try:
+            for chunk in generator:
+                if chunk:
+                    chunks.append(chunk)
+                    yield chunk
+        finally:
+            self._finish_turn("".join(chunks))
 
     def _collect_response(self, generator) -> str:
         """Collect all response chunks into a single string."""
-        return "".join(chunk for chunk in generator if chunk)
+        answer = "".join(chunk for chunk in generator if chunk)
+        self._finish_turn(answer)
+        return answer
     
-    def handle_10_filing(self, ent, filing, generate_summary, filing_type, rewrite_summaries=False):
+    def handle_10_filing(self, ent, filing, generate_summary, filing_type, rewrite_summaries=False, force=False, index_only=False):
         """
         Stores or retrieves filing summaries (and financials) in a DynamoDB table where each item is
         keyed by a composite of cik, filing_type, and filing_date.
@@ -237,10 +511,16 @@ class Agent:
             generate_summary (function): A function that accepts (filing, raw_text, filing_type, section_name)
                                         and returns a summary string.
             filing_type (str): Either "10-K" or "10-Q".
-            rewrite_summaries (bool): If True, forces re-generation of the summaries even if they exist.
+            rewrite_summaries (bool): If True, regenerates the summaries of an existing item whose
+                                      prompt version, model or source text changed (and the
+                                      financials if their format changed), as a partial update.
+            force (bool): With rewrite_summaries, regenerates everything and replaces the item.
+            index_only (bool): Only indexes the raw text of a stored filing; one that is not
+                               stored is skipped instead of ingested.
 
         Returns:
-            dict: The DynamoDB item for the filing, including the summaries and financials.
+            dict: The DynamoDB item for the filing, including the summaries and financials
+                  (None if index_only skipped it).
         """
         # Choose the appropriate section mapping based on the filing_type.
         if filing_type == "10-K":
@@ -250,115 +530,217 @@ class Agent:
         else:
             raise ValueError("filing_type must be either '10-K' or '10-Q'")
 
-        table = public_companies_table  # Your DynamoDB table object
         filing_date = str(filing.filing_date)  # e.g., "2024-01-01"
 
         # Build a composite key (primary key) that uniquely identifies this filing.
         composite_key = f"{ent.cik}#{filing_type}#{filing_date}"
 
         # Step 1: Check if an item for this composite key already exists.
-        response = table.get_item(Key={'cik_filing_date': composite_key})
-        existing_item = response.get('Item')
+        existing_item = self.store.get_item(composite_key)
         if existing_item and not rewrite_summaries:
-            # The filing already exists and we are not rewriting summaries.
+            # The filing already exists and we are not rewriting summaries; only index
+            # its raw text if it predates the full-text index.
+            if not text_index.has_filing(ent.cik, composite_key):
+                section_texts = self._section_texts(filing, section_mapping)
+                raw_sections = {section_name: section_texts[section_enum] for section_name, section_enum in section_mapping.items()}
+                text_index.add_filing(ent.cik, composite_key, filing_type, filing_date, raw_sections)
             return existing_item
+        if index_only:
+            return None
+        if existing_item and not force:
+            return self._refresh_10_filing(ent, filing, generate_summary, filing_type, section_mapping, existing_item)
 
-        # Step 2: Generate summaries for each filing section.
+        # Financials are extracted in a worker process while the sections are summarized.
+        financials_future = xbrl_extractor.submit(filing)
+
+        # Step 2: Generate summaries for each filing section (keeping the raw text for the full-text index).
+        section_texts = self._section_texts(filing, section_mapping)
         summaries = {}
+        raw_sections = {}
         for section_name, section_enum in section_mapping.items():
-            section_raw_text = filing[section_enum]
+            section_raw_text = section_texts[section_enum]
             if section_raw_text:
+                raw_sections[section_name] = section_raw_text
                 summary = generate_summary(filing, section_raw_text, filing_type, section_name)
                 summaries[section_enum] = {
-                    'summary': summary
+                    'summary': summary,
+                    **self.summary_metadata(section_raw_text, summary)
                 }
             else:
                 print(f"Section {section_name} not found in the filing.")
 
-        # Step 3: Process financials if available.
-        if hasattr(filing, 'financials') and filing.financials:
-            financials = {
-                "balance sheet": filing.financials.get_balance_sheet().data.drop(
-                    ['style', 'concept', 'level'], axis=1
-                ).to_markdown(),
-                "income statement": filing.financials.get_income_statement().data.drop(
-                    ['style', 'concept', 'level'], axis=1
-                ).to_markdown(),
-                "cash flow statement": filing.financials.get_cash_flow_statement().data.drop(
-                    ['style', 'concept', 'level'], axis=1
-                ).to_markdown()
-            }
-        else:
-            financials = {}
+        # Step 3: Collect the financials (stored in columnar form and rendered on retrieval).
         # Include financials under a dedicated key.
-        summaries["financials"] = financials
+        summaries["financials"] = xbrl_extractor.result(financials_future, filing)
 
-        # Step 4: Create the new item with a composite primary key.
-        new_item = {
+        # Step 4: Create the new item with a composite primary key (summaries stored compressed).
+        new_item = encode_item({
             'cik_filing_date': composite_key,
             'cik': str(ent.cik),
             'filing_type': filing_type,
             'filing_date': filing_date,
-            'summaries': summaries
-        }
+            'summaries': summaries,
+            'financials_version': COLUMNAR_VERSION
+        })
 
-        # Step 5: Write the new item to the DynamoDB table.
-        table.put_item(Item=new_item)
+        # Step 5: Write the new item to the DynamoDB table (and through to the local cache).
+        self.store.put_item(new_item)
+        text_index.add_filing(ent.cik, composite_key, filing_type, filing_date, raw_sections)
 
         # Return the newly created (or updated) filing item.
         return new_item
 
+    def _section_texts(self, filing, section_mapping):
+        """Raw text of a 10-K / 10-Q's sections by section enum, fetched from EDGAR at most once per filing."""
+        section_enums = sorted(set(section_mapping.values()))
+
+        def split_sections():
+            # Chunked the way TenK / TenQ do, from the cached primary document.
+            from edgar.files.htmltools import ChunkedDocument
+            document = ChunkedDocument(raw_filing_cache.primary_document(filing))
+            return {section_enum: document[section_enum] for section_enum in section_enums}
+
+        return raw_filing_cache.get(filing, "sections:" + ",".join(section_enums), split_sections)
+
+    def _refresh_10_filing(self, ent, filing, generate_summary, filing_type, section_mapping, existing_item):
+        """
+        Regenerates only the out of date parts of a stored 10-K / 10-Q and writes them with a
+        single partial UpdateItem.
+
+        Returns:
+            dict: The (updated) DynamoDB item.
+        """
+        composite_key = existing_item['cik_filing_date']
+        stored_summaries = existing_item.get('summaries')
+        refresh_financials = existing_item.get('financials_version') != COLUMNAR_VERSION
+        if refresh_financials:
+            financials_future = xbrl_extractor.submit(filing)
+        section_texts = self._section_texts(filing, section_mapping)
+        raw_sections = {}
+        changed = {}
+        for section_name, section_enum in section_mapping.items():
+            section_raw_text = section_texts[section_enum]
+            if not section_raw_text:
+                continue
+            raw_sections[section_name] = section_raw_text
+            if self.summary_is_current((stored_summaries or {}).get(section_enum), section_raw_text):
+                continue
+            summary = generate_summary(filing, section_raw_text, filing_type, section_name)
+            changed[section_enum] = {'summary': summary, **self.summary_metadata(section_raw_text, summary)}
+        resummarized = len(changed)
+
+        financials = xbrl_extractor.result(financials_future, filing) if refresh_financials else None
+        if financials:
+            changed['financials'] = financials
+
+        print(f"Re-summarized {resummarized} of {len(raw_sections)} section(s) of {composite_key}"
+              f"{', re-extracted financials' if financials else ''}")
+        if resummarized or not text_index.has_filing(ent.cik, composite_key):
+            text_index.add_filing(ent.cik, composite_key, filing_type, existing_item['filing_date'], raw_sections)
+        if not changed:
+            return existing_item
+
+        encoded = encode_summaries(changed)
+        names, values = {'#summaries': 'summaries'}, {}
+        if isinstance(stored_summaries, dict):
+            # Set only the changed entries of the stored map.
+            updates = []
+            for placeholder, (key, value) in enumerate(encoded.items()):
+                names[f"#s{placeholder}"] = key
+                values[f":s{placeholder}"] = value
+                updates.append(f"#summaries.#s{placeholder} = :s{placeholder}")
+        else:
+            # Nested paths fail on an item without a summaries map; write the whole map.
+            values[':summaries'] = encoded
+            updates = ["#summaries = :summaries"]
+        if financials:
+            values[':financials_version'] = COLUMNAR_VERSION
+            updates.append("financials_version = :financials_version")
+        return self.store.update_item(composite_key, "SET " + ", ".join(updates), names, values)
+
 
     
-    def handle_eightk(self, ent, filing, generate_summary, rewrite_summaries=False):
+    def handle_eightk(self, ent, filing, generate_summary, rewrite_summaries=False, force=False, index_only=False):
         """
         Handles storing or retrieving the 8-K summary for a given filing date.
 
         Args:
             ent (object): An EightK object containing the filing information.
             generate_summary (function): A function that takes raw_text and returns a summary.
+            rewrite_summaries (bool): If True, regenerates the summary of an existing item whose prompt
+                                      version, model or source text changed, as a partial update.
+            force (bool): With rewrite_summaries, regenerates the summary regardless.
+            index_only (bool): Only indexes the items of a stored filing; one that is not
+                               stored is skipped instead of ingested.
 
         Returns:
             str: The summary of the 8-K filing.
         """
-        def get_eightk_filing_text(filing):
-            eightk_repr = f"""##### {str(filing)} #####\n\n"""
-            for item in filing.items:
-                if item not in {'Item 9.01'}:
-                    eightk_repr += f"**{str(item)}**\n"
-                    eightk_repr += str(filing[item])
-                    eightk_repr += "\n\n"
+        def get_eightk_items(filing):
+            return {str(item): str(filing[item]) for item in filing.items if item not in {'Item 9.01'}}
+
+        def get_eightk_filing_text(header, items):
+            eightk_repr = f"""##### {header} #####\n\n"""
+            for item, item_text in items.items():
+                eightk_repr += f"**{item}**\n"
+                eightk_repr += item_text
+                eightk_repr += "\n\n"
             return eightk_repr
         
-        table = public_companies_table  # Replace with your table name
-        filing_date = datetime.datetime.strptime(str(filing.date_of_report), "%B %d, %Y").strftime("%Y-%m-%d")
-        raw_text = get_eightk_filing_text(filing)
+        # Fetched from EDGAR at most once per filing (see RawFilingCache).
+        parts = raw_filing_cache.get(filing, "8-K", lambda: {
+            "header": str(filing),
+            "date_of_report": str(filing.date_of_report),
+            "items": get_eightk_items(filing),
+        })
+        filing_date = datetime.datetime.strptime(parts["date_of_report"], "%B %d, %Y").strftime("%Y-%m-%d")
+        items = parts["items"]
+        raw_text = get_eightk_filing_text(parts["header"], items)
 
         # Step 1: Try to fetch the item for the given cik
         # Build a composite key (primary key) that uniquely identifies this filing.
         composite_key = f"{ent.cik}#8-K#{filing_date}"
 
         # Step 1: Check if an item for this composite key already exists.
-        response = table.get_item(Key={'cik_filing_date': composite_key})
-        existing_item = response.get('Item')
+        existing_item = self.store.get_item(composite_key)
         if existing_item and not rewrite_summaries:
             # The filing already exists and we are not rewriting summaries.
+            if not text_index.has_filing(ent.cik, composite_key):
+                text_index.add_filing(ent.cik, composite_key, "8-K", filing_date, items)
+            return existing_item
+        if index_only:
+            return None
+        if existing_item and not force and self.summary_is_current(existing_item.get('summary_metadata'), raw_text):
+            print(f"Summary of {composite_key} is up to date")
             return existing_item
 
         summary = generate_summary(filing, raw_text, "8-K")
         print(f"Extracting Key Info from {filing}")
 
-        # Step 4: Write the new summary and raw_text to the database
-        new_item = {
+        if existing_item:
+            # Only the summary changed: partial update instead of rewriting the item.
+            self.store.update_item(
+                composite_key,
+                "SET summary = :summary, summary_metadata = :metadata",
+                {},
+                {":summary": encode_text(summary), ":metadata": self.summary_metadata(raw_text, summary)}
+            )
+            text_index.add_filing(ent.cik, composite_key, "8-K", filing_date, items)
+            return summary
+
+        # Step 4: Write the new (compressed) summary to the database
+        new_item = encode_item({
             'cik_filing_date': composite_key,
             'cik': str(ent.cik),
             'filing_type': "8-K",
             'filing_date': filing_date,
-            'summary': summary
-        }
+            'summary': summary,
+            'summary_metadata': self.summary_metadata(raw_text, summary)
+        })
 
-        # Save the updated item back to the table
-        table.put_item(Item=new_item)
+        # Save the updated item back to the table (and through to the local cache)
+        self.store.put_item(new_item)
+        text_index.add_filing(ent.cik, composite_key, "8-K", filing_date, items)
 
         # Return the newly generated summary
         return summary
@@ -370,7 +752,9 @@ class Agent:
                     filing=params["filing"],
                     generate_summary=params["summary_generation_function"],
                     filing_type=params["source_type"],
-                    rewrite_summaries=params["rewrite_summaries"]
+                    rewrite_summaries=params["rewrite_summaries"],
+                    force=params.get("force", False),
+                    index_only=params.get("index_only", False)
                 )
             case "10-Q":
                 self.handle_10_filing(
@@ -378,37 +762,132 @@ class Agent:
                     filing=params["filing"],
                     generate_summary=params["summary_generation_function"],
                     filing_type=params["source_type"],
-                    rewrite_summaries=params["rewrite_summaries"]
+                    rewrite_summaries=params["rewrite_summaries"],
+                    force=params.get("force", False),
+                    index_only=params.get("index_only", False)
                 )
             case "8-K":
                 self.handle_eightk(
                     ent=params["ent"],
                     filing=params["filing"],
                     generate_summary=params["summary_generation_function"],
-                    rewrite_summaries=params["rewrite_summaries"]
+                    rewrite_summaries=params["rewrite_summaries"],
+                    force=params.get("force", False),
+                    index_only=params.get("index_only", False)
                 )
             case _:
                 raise ValueError("Unrecognized filing type")
     
+    def warm_up(self, stop_event=None):
+        """
+        Prefetches the latest filings of each form (and their listings, which also back the
+        availability summary) into the session store, so the first turn is served from memory,
+        then indexes stored filings the full-text index lacks (see backfill_text_index).
+
+        Args:
+            stop_event (threading.Event, optional): Stops the prefetch and the backfill between items when set.
+
+        Returns:
+            int: Number of filings loaded.
+        """
+        loaded = 0
+        for ent in self.entities():
+            for filing_type, count in WARM_UP_FILINGS.items():
+                if stop_event is not None and stop_event.is_set():
+                    return loaded
+                loaded += self.store.prefetch_latest(ent.cik, filing_type, count)
+        print(f"Warmed up {loaded} filing(s) for {', '.join(ent.display_name for ent in self.entities())}")
+        self.backfill_text_index(stop_event)
+        return loaded
+
+    def backfill_text_index(self, stop_event=None):
+        """
+        Indexes the raw text of stored filings the full-text index on this host lacks: the
+        index is a local file, so filings ingested before it existed (or on another host)
+        are not searchable until indexed here. Raw sections come from the raw filing cache;
+        no summaries are regenerated.
+
+        Args:
+            stop_event (threading.Event, optional): Stops the backfill between filings when set.
+
+        Returns:
+            int: Number of filings indexed.
+        """
+        indexed = 0
+        for ent in self.entities():
+            if stop_event is not None and stop_event.is_set():
+                break
+            indexed_keys = text_index.filing_keys(ent.cik)
+            for source in self.data_sources:
+                self._backfill_source(ent, source, indexed_keys, stop_event)
+            indexed += len(text_index.filing_keys(ent.cik) - indexed_keys)
+        return indexed
+
+    def _backfill_source(self, ent, source, indexed_keys, stop_event):
+        """Indexes a company's stored filings of one form whose keys are not in indexed_keys."""
+        missing_dates = {
+            date for date in self.dates_available(source, ent)
+            if f"{ent.cik}#{source}#{date}" not in indexed_keys
+        }
+        if not missing_dates:
+            return
+        print(f"Indexing {len(missing_dates)} stored {source} filing(s) of {ent.display_name}")
+        filings = ent.get_filings(form=source).filter(date=f"{self.start_date}:{str(datetime.date.today())}")
+        for filing in filings:
+            if stop_event is not None and stop_event.is_set():
+                return
+            if not self._may_be_stored_as(source, filing.filing_date, missing_dates):
+                continue
+            try:
+                self._handler_dispatcher(source_type=source, params={
+                    "ent": ent,
+                    "filing": LazyReport(filing),
+                    "summary_generation_function": self.generate_summary,
+                    "source_type": source,
+                    "rewrite_summaries": False,
+                    "index_only": True
+                })
+            except Exception as e:
+                # One unreadable filing should not keep the others out of the index.
+                print(f"Could not index {source} filed {filing.filing_date}: {e}")
+
+    @staticmethod
+    def _may_be_stored_as(source, filing_date, dates):
+        """Whether a listed filing can be the one stored under one of dates."""
+        filing_date = datetime.date.fromisoformat(str(filing_date))
+        if source != "8-K":
+            return str(filing_date) in dates
+        return any(
+            datetime.timedelta(0) <= filing_date - datetime.date.fromisoformat(date) <= EIGHTK_FILING_WINDOW
+            for date in dates
+        )
+
     def check_for_missing_data(self):
         """Checks for missing filing dates in the database and returns a list of missing entries with detailed info."""
         missing_data = []
-        for source in self.data_sources:
-            dates = self.dates_available(source)
-            print(f"Dates available for {source}: ", dates)
-            filings = self.ent.get_filings(form=source).filter(date=f"{self.start_date}:{str(datetime.date.today())}")
-            for filing in filings:
-                f = filing.obj()
-                filing_date_str = str(f.filing_date)
-                if filing_date_str not in dates:
-                    print(f"Couldn't find {filing_date_str} in database")
-                    missing_data.append({
-                        "source": source,
-                        "filing_date": filing_date_str,
-                        "filing_obj": f,
-                        "raw_filing": filing
-                    })
+        for ent in self.entities():
+            for source in self.data_sources:
+                dates = self.dates_available(source, ent)
+                print(f"Dates available for {source}: ", dates)
+                filings = ent.get_filings(form=source).filter(date=f"{self.start_date}:{str(datetime.date.today())}")
+                for filing in filings:
+                    # The listing has the date; the report itself is only downloaded if it is ingested.
+                    f = LazyReport(filing)
+                    filing_date_str = str(f.filing_date)
+                    if filing_date_str not in dates:
+                        print(f"Couldn't find {filing_date_str} in database")
+                        missing_data.append({
+                            "source": source,
+                            "filing_date": filing_date_str,
+                            "filing_obj": f,
+                            "raw_filing": filing,
+                            "ent": ent
+                        })
         return missing_data
+
+    def entities(self):
+        """The companies covered by this agent."""
+        return [self.ent]
     
     def fill_missing_data(self, missing_data):
         """Fills in the missing data by dispatching processing for each missing filing."""
@@ -417,7 +896,7 @@ class Agent:
             f = entry["filing_obj"]
 
             params = {
-                "ent": self.ent,
+                "ent": entry.get("ent", self.ent),
                 "filing": f,
                 "summary_generation_function": self.generate_summary,
                 "source_type": source,
@@ -0,0 +1,110 @@
+import datetime
+from ci_agent.agent import Agent, TOOL_CALL_EXECUTOR
+from ci_agent.services.tools import company_scoped_tools
+from ci_agent.utils.tokens import estimate_tokens, truncate_to_tokens
+
+# Token budget shared by the retrieved context of all companies in one turn.
+DEFAULT_CONTEXT_TOKEN_BUDGET = 24000
+
+
+def _fair_shares(sizes, budget):
+    """
+    Split a token budget across context blocks (max-min fairness).
+
+    Blocks smaller than an equal share keep their full size and the surplus goes to
+    the larger blocks.
+
+    Returns:
+        list: Token allowance per block, aligned with sizes.
+    """
+    shares = [0] * len(sizes)
+    remaining = budget
+    order = sorted(range(len(sizes)), key=lambda idx: sizes[idx])
+    for position, idx in enumerate(order):
+        share = remaining // (len(order) - position)
+        shares[idx] = min(sizes[idx], share)
+        remaining -= shares[idx]
+    return shares
+
+
+class ComparativeAgent(Agent):
+    """
+    Agent that covers a set of companies for side by side comparisons.
+
+    Tool schemas take a `companies` parameter, the tool calls of a turn are fanned out
+    concurrently across companies, and the merged context is fit to a shared token budget.
+    """
+    def __init__(self, ents, start_date, data_sources, context_token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET):
+        self.ents = list(ents)
+        if not self.ents:
+            raise ValueError("ComparativeAgent requires at least one company.")
+        self.companies = {ent.display_name: ent for ent in self.ents}
+        self.context_token_budget = context_token_budget
+        super().__init__(self.ents[0], start_date, data_sources)
+
+    def _static_instructions(self):
+        """Planner instructions shared by every comparative agent (see Agent._static_instructions)."""
+        return """
+        You are an agent that produces competitive intelligence comparing a set of companies. \
+        The companies, the current date and the filings available are given in the next message.
+
+        Your job is to answer the user to the best of your ability. \
+        If you are unable to answer a question, you must say so. \
+        If you need more clarification on the user's request, you must ask.
+
+        You have the ability to do the following for any of these companies:
+          - Retrieve entire 8-K document summaries by date range or latest entries.
+          - Retrieve specific financial statements and item summaries from 10-K filings.
+          - Retrieve specific financial statements and item summaries from 10-Q filings.
+          - Compare financial metrics (revenue, margins, cash from operations, etc.) and their growth across the last N quarters or years.
+          - Search the raw text of filings for specific facts that summaries may leave out (named customers, case numbers, products, contract terms).
+
+        When comparing companies, request the same piece of information for every company in a single entry of the information_needed field \
+        (e.g. "Latest 10-K Item 1A Risk Factors for <company> and <company>"), as retrieval is run for all of them at once.
+
+        After receiving context from the data retrieval mechanism, you will be penalized for not citing your sources in the format: 'Source: <company>, <source name>, <section name (if available)>, <date (if available)>'.
+        """.strip()
+
+    def _company_facts(self):
+        """The companies, the current date and the filing dates available per company and form."""
+        return f"""
+        The companies are: {", ".join(self.companies)}.
+        The current date is {datetime.date.today()}.
+
+        For 8-Ks, you have filing(s) available {self.readable_date_range("8-K")}.
+        For 10-Ks, you have filing(s) available {self.readable_date_range("10-K")}.
+        For 10-Qs, you have filing(s) available {self.readable_date_range("10-Q")}.
+        """.strip()
+
+    def readable_date_range(self, filing_type, ent=None):
+        if ent is not None:
+            return super().readable_date_range(filing_type, ent)
+        ranges = TOOL_CALL_EXECUTOR.map(
+            lambda company: super(ComparativeAgent, self).readable_date_range(filing_type, company),
+            self.ents
+        )
+        return "; ".join(f"{name} {date_range}" for name, date_range in zip(self.companies, ranges))
+
+    def entities(self):
+        return self.ents
+
+    def _tools(self) -> list:
+        return company_scoped_tools(self.companies.keys())
+
+    def _tool_jobs(self, rl_message) -> list:
+        """Fan each tool call out into one job per requested company."""
+        jobs = []
+        for ent, name, arguments in super()._tool_jobs(rl_message):
+            companies = arguments.pop("companies", None) or list(self.companies)
+            for company in companies:
+                if company in self.companies:
+                    jobs.append((self.companies[company], name, dict(arguments)))
+        return jobs
+
+    def _run_tool_call(self, ent, name, arguments) -> str:
+        return f"# COMPANY : {ent.display_name}\n" + super()._run_tool_call(ent, name, arguments)
+
+    def _merge_context(self, blocks: list) -> str:
+        """Merge the per-company context blocks under the shared token budget."""
+        budgets = _fair_shares([estimate_tokens(block) for block in blocks], self.context_token_budget)
+        return "\n".join(truncate_to_tokens(block, budget) for block, budget in zip(blocks, budgets))
@@ -0,0 +1,71 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv("./.env")
+
+# User agent sent to SEC EDGAR (read by edgartools; same as edgar.set_identity).
+os.environ.setdefault("EDGAR_IDENTITY", "Roshun Sunder roshun.sunder@gmail.com")
+
+# Root directory for on-disk caches. Defaults to .cache/ci_agent in the project root,
+# whatever the working directory, so the server and ci_agent.reingest share it and the
+# docker-compose bind mount keeps it across container restarts.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.abspath(
+    os.environ.get("CI_AGENT_CACHE_DIR", os.path.join(PROJECT_ROOT, ".cache", "ci_agent"))
+)
+
+# Size cap of the local filing item cache in front of public_companies_table, and how
+# long a cached item is served before it is re-read. Writes only refresh the writing
+# host's cache, so this bounds how stale re-summarized items can be elsewhere.
+FILING_CACHE_MAX_BYTES = int(os.environ.get("FILING_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+FILING_CACHE_TTL_SECONDS = float(os.environ.get("FILING_CACHE_TTL_SECONDS", 15 * 60))
+
+# Size cap of the on-disk cache of raw filing text fetched from EDGAR (see services/raw_filings.py).
+RAW_FILING_CACHE_MAX_BYTES = int(os.environ.get("RAW_FILING_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Size cap of the on-disk cache of competitor pages scraped through Firecrawl (see utils/web.py).
+SCRAPE_CACHE_MAX_BYTES = int(os.environ.get("SCRAPE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# XBRL financial statement extraction: worker processes and size cap of the on-disk cache
+# of extracted statements (keyed by accession number, see services/xbrl.py).
+XBRL_WORKERS = int(os.environ.get("XBRL_WORKERS", 2))
+FINANCIALS_CACHE_MAX_BYTES = int(os.environ.get("FINANCIALS_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Provider rate limits shared by all LLM calls of this process (see services/llm_scheduler.py).
+# Set them to the account's limits divided by the number of worker processes.
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", 500))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("LLM_TOKENS_PER_MINUTE", 200000))
+
+# Production server (python -m ci_agent.server).
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 8080))
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+# Admission control for chat websockets: concurrent sessions in total and per user, and
+# turns answered at once (shared fairly between users). The settings are for the whole
+# server; each of the WEB_CONCURRENCY worker processes enforces its share in memory. A
+# share is never below one, so with more workers than a limit allows (e.g. 3 sessions
+# per user on 4 workers) the effective limit is one per worker.
+MAX_CHAT_SESSIONS = max(1, int(os.environ.get("MAX_CHAT_SESSIONS", 64)) // WEB_CONCURRENCY)
+MAX_CHAT_SESSIONS_PER_USER = max(1, int(os.environ.get("MAX_CHAT_SESSIONS_PER_USER", 3)) // WEB_CONCURRENCY)
+MAX_CONCURRENT_TURNS = max(1, int(os.environ.get("MAX_CONCURRENT_TURNS", 16)) // WEB_CONCURRENCY)
+# On SIGTERM, in-flight turns get this long to finish before connections are closed.
+DRAIN_TIMEOUT_SECONDS = float(os.environ.get("DRAIN_TIMEOUT_SECONDS", 30))
+# Cold start budget, from launching the server to its first /health response.
+STARTUP_TARGET_SECONDS = float(os.environ.get("STARTUP_TARGET_SECONDS", 2.0))
+
+# Token budgets per UTC day (prompt plus completion tokens; 0 disables a budget). Past
+# BUDGET_DOWNGRADE_RATIO of a budget, requests go to the cheapest model of their stage;
+# past the budget they are refused. Usage is counted in shared per-day counters in the
+# token_usage table, so the budgets hold across worker processes and restarts.
+USER_DAILY_TOKEN_BUDGET = int(os.environ.get("USER_DAILY_TOKEN_BUDGET", 2000000))
+AGENT_DAILY_TOKEN_BUDGET = int(os.environ.get("AGENT_DAILY_TOKEN_BUDGET", 500000))
+BUDGET_DOWNGRADE_RATIO = float(os.environ.get("BUDGET_DOWNGRADE_RATIO", 0.8))
+
+# Token ledger entries are written to DynamoDB in batches of up to this many, at least
+# this often (see services/ledger.py).
+LEDGER_BATCH_SIZE = int(os.environ.get("LEDGER_BATCH_SIZE", 25))
+LEDGER_FLUSH_SECONDS = float(os.environ.get("LEDGER_FLUSH_SECONDS", 5.0))
+# Seconds a process trusts its copy of a daily usage counter before re-reading it, which
+# is how usage by other worker processes shows up in its budget checks.
+LEDGER_REFRESH_SECONDS = float(os.environ.get("LEDGER_REFRESH_SECONDS", 30.0))
@@ -1,21 +1,53 @@
 from dotenv import load_dotenv
+import asyncio
+import json
 import os
-import boto3
+import threading
 import warnings
+from ci_agent.config import MAX_CHAT_SESSIONS, MAX_CHAT_SESSIONS_PER_USER, MAX_CONCURRENT_TURNS
+from ci_agent.utils.admission import FairSemaphore
+from ci_agent.utils.streaming import StreamConfig
 
-# Create a DynamoDB client
 load_dotenv("./.env")
 
-dynamodb = boto3.resource(
-    'dynamodb',
-    aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.environ.get('REGION_NAME')
-)
+_dynamodb = None
+_dynamodb_lock = threading.Lock()
 
-public_companies_table = dynamodb.Table('public_companies')
-users_table = dynamodb.Table('users')
-agents_table = dynamodb.Table('agents')
+def get_dynamodb():
+    """
+    The DynamoDB resource, created on first use. Importing boto3 and loading its service
+    model takes a good part of a second, which should not delay server startup.
+    """
+    global _dynamodb
+    if _dynamodb is None:
+        with _dynamodb_lock:
+            if _dynamodb is None:
+                import boto3
+                _dynamodb = boto3.resource(
+                    'dynamodb',
+                    aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+                    aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+                    region_name=os.environ.get('REGION_NAME')
+                )
+    return _dynamodb
+
+class LazyTable:
+    """
+    Stand-in for a DynamoDB Table that creates it on first attribute access.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._table = None
+
+    def __getattr__(self, attr):
+        if self._table is None:
+            self._table = get_dynamodb().Table(self.name)
+        return getattr(self._table, attr)
+
+public_companies_table = LazyTable('public_companies')
+users_table = LazyTable('users')
+agents_table = LazyTable('agents')
+token_usage_table = LazyTable('token_usage')
 
 class Session:
     """
@@ -25,6 +57,9 @@ class Session:
         self.websocket = ws
         self.agent = None
         self.streaming = True
+        self.stream_config = StreamConfig()
+        # False while the current turn waits for a turn slot.
+        self.turn_started = False
     
     def set_agent(self, agent):
         self.agent = agent
@@ -38,6 +73,14 @@ class ChatSessionManager:
     """
     def __init__(self):
         self.active_chats : dict[tuple[str, str], Session] = dict()
+        # Connections wait here for a session slot before an agent is built for them.
+        self.session_slots = FairSemaphore("chat_sessions", MAX_CHAT_SESSIONS, MAX_CHAT_SESSIONS_PER_USER)
+        # Turns wait here, shared fairly between users, before they are answered.
+        self.turn_slots = FairSemaphore("chat_turns", MAX_CONCURRENT_TURNS)
+        # Set on shutdown: no new turns or ingests are started.
+        self.draining = False
+        # Ingests (filling missing filings) running on worker threads.
+        self.ingests = set()
     
     def register_session(self, user_id, agent_id, ws):
         key = (user_id, agent_id)
@@ -69,6 +112,53 @@ class ChatSessionManager:
             return
         del self.active_chats[key]
 
+    async def run_ingest(self, func, *args):
+        """
+        Runs a blocking ingest on a worker thread, tracked so that drain() waits for it.
+
+        The ingest is shielded: if the caller goes away, the thread carries on writing
+        and shutdown still waits for it.
+        """
+        task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        self.ingests.add(task)
+        task.add_done_callback(self.ingests.discard)
+        return await asyncio.shield(task)
+
+    async def drain(self, timeout, should_stop=None):
+        """
+        Stops new turns and ingests, waits up to timeout seconds for in-flight ones to
+        finish, then flushes session state and the token ledger.
+        """
+        self.draining = True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self.turn_slots.active or self.ingests) and loop.time() < deadline:
+            if should_stop is not None and should_stop():
+                break
+            await asyncio.sleep(0.1)
+        if self.turn_slots.active or self.ingests:
+            print(f"Drain deadline reached with {self.turn_slots.active} turn(s) and "
+                  f"{len(self.ingests)} ingest(s) in flight")
+        await asyncio.to_thread(self.flush_sessions)
+        # Imported here: the ledger module imports this one.
+        from ci_agent.services.ledger import token_ledger
+        await asyncio.to_thread(token_ledger.flush)
+
+    def flush_sessions(self):
+        """Persists the message history of every active session to agents_table."""
+        for (user_id, agent_id), session in list(self.active_chats.items()):
+            if session.agent is None:
+                continue
+            try:
+                agents_table.update_item(
+                    Key={'id': agent_id, 'user_id': user_id},
+                    UpdateExpression="SET messages = :messages",
+                    ExpressionAttributeValues={":messages": json.dumps(session.agent.messages)}
+                )
+            except Exception as e:
+                print(f"Could not flush session ({user_id}, {agent_id}): {e}")
+        print(f"Flushed {len(self.active_chats)} session(s)")
+
 chat_session_manager = ChatSessionManager()
 def gen_deps():
     return chat_session_manager
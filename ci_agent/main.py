@@ -1,11 +1,17 @@
+import os
 import nest_asyncio
 from dotenv import load_dotenv
 from fastapi import Depends, FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from ci_agent.routers import agentconfig, auth, chat, search
+from fastapi.responses import PlainTextResponse
+from ci_agent.routers import agentconfig, auth, chat, export, search
 from ci_agent.dependencies import gen_deps
+from ci_agent.utils.metrics import metrics
 load_dotenv("./.env")
-nest_asyncio.apply()
+# Blocking edgar calls run in worker threads, so production does not need a patched event
+# loop (nest_asyncio cannot patch uvloop anyway). Kept for the development server.
+if os.environ.get("ENV") != "production":
+    nest_asyncio.apply()
 
 app = FastAPI(title="Competitive Intelligence Agent API", version="0.1.0")
 
@@ -28,6 +34,7 @@ app.include_router(search.router, dependencies=[Depends(gen_deps)])
 app.include_router(chat.router)
 app.include_router(agentconfig.router)
 app.include_router(auth.router)
+app.include_router(export.router)
 
 @app.get("/")
 def root():
@@ -40,7 +47,12 @@ async def health():
         "message": "Running Successfully!"
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return metrics.render()
+
 if __name__ == "__main__":
+    # Development server; use `python -m ci_agent.server` in production.
     import uvicorn
     print("Starting Agent API")
     uvicorn.run("ci_agent.main:app", host="0.0.0.0", port=8080, reload=True)
\ No newline at end of file
@@ -0,0 +1,57 @@
+import argparse
+from ci_agent.agent import Agent
+from ci_agent.services.raw_filings import LazyReport
+from ci_agent.utils.constants import DATA_SOURCES
+
+
+def reingest(cik, forms=DATA_SOURCES, start_date=None, end_date=None, force=False):
+    """
+    Brings the stored summaries of a company's filings up to date.
+
+    Only sections whose prompt version, model or source text changed are regenerated
+    (and financials whose storage format changed), each filing with one partial
+    UpdateItem. Filings that are not stored yet are ingested in full.
+
+    Args:
+        cik (str): Company CIK (or ticker).
+        forms (list): Filing types to re-ingest.
+        start_date (str, optional): Earliest filing date (YYYY-MM-DD).
+        end_date (str, optional): Latest filing date (YYYY-MM-DD).
+        force (bool): Regenerate every summary, even up to date ones.
+
+    Returns:
+        int: Number of filings processed.
+    """
+    from edgar import find
+    ent = find(cik)
+    agent = Agent(ent, start_date, forms, speculative=False)
+    processed = 0
+    for form in forms:
+        filings = ent.get_filings(form=form)
+        if start_date or end_date:
+            filings = filings.filter(date=f"{start_date or ''}:{end_date or ''}")
+        for filing in filings:
+            print(f"Re-ingesting {form} filed {filing.filing_date}")
+            agent._handler_dispatcher(source_type=form, params={
+                "ent": ent,
+                # Up to date filings are served from the raw filing cache without a download.
+                "filing": LazyReport(filing),
+                "summary_generation_function": agent.generate_summary,
+                "source_type": form,
+                "rewrite_summaries": True,
+                "force": force
+            })
+            processed += 1
+    print(f"Re-ingested {processed} filing(s) for {ent.display_name}")
+    return processed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate out of date filing summaries of a company.")
+    parser.add_argument("cik", help="Company CIK or ticker.")
+    parser.add_argument("--forms", default=",".join(DATA_SOURCES), help="Comma separated filing types.")
+    parser.add_argument("--start-date", help="Earliest filing date (YYYY-MM-DD).")
+    parser.add_argument("--end-date", help="Latest filing date (YYYY-MM-DD).")
+    parser.add_argument("--force", action="store_true", help="Regenerate every summary, even up to date ones.")
+    args = parser.parse_args()
+    reingest(args.cik, [form.strip() for form in args.forms.split(",")], args.start_date, args.end_date, args.force)
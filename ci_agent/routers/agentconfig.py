@@ -4,21 +4,22 @@ from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 from typing import List
 from fastapi import APIRouter, HTTPException, Query
-from edgar import *
 from ci_agent.models.server_models import AvailableInfo
 from ci_agent.utils.constants import DATA_SOURCES
 from ci_agent.agent import Agent
+from ci_agent.comparative_agent import ComparativeAgent
 from ci_agent.dependencies import agents_table
 
 # REVISE AFTER THIS
 router = APIRouter()
 
 @router.get("/selectcompany", response_model=AvailableInfo)
-async def get_config(unique_id: str = Query(None)):
+def get_config(unique_id: str = Query(None)):
     """
     Take unique_id for company, return object encoding
     available information
     """
+    from edgar import find
     # Right now just SEC companies
     ent = find(unique_id)
     if not ent:
@@ -45,20 +46,31 @@ async def get_config(unique_id: str = Query(None)):
     return AvailableInfo(info_dict=response_dict)
 
 @router.post("/buildagent")
-async def build_agent(unique_id:str = Query(None), user_id:str = Query(None)):
+def build_agent(unique_id:str = Query(None), user_id:str = Query(None), compare_ids:str = Query(None)):
+    """
+    Build an agent for a company. If compare_ids (comma separated unique ids) is given,
+    build a comparative agent covering unique_id and those companies.
+    """
     if not unique_id:
         raise HTTPException(status_code=400, detail="Cannot build agent without unique id.")
     if not user_id:
         raise HTTPException(status_code=400, detail="Cannot build agent without user id.")
     
+    from edgar import find
     # Hardcode to look one year back
     start_date = date.today() - relativedelta(years=1)
     ent = find(unique_id)
+    ent_ids = [unique_id] + [ent_id.strip() for ent_id in compare_ids.split(",")] if compare_ids else []
     # Hardcode all data sources
-    agent = Agent(ent, start_date, DATA_SOURCES)
+    if ent_ids:
+        agent = ComparativeAgent([find(ent_id) for ent_id in ent_ids], start_date, DATA_SOURCES)
+    else:
+        agent = Agent(ent, start_date, DATA_SOURCES)
+    # The id is generated first so that ingest tokens also count against the agent's budget.
+    agent_id = "a-" + str(uuid.uuid4())
+    agent.attribute_to(user_id, agent_id)
     agent.init_data()
     # Write to db
-    agent_id = "a-" + str(uuid.uuid4())
     item = {
         "id" : agent_id,
         "time_created" : str(datetime.now()),
@@ -67,6 +79,8 @@ async def build_agent(unique_id:str = Query(None), user_id:str = Query(None)):
         "ent_id" : unique_id,
         "user_id" : user_id
     }
+    if ent_ids:
+        item["ent_ids"] = ent_ids
 
     agents_table.put_item(Item=item)
 
@@ -3,13 +3,13 @@ import uuid
 from ci_agent.models.server_models import LoginRequest
 from ci_agent.utils.constants import DATA_SOURCES
 from ci_agent.dependencies import users_table
-from boto3.dynamodb.conditions import Key
 
 # REVISE AFTER THIS
 router = APIRouter()
 
 @router.post("/login")
 async def get_config_endpoint(request: LoginRequest):
+    from boto3.dynamodb.conditions import Key
     # Step 1: Check if user exists in DynamoDB
     response = users_table.query(
         IndexName="email-index",
@@ -1,21 +1,157 @@
+import asyncio
 import json
+import threading
+from collections import deque
 from ci_agent.agent import Agent
+from ci_agent.comparative_agent import ComparativeAgent
 from ci_agent.dependencies import agents_table
 from ci_agent.utils.constants import DATA_SOURCES
 from ci_agent.dependencies import gen_deps
-from edgar import find
-from edgar.entities import CompanySearchResults
+from ci_agent.services.ledger import BudgetExceeded
+from ci_agent.utils.streaming import StreamCoalescer, StreamConfig
 from fastapi import APIRouter, Depends, Query, WebSocket, WebSocketDisconnect, status
 from botocore.exceptions import ClientError
 router = APIRouter()
 
+
+def _parse_user_event(data):
+    """Returns the parsed message if data is a USER_EVENT control message, else None."""
+    if not data.startswith("{"):
+        return None
+    try:
+        message = json.loads(data)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(message, dict) and message.get("MESSAGE_TYPE") == "USER_EVENT":
+        return message
+    return None
+
+
+async def _send_queue_position(websocket, scope, position):
+    await websocket.send_json({
+        "MESSAGE_TYPE": "AGENT_STATUS",
+        "MESSAGE_SUBTYPE": "QUEUED",
+        "PAYLOAD": {"scope": scope, "position": position}
+    })
+
+
+class _Inbox:
+    """Reads client messages, first replaying those that arrived while the client was queued."""
+    def __init__(self, websocket, pending=()):
+        self.websocket = websocket
+        self.pending = deque(pending)
+
+    async def receive_text(self):
+        if self.pending:
+            return self.pending.popleft()
+        return await self.websocket.receive_text()
+
+    async def receive_json(self):
+        return json.loads(await self.receive_text())
+
+
+async def _admit(websocket, chat_session_manager, user_id):
+    """
+    Waits for a session slot, keeping the client informed of its queue position.
+
+    Returns:
+        _Inbox | None: The client's messages (including any sent while queued) once
+                       admitted, or None if the client disconnected while queued.
+    """
+    admission = asyncio.create_task(chat_session_manager.session_slots.acquire(
+        user_id, lambda position: _send_queue_position(websocket, "session", position)
+    ))
+    pending = []
+    while not admission.done():
+        # Watch the socket so that a client leaving the queue frees its place.
+        receive = asyncio.create_task(websocket.receive())
+        await asyncio.wait({admission, receive}, return_when=asyncio.FIRST_COMPLETED)
+        if not receive.done():
+            receive.cancel()
+            await asyncio.gather(receive, return_exceptions=True)
+            continue
+        message = receive.result()
+        if message["type"] == "websocket.disconnect":
+            admission.cancel()
+            await asyncio.gather(admission, return_exceptions=True)
+            # The slot may have been granted in the same round, which cancel() cannot undo.
+            if not admission.cancelled() and admission.exception() is None:
+                chat_session_manager.session_slots.release(user_id)
+            return None
+        if message.get("text") is not None:
+            # Kept for after admission, in the order the client sent them.
+            pending.append(message["text"])
+    await admission
+    return _Inbox(websocket, pending)
+
+
+async def _run_turn(websocket, chat_session_manager, user_id, user_session, message, stream):
+    """Answers one user message over the websocket, once a turn slot is free."""
+    user_session.turn_started = False
+    async with chat_session_manager.turn_slots.slot(
+        user_id, lambda position: _send_queue_position(websocket, "turn", position)
+    ):
+        user_session.turn_started = True
+        # Planning and retrieval block, so run the turn off the event loop.
+        try:
+            response = await asyncio.to_thread(user_session.agent.chat, message=message, streaming=stream)
+        except BudgetExceeded as e:
+            await websocket.send_json({
+                "MESSAGE_TYPE": "AGENT_STATUS",
+                "MESSAGE_SUBTYPE": "BUDGET_EXCEEDED",
+                "PAYLOAD": str(e)
+            })
+            return
+        if stream:
+            # Coalesce token deltas into fewer, larger frames.
+            await StreamCoalescer(websocket, user_session.stream_config).stream(response)
+        else:
+            await websocket.send_text(response)
+
+
+async def _cancel_turn(websocket, user_session, turn_task):
+    """Cancels the in-flight turn (if any), waits for it to wind down and reports the savings."""
+    if turn_task is None:
+        return
+    if turn_task.done():
+        # Surface errors from a turn that already finished.
+        await turn_task
+        return
+    agent = user_session.agent
+    if not user_session.turn_started:
+        # Still queued for a turn slot: nothing was sent to the model yet.
+        turn_task.cancel()
+        await asyncio.gather(turn_task, return_exceptions=True)
+        report = {}
+    else:
+        agent.cancel()
+        await turn_task
+        report = agent.cancellation_report or {}
+    await websocket.send_json({
+        "MESSAGE_TYPE": "AGENT_STATUS",
+        "MESSAGE_SUBTYPE": "CANCELLED",
+        "PAYLOAD": report
+    })
+
+async def _warm_up(agent, stop_event):
+    """Prefetches the agent's latest filings in the background; failures only cost the warm-up."""
+    try:
+        await asyncio.to_thread(agent.warm_up, stop_event)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+
 @router.websocket("/ask/{agent_id}")
 async def websocket_endpoint(
         websocket: WebSocket,
         agent_id: str,
         user_id: str,
+        flush_bytes: int = 64,
+        flush_ms: int = 30,
         chat_session_manager = Depends(gen_deps)
     ):
+    from edgar import find
     stream = True # Harcode all clients to use streaming
 
     # Attempt to retrieve agent information
@@ -25,7 +161,10 @@ async def websocket_endpoint(
             'user_id': user_id
         })
         agent_info = response.get('Item')
-        ent = find(agent_info['ent_id'])
+        # edgar blocks (and runs its own event loop), so keep it off this one.
+        ent = await asyncio.to_thread(find, agent_info['ent_id'])
+        # Comparative agents cover several companies.
+        compare_ents = [await asyncio.to_thread(find, ent_id) for ent_id in agent_info.get('ent_ids', [])]
         start_date = agent_info['start_date']
         data_sources = agent_info['data_sources']
         if not agent_info:
@@ -35,6 +174,13 @@ async def websocket_endpoint(
         print(f"Error getting item: {e.response['Error']['Message']}")
         return None
     
+    # Admission control: the agent is only built once a session slot is free.
+    await websocket.accept()
+    inbox = await _admit(websocket, chat_session_manager, user_id)
+    if inbox is None:
+        print(f"User {user_id} left the session queue")
+        return None
+
     try:
         # Only store connection if authentication successful
         chat_session_manager.register_session(
@@ -43,19 +189,29 @@ async def websocket_endpoint(
             websocket
         )
 
+        if len(compare_ents) > 1:
+            agent = await asyncio.to_thread(ComparativeAgent, compare_ents, start_date, data_sources)
+        else:
+            agent = await asyncio.to_thread(Agent, ent, start_date, data_sources)
+        # Token usage (including filling missing data) counts against this user and agent.
+        agent.attribute_to(user_id, agent_id)
         chat_session_manager.assign_agent(
             user_id,
             agent_id,
-            Agent(ent, start_date, data_sources)
+            agent
         )
         
+        warm_up_stop = warm_up_task = None
         try:
-            await websocket.accept()
             user_session = chat_session_manager.get_session(user_id, agent_id)
+            user_session.stream_config = StreamConfig(flush_bytes=flush_bytes, flush_ms=flush_ms)
             agent = user_session.agent
 
+            # Warm the session's filing cache while the user reads and types.
+            warm_up_stop = threading.Event()
+            warm_up_task = asyncio.create_task(_warm_up(agent, warm_up_stop))
             # Check for missing data
-            missing_data = agent.check_for_missing_data()
+            missing_data = await asyncio.to_thread(agent.check_for_missing_data)
             if missing_data:
                 payload = [
                     {
@@ -70,14 +226,28 @@ async def websocket_endpoint(
                     "PAYLOAD": payload
                 })
                 
-                fill_decision = await websocket.receive_json()
+                fill_decision = await inbox.receive_json()
                 if fill_decision["MESSAGE_TYPE"] != "USER_EVENT":
                     # Log error
                     print(f"Malformed user message received from user {user_id}")
                     return
+                elif fill_decision["MESSAGE_SUBTYPE"] == "FILL_DATA" and chat_session_manager.draining:
+                    await websocket.send_json({
+                        "MESSAGE_TYPE": "AGENT_STATUS",
+                        "MESSAGE_SUBTYPE": "DRAINING",
+                        "PAYLOAD": "The server is restarting, please reconnect shortly."
+                    })
                 elif fill_decision["MESSAGE_SUBTYPE"] == "FILL_DATA":
                     print(f"Filling missing data for agent {agent_id}")
-                    agent.fill_missing_data(missing_data)
+                    try:
+                        await chat_session_manager.run_ingest(agent.fill_missing_data, missing_data)
+                    except BudgetExceeded as e:
+                        # Whatever was ingested before the budget ran out is kept.
+                        await websocket.send_json({
+                            "MESSAGE_TYPE": "AGENT_STATUS",
+                            "MESSAGE_SUBTYPE": "BUDGET_EXCEEDED",
+                            "PAYLOAD": str(e)
+                        })
                 elif fill_decision["MESSAGE_SUBTYPE"] != "SKIP_FILL_DATA":
                     print(f"Unrecognized message subtype from user {user_id}")
                     
@@ -87,24 +257,57 @@ async def websocket_endpoint(
                 "MESSAGE_SUBTYPE": "READY",
                 "PAYLOAD": "" # This should be the agent message history
             })   
-            for _ in range(user_session.agent.MAX_CHAT_TURNS):
-                # Handle incoming messages
-                data = await websocket.receive_text()
-                # Process messages...
-                if stream:
-                    stream = user_session.agent.chat(message=data, streaming=stream)
-                    for chunk in stream:
-                        if chunk:
-                            await websocket.send_text(chunk)
-                else:
-                    response = user_session.agent.chat(message=data, streaming=stream)
-                    await websocket.send_text(response)
+            turn_task = None
+            turns = 0
+            try:
+                while turns < user_session.agent.MAX_CHAT_TURNS:
+                    # Handle incoming messages; turns run as tasks so that we keep
+                    # listening for cancellation while an answer streams.
+                    data = await inbox.receive_text()
+                    event = _parse_user_event(data)
+                    if event is not None:
+                        if event.get("MESSAGE_SUBTYPE") == "CANCEL":
+                            await _cancel_turn(websocket, user_session, turn_task)
+                        else:
+                            print(f"Unrecognized message subtype from user {user_id}")
+                        continue
+
+                    if chat_session_manager.draining:
+                        # Shutting down: finish what is in flight but start nothing new.
+                        await websocket.send_json({
+                            "MESSAGE_TYPE": "AGENT_STATUS",
+                            "MESSAGE_SUBTYPE": "DRAINING",
+                            "PAYLOAD": "The server is restarting, please reconnect shortly."
+                        })
+                        continue
+
+                    # A new question supersedes the answer still in flight.
+                    await _cancel_turn(websocket, user_session, turn_task)
+                    # Reset before scheduling so that an early CANCEL is not lost.
+                    user_session.agent.begin_turn()
+                    turn_task = asyncio.create_task(
+                        _run_turn(websocket, chat_session_manager, user_id, user_session, data, stream)
+                    )
+                    turns += 1
+                if turn_task:
+                    await turn_task
+            finally:
+                if turn_task and not turn_task.done():
+                    # Disconnected mid-turn: stop the turn and wait for its thread to wind down.
+                    agent.cancel()
+                    if not user_session.turn_started:
+                        turn_task.cancel()
+                    await asyncio.gather(turn_task, return_exceptions=True)
         except WebSocketDisconnect:
             # Clean up connection
             chat_session_manager.deregister_session(
                 user_id,
                 agent_id
             )
+        finally:
+            if warm_up_task is not None and not warm_up_task.done():
+                warm_up_stop.set()
+                warm_up_task.cancel()
                 
     except Exception as e:
         # Handle any other errors
@@ -113,4 +316,6 @@ async def websocket_endpoint(
                 agent_id
             )
         await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
-        raise e
\ No newline at end of file
+        raise e
+    finally:
+        chat_session_manager.session_slots.release(user_id)
\ No newline at end of file
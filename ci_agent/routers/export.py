@@ -0,0 +1,120 @@
+import base64
+import binascii
+import json
+from datetime import date
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from ci_agent.services.filing_store import filing_store
+from ci_agent.utils.codec import decode_section, decode_text
+from ci_agent.utils.constants import DATA_SOURCES
+from ci_agent.utils.financials import load_statement
+router = APIRouter()
+
+EXPORT_FIELDS = ["summary", "sections", "financials"]
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(item):
+    """Cursor resuming an export right after item (the index key of the filing)."""
+    key = {name: item[name] for name in ("cik", "filing_date", "cik_filing_date")}
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, cik):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Malformed cursor.")
+    if not isinstance(key, dict) or set(key) != {"cik", "filing_date", "cik_filing_date"} or key["cik"] != cik:
+        raise HTTPException(status_code=400, detail="Cursor does not belong to this export.")
+    return key
+
+
+def export_record(item, fields):
+    """
+    Decodes a stored filing item into a plain JSON record.
+
+    Args:
+        item (dict): A public_companies_table item.
+        fields (set): Which of EXPORT_FIELDS to include.
+
+    Returns:
+        dict: Filing metadata plus the 8-K summary, section summaries and financial
+              statements (columnar, or markdown for legacy items), as requested.
+    """
+    record = {
+        "cik": item["cik"],
+        "filing_type": item["filing_type"],
+        "filing_date": item["filing_date"],
+        "cik_filing_date": item["cik_filing_date"],
+    }
+    if "summary" in fields and "summary" in item:
+        record["summary"] = decode_text(item["summary"])
+    summaries = item.get("summaries", {})
+    if "sections" in fields and summaries:
+        record["sections"] = {key: decode_section(summaries, key) for key in summaries if key != "financials"}
+    if "financials" in fields and summaries.get("financials"):
+        record["financials"] = {}
+        for statement_type, blob in summaries["financials"].items():
+            text = decode_text(blob)
+            record["financials"][statement_type] = load_statement(text) or text
+    return record
+
+
+def _split(value):
+    return [part.strip() for part in value.split(",") if part.strip()] if value else []
+
+
+def _check_date(value, name):
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be a YYYY-MM-DD date.")
+
+
+@router.get("/export/{cik}")
+def export_corpus(
+        cik: str,
+        forms: str = Query(None),
+        start_date: str = Query(None),
+        end_date: str = Query(None),
+        fields: str = Query(None),
+        cursor: str = Query(None),
+        page_size: int = Query(25)
+    ):
+    """
+    Streams a company's stored filings as NDJSON, oldest first.
+
+    forms and fields are comma separated (defaults: all of DATA_SOURCES and EXPORT_FIELDS).
+    One page of filings is held in memory at a time. Every filing line carries a cursor;
+    pass the last one received to resume an interrupted export. A final
+    {"type": "end"} line marks a complete export.
+    """
+    form_list = _split(forms) or DATA_SOURCES
+    if any(form not in DATA_SOURCES for form in form_list):
+        raise HTTPException(status_code=400, detail=f"forms must be among {', '.join(DATA_SOURCES)}.")
+    field_set = set(_split(fields) or EXPORT_FIELDS)
+    if not field_set <= set(EXPORT_FIELDS):
+        raise HTTPException(status_code=400, detail=f"fields must be among {', '.join(EXPORT_FIELDS)}.")
+    start_date = _check_date(start_date, "start_date")
+    end_date = _check_date(end_date, "end_date")
+    start_key = decode_cursor(cursor, cik) if cursor else None
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+    def generate():
+        exported = 0
+        pages = filing_store.iter_filing_pages(cik, form_list, start_date, end_date, start_key, page_size)
+        for stubs in pages:
+            if not stubs:
+                continue
+            items = filing_store.batch_get_items([stub["cik_filing_date"] for stub in stubs])
+            for item in items:
+                line = {"type": "filing", "cursor": encode_cursor(item), "filing": export_record(item, field_set)}
+                yield json.dumps(line, default=str) + "\n"
+                exported += 1
+        yield json.dumps({"type": "end", "exported": exported}) + "\n"
+
+    # A sync generator: Starlette iterates it in a worker thread, off the event loop.
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
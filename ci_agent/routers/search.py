@@ -1,20 +1,17 @@
 from typing import List
 from fastapi import APIRouter, HTTPException, Query
-from edgar import *
 from ci_agent.models.server_models import SearchResult
 
-# CORE LOGIC
-set_identity("Roshun Sunder roshun.sunder@gmail.com")
-
 # REVISE AFTER THIS
 router = APIRouter()
 
 @router.get("/search", response_model=List[SearchResult])
-async def search_endpoint(query: str = Query(None)):
+def search_endpoint(query: str = Query(None)):
     """
     Search for companies in the SEC EDGAR database.
     Returns a list of matching companies with their basic information.
     """
+    from edgar import find
     try:
         search_results = find(query)
         if len(search_results.results) == 1:
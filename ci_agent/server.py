@@ -0,0 +1,55 @@
+import importlib.util
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+from ci_agent.config import DRAIN_TIMEOUT_SECONDS, HOST, PORT, WEB_CONCURRENCY
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    uvicorn server that drains chat sessions before shutting down.
+
+    On SIGTERM it stops accepting connections, lets in-flight turns finish (up to
+    DRAIN_TIMEOUT_SECONDS) and flushes session state, and only then lets uvicorn close
+    the remaining connections.
+    """
+    async def shutdown(self, sockets=None):
+        # Imported here so that the supervisor process never loads the app.
+        from ci_agent.dependencies import chat_session_manager
+
+        for server in self.servers:
+            server.close()
+        await chat_session_manager.drain(DRAIN_TIMEOUT_SECONDS, should_stop=lambda: self.force_exit)
+        await super().shutdown(sockets)
+
+
+def build_config():
+    # uvloop and httptools when available (not on Windows), the pure Python versions otherwise.
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    print(f"Serving with {WEB_CONCURRENCY} worker(s), loop={loop}, http={http}")
+    return uvicorn.Config(
+        "ci_agent.main:app",
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        loop=loop,
+        http=http,
+        ws="websockets",
+        proxy_headers=True,
+        timeout_graceful_shutdown=5,
+    )
+
+
+def main():
+    config = build_config()
+    server = DrainingServer(config=config)
+    if config.workers > 1:
+        # Same as uvicorn.run, with our server class in every worker.
+        sock = config.bind_socket()
+        Multiprocess(config, target=server.run, sockets=[sock]).run()
+    else:
+        server.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+from ci_agent.config import CACHE_DIR, FILING_CACHE_MAX_BYTES, FILING_CACHE_TTL_SECONDS
+from ci_agent.dependencies import get_dynamodb, public_companies_table
+from ci_agent.utils.diskcache import DiskCache
+
+# Attributes returned when listing filings; summaries are only fetched for selected items.
+LISTING_PROJECTION = "cik_filing_date, filing_date, filing_type"
+
+
+class FilingStore:
+    """
+    Read-through access to public_companies_table with a persistent local cache tier.
+
+    Listings always go to DynamoDB (new filings can appear at any time), but the large
+    filing items themselves are served from an on-disk cache keyed by cik_filing_date,
+    so they survive restarts and are shared by all workers on the host. Writes refresh
+    the cache of the writing host only; cached items expire after the cache's ttl, so
+    items rewritten elsewhere (another host, a re-ingest) are picked up within it.
+    """
+    def __init__(self, table, cache):
+        self.table = table
+        self.cache = cache
+
+    def list_filings(self, cik, filing_type):
+        """
+        Lists the stored filings of a type for a company.
+
+        Args:
+            cik (str): Company CIK.
+            filing_type (str): '10-K', '10-Q' or '8-K'.
+
+        Returns:
+            list: Key stubs ({'cik_filing_date', 'filing_date', 'filing_type'}) sorted by
+                  filing_date, most recent first.
+        """
+        from boto3.dynamodb.conditions import Key, Attr
+        query_kwargs = {
+            "IndexName": 'cik-filing_date-index',
+            "KeyConditionExpression": Key('cik').eq(str(cik)),
+            "FilterExpression": Attr('filing_type').eq(filing_type),
+            "ProjectionExpression": LISTING_PROJECTION,
+        }
+        stubs = []
+        while True:
+            response = self.table.query(**query_kwargs)
+            stubs.extend(response.get('Items', []))
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            query_kwargs["ExclusiveStartKey"] = last_key
+
+        # Dates are stored as "YYYY-MM-DD", so they sort lexicographically.
+        stubs.sort(key=lambda stub: stub['filing_date'], reverse=True)
+        return stubs
+
+    def get_item(self, key):
+        """Returns the full item for a cik_filing_date key, or None if it does not exist."""
+        item = self.cache.get(key)
+        if item is not None:
+            return item
+        item = self.table.get_item(Key={'cik_filing_date': key}).get('Item')
+        if item is not None:
+            self.cache.set(key, item)
+        return item
+
+    def iter_filing_pages(self, cik, forms=None, start_date=None, end_date=None, start_key=None, page_size=25):
+        """
+        Pages through a company's filings in filing_date order (oldest first).
+
+        Args:
+            cik (str): Company CIK.
+            forms (list, optional): Filing types to keep, e.g. ['10-K', '8-K'].
+            start_date (str, optional): Earliest filing_date (YYYY-MM-DD), inclusive.
+            end_date (str, optional): Latest filing_date (YYYY-MM-DD), inclusive.
+            start_key (dict, optional): Index key of the filing to resume after.
+            page_size (int): Index entries read per request.
+
+        Yields:
+            list: Key stubs ({'cik_filing_date', 'cik', 'filing_date', 'filing_type'}), one
+                  list per request (filtered pages can be short or empty).
+        """
+        from boto3.dynamodb.conditions import Key, Attr
+        key_condition = Key('cik').eq(str(cik))
+        if start_date and end_date:
+            key_condition &= Key('filing_date').between(start_date, end_date)
+        elif start_date:
+            key_condition &= Key('filing_date').gte(start_date)
+        elif end_date:
+            key_condition &= Key('filing_date').lte(end_date)
+        query_kwargs = {
+            "IndexName": 'cik-filing_date-index',
+            "KeyConditionExpression": key_condition,
+            "ProjectionExpression": "cik_filing_date, cik, filing_date, filing_type",
+            "Limit": page_size,
+        }
+        if forms:
+            query_kwargs["FilterExpression"] = Attr('filing_type').is_in(list(forms))
+        if start_key:
+            query_kwargs["ExclusiveStartKey"] = start_key
+        while True:
+            response = self.table.query(**query_kwargs)
+            yield response.get('Items', [])
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            query_kwargs["ExclusiveStartKey"] = last_key
+
+    def batch_get_items(self, keys):
+        """
+        Returns the full items for a list of keys, in order, skipping missing ones.
+
+        Misses are fetched with BatchGetItem and, unlike get_item, not written to the
+        local cache, so bulk reads do not evict the items chat sessions are using.
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            item = self.cache.get(key)
+            if item is not None:
+                found[key] = item
+            else:
+                missing.append(key)
+
+        dynamodb = get_dynamodb()
+        # BatchGetItem takes at most 100 keys and may leave some unprocessed.
+        for start in range(0, len(missing), 100):
+            request = {self.table.name: {'Keys': [{'cik_filing_date': key} for key in missing[start:start + 100]]}}
+            attempt = 0
+            while request:
+                if attempt:
+                    time.sleep(min(0.05 * 2 ** attempt, 2.0))
+                response = dynamodb.batch_get_item(RequestItems=request)
+                for item in response.get('Responses', {}).get(self.table.name, []):
+                    found[item['cik_filing_date']] = item
+                request = response.get('UnprocessedKeys')
+                attempt += 1
+        return [found[key] for key in keys if key in found]
+
+    def get_items(self, keys):
+        """Returns the full items for a list of keys, in order, skipping missing ones."""
+        items = [self.get_item(key) for key in keys]
+        return [item for item in items if item is not None]
+
+    def put_item(self, item):
+        """Writes an item to DynamoDB and through to the local cache."""
+        self.table.put_item(Item=item)
+        self.cache.set(item['cik_filing_date'], item)
+
+    def update_item(self, key, update_expression, names, values):
+        """
+        Applies a partial update (UpdateItem) and refreshes the local cache with the result.
+
+        Args:
+            key (str): The cik_filing_date of the item.
+            update_expression (str): e.g. 'SET #summaries.#s0 = :s0'.
+            names (dict): ExpressionAttributeNames.
+            values (dict): ExpressionAttributeValues.
+
+        Returns:
+            dict: The updated item.
+        """
+        update_kwargs = {
+            "Key": {'cik_filing_date': key},
+            "UpdateExpression": update_expression,
+            "ExpressionAttributeValues": values,
+            "ReturnValues": "ALL_NEW",
+        }
+        # DynamoDB rejects an empty ExpressionAttributeNames.
+        if names:
+            update_kwargs["ExpressionAttributeNames"] = names
+        item = self.table.update_item(**update_kwargs)['Attributes']
+        self.cache.set(key, item)
+        return item
+
+    def invalidate(self, key):
+        self.cache.delete(key)
+
+
+class SessionFilingStore:
+    """
+    Session-local memory tier over a FilingStore.
+
+    Listings and items read during a chat session are kept in memory, so a warm-up
+    prefetch (see prefetch_latest) lets the first turn's retrieval skip DynamoDB and the
+    disk cache. Writes go through to the backing store and refresh the affected listing.
+    """
+    def __init__(self, backing):
+        self.backing = backing
+        self._lock = threading.Lock()
+        self._listings = {}
+        self._items = {}
+
+    def list_filings(self, cik, filing_type):
+        key = (str(cik), filing_type)
+        with self._lock:
+            if key in self._listings:
+                return self._listings[key]
+        stubs = self.backing.list_filings(cik, filing_type)
+        with self._lock:
+            self._listings[key] = stubs
+        return stubs
+
+    def get_item(self, key):
+        with self._lock:
+            if key in self._items:
+                return self._items[key]
+        item = self.backing.get_item(key)
+        if item is not None:
+            with self._lock:
+                self._items[key] = item
+        return item
+
+    def get_items(self, keys):
+        items = [self.get_item(key) for key in keys]
+        return [item for item in items if item is not None]
+
+    def put_item(self, item):
+        self.backing.put_item(item)
+        with self._lock:
+            self._items[item['cik_filing_date']] = item
+            self._listings.pop((str(item['cik']), item['filing_type']), None)
+
+    def update_item(self, key, update_expression, names, values):
+        item = self.backing.update_item(key, update_expression, names, values)
+        with self._lock:
+            self._items[key] = item
+        return item
+
+    def invalidate(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+        self.backing.invalidate(key)
+
+    def prefetch_latest(self, cik, filing_type, count=1):
+        """
+        Loads the listing and the latest count items of a form into memory.
+
+        Returns:
+            int: Number of items loaded.
+        """
+        stubs = self.list_filings(cik, filing_type)
+        return len(self.get_items([stub['cik_filing_date'] for stub in stubs[:count]]))
+
+
+filing_store = FilingStore(
+    public_companies_table,
+    DiskCache(os.path.join(CACHE_DIR, "filings.sqlite3"), FILING_CACHE_MAX_BYTES, ttl=FILING_CACHE_TTL_SECONDS),
+)
@@ -0,0 +1,239 @@
+import datetime
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+from ci_agent.config import (
+    AGENT_DAILY_TOKEN_BUDGET,
+    BUDGET_DOWNGRADE_RATIO,
+    LEDGER_BATCH_SIZE,
+    LEDGER_FLUSH_SECONDS,
+    LEDGER_REFRESH_SECONDS,
+    USER_DAILY_TOKEN_BUDGET,
+)
+from ci_agent.dependencies import token_usage_table
+from ci_agent.utils.metrics import metrics
+
+# Entries waiting to be written; past this, new entries are dropped (and counted) rather
+# than growing memory while storage is unavailable.
+MAX_PENDING_ENTRIES = 10000
+
+# Daily counters are kept this long past their day (DynamoDB TTL on expires_at, if enabled).
+COUNTER_RETENTION_DAYS = 7
+
+metrics.describe("token_ledger_dropped_total", "Token ledger entries dropped because the write queue was full.")
+metrics.describe("token_ledger_write_errors_total", "Failed token ledger batch writes.")
+metrics.describe("token_ledger_counter_errors_total", "Failed reads or updates of daily token usage counters.")
+metrics.describe("token_budget_total", "Requests downgraded or refused because of a token budget, by outcome.")
+
+
+class BudgetExceeded(Exception):
+    """Raised when a user or agent has used up its daily token budget."""
+
+
+def counter_id(scope, owner_id, day):
+    """Key of the daily usage counter of a 'user' or an 'agent' in the token_usage table."""
+    return f"total#{scope}#{owner_id}#{day.isoformat()}"
+
+
+class TokenLedger:
+    """
+    Records the tokens of every LLM call, tagged with user, agent, stage and model, and
+    enforces daily token budgets.
+
+    The token_usage table has a string partition key 'id' and holds two kinds of items:
+
+    - usage entries, one per call: id (uuid), timestamp, stage, prompt_tokens,
+      completion_tokens, cached_tokens, and model / user_id / agent_id when known;
+    - daily counters, one per user or agent and UTC day: id ('total#<scope>#<owner>#<day>',
+      see counter_id), tokens (number, incremented with an atomic UpdateItem ADD) and
+      expires_at (epoch seconds, for an optional TTL).
+
+    record() only queues the entry and adds its tokens to an in-memory delta; a
+    background thread writes queued entries in batches and then adds the deltas to the
+    shared counters, so the request path never waits on storage writes. Budget checks use
+    a per-process copy of each counter, read on first use and re-read every
+    refresh_seconds, plus the tokens not yet added to it. The counters are shared by all
+    worker processes and survive restarts.
+    """
+    def __init__(self, table, user_budget=USER_DAILY_TOKEN_BUDGET, agent_budget=AGENT_DAILY_TOKEN_BUDGET,
+                 downgrade_ratio=BUDGET_DOWNGRADE_RATIO, batch_size=LEDGER_BATCH_SIZE,
+                 flush_seconds=LEDGER_FLUSH_SECONDS, refresh_seconds=LEDGER_REFRESH_SECONDS):
+        self.table = table
+        self.budgets = {"user": user_budget, "agent": agent_budget}
+        self.downgrade_ratio = downgrade_ratio
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        # (scope, owner_id, day) -> (counter value last read or written, time.monotonic() of it).
+        self._counters = {}
+        # (scope, owner_id, day) -> tokens recorded here but not yet added to the counter.
+        self._pending = Counter()
+        self._queue = queue.Queue(maxsize=MAX_PENDING_ENTRIES)
+        self._flushing = threading.Event()
+        self._writer = None
+
+    @staticmethod
+    def _today():
+        return datetime.datetime.now(datetime.timezone.utc).date()
+
+    def record(self, stage, usage, model=None, user_id=None, agent_id=None):
+        """
+        Records the usage of one call.
+
+        Args:
+            stage (str): Pipeline stage ('planning', 'retrieval', 'answer', 'summary').
+            usage: The API usage object (ignored if None).
+            model (str, optional): The model called.
+            user_id (str, optional): The user the call was made for.
+            agent_id (str, optional): The agent the call was made for.
+        """
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        entry = {
+            "id": str(uuid.uuid4()),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "stage": stage,
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "cached_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0,
+        }
+        for name, value in (("model", model), ("user_id", user_id), ("agent_id", agent_id)):
+            if value:
+                entry[name] = value
+
+        today = self._today()
+        with self._lock:
+            tokens = usage.prompt_tokens + usage.completion_tokens
+            if user_id:
+                self._pending[("user", user_id, today)] += tokens
+            if agent_id:
+                self._pending[("agent", agent_id, today)] += tokens
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="token-ledger", daemon=True)
+                self._writer.start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            metrics.increment("token_ledger_dropped_total")
+
+    def _read_counter(self, key):
+        """Reads a shared counter, keeping the highest value seen (counters only grow)."""
+        try:
+            item = self.table.get_item(Key={"id": counter_id(*key)}, ProjectionExpression="tokens").get("Item")
+        except Exception as e:
+            metrics.increment("token_ledger_counter_errors_total")
+            print(f"Could not read token usage counter {counter_id(*key)}: {e}")
+            return
+        value = int(item["tokens"]) if item else 0
+        with self._lock:
+            known = self._counters.get(key, (0, None))[0]
+            self._counters[key] = (max(known, value), time.monotonic())
+
+    def usage_today(self, scope, owner_id):
+        """Tokens used today by a 'user' or an 'agent', across all worker processes."""
+        key = (scope, owner_id, self._today())
+        with self._lock:
+            counter = self._counters.get(key)
+        if counter is None or time.monotonic() - counter[1] >= self.refresh_seconds:
+            self._read_counter(key)
+        with self._lock:
+            return self._counters.get(key, (0, None))[0] + self._pending[key]
+
+    def check(self, user_id=None, agent_id=None):
+        """
+        Checks the budgets of the owner of a request.
+
+        Returns:
+            bool: True if the request should be downgraded to the cheapest model.
+
+        Raises:
+            BudgetExceeded: If the user or agent has used up its budget.
+        """
+        used = 0.0
+        for scope, owner_id in (("user", user_id), ("agent", agent_id)):
+            budget = self.budgets[scope]
+            if owner_id and budget:
+                share = self.usage_today(scope, owner_id) / budget
+                if share >= 1:
+                    metrics.increment("token_budget_total", outcome="refused")
+                    raise BudgetExceeded(f"The daily token budget of this {scope} is used up.")
+                used = max(used, share)
+        if used >= self.downgrade_ratio:
+            metrics.increment("token_budget_total", outcome="downgraded")
+            return True
+        return False
+
+    def _sync_counters(self):
+        """Adds the pending tokens to the shared counters; failed adds are retried next time."""
+        with self._lock:
+            pending = {key: tokens for key, tokens in self._pending.items() if tokens}
+        for key, tokens in pending.items():
+            expires_at = int(time.time()) + COUNTER_RETENTION_DAYS * 24 * 60 * 60
+            try:
+                response = self.table.update_item(
+                    Key={"id": counter_id(*key)},
+                    UpdateExpression="ADD tokens :tokens SET expires_at = if_not_exists(expires_at, :expires_at)",
+                    ExpressionAttributeValues={":tokens": tokens, ":expires_at": expires_at},
+                    ReturnValues="UPDATED_NEW"
+                )
+            except Exception as e:
+                metrics.increment("token_ledger_counter_errors_total")
+                print(f"Could not update token usage counter {counter_id(*key)}: {e}")
+                continue
+            value = int(response["Attributes"]["tokens"])
+            with self._lock:
+                self._pending[key] -= tokens
+                if not self._pending[key]:
+                    del self._pending[key]
+                known = self._counters.get(key, (0, None))[0]
+                self._counters[key] = (max(known, value), time.monotonic())
+        with self._lock:
+            # Counters of past days are no longer checked.
+            today = self._today()
+            for key in [key for key in self._counters if key[2] != today]:
+                del self._counters[key]
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size and not self._flushing.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            # batch_writer groups puts into BatchWriteItem requests and resends unprocessed items.
+            with self.table.batch_writer() as writer:
+                for entry in batch:
+                    writer.put_item(Item=entry)
+        except Exception as e:
+            metrics.increment("token_ledger_write_errors_total")
+            print(f"Could not write {len(batch)} token ledger entries: {e}")
+        finally:
+            self._sync_counters()
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self, timeout=10.0):
+        """Waits (up to timeout seconds) until every recorded entry has been written."""
+        self._flushing.set()
+        try:
+            deadline = time.monotonic() + timeout
+            while self._queue.unfinished_tasks and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            self._flushing.clear()
+
+
+token_ledger = TokenLedger(token_usage_table)
@@ -0,0 +1,160 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from ci_agent.config import LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE
+from ci_agent.utils.metrics import metrics
+
+# Lower runs first. Interactive turns always go ahead of background ingest.
+INTERACTIVE = 0
+BACKGROUND = 1
+
+STAGE_PRIORITIES = {
+    "planning": INTERACTIVE,
+    "retrieval": INTERACTIVE,
+    "answer": INTERACTIVE,
+    "summary": BACKGROUND,
+}
+
+# Share of each bucket that background calls leave untouched, so an interactive turn
+# arriving during a large fill does not have to wait for a refill.
+BACKGROUND_HEADROOM = 0.2
+
+# Completion tokens assumed when estimating the cost of a request.
+DEFAULT_COMPLETION_TOKENS = 500
+
+MAX_RETRIES = 4
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRY_ERROR_NAMES = {"APIConnectionError", "APITimeoutError"}
+
+metrics.describe("llm_requests_total", "LLM requests sent, by stage.")
+metrics.describe("llm_retries_total", "LLM requests retried after a rate limit or transient error, by stage.")
+metrics.describe("llm_wait_seconds_total", "Time spent waiting for rate limit capacity, by priority.")
+
+
+class TokenBucket:
+    """Continuously refilling bucket of per-minute capacity (requests or tokens)."""
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, reserve=0.0):
+        """Seconds until amount can be taken while leaving reserve (a share of capacity) in the bucket."""
+        self._refill()
+        # A request larger than the bucket would never fit; let it through once the bucket is full.
+        needed = min(amount + reserve * self.capacity, self.capacity) - self.level
+        return max(needed, 0) / self.rate
+
+    def take(self, amount):
+        """Takes amount (the level may go negative after reconciling an underestimate)."""
+        self._refill()
+        self.level -= amount
+
+
+def _is_retryable(error):
+    return getattr(error, "status_code", None) in RETRY_STATUS_CODES or type(error).__name__ in RETRY_ERROR_NAMES
+
+
+def _retry_delay(error, attempt):
+    """Full-jitter exponential backoff, honouring Retry-After when the provider sends it."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), MAX_BACKOFF_SECONDS) + random.uniform(0, BASE_BACKOFF_SECONDS)
+    except ValueError:
+        pass
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt))
+
+
+class LLMScheduler:
+    """
+    Process-wide gate in front of every LLM request.
+
+    Requests and tokens per minute are limited with token buckets. Each request states
+    its estimated token cost up front and waits in a priority queue until both buckets
+    can cover it; the estimate is corrected with the actual usage afterwards. Rate limit
+    and transient errors are retried with jittered backoff.
+    """
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+
+    def _acquire(self, priority, tokens):
+        entry = (priority, next(self._sequence))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            self._cond.notify_all()
+            try:
+                while True:
+                    if self._waiting[0] == entry:
+                        reserve = BACKGROUND_HEADROOM if priority == BACKGROUND else 0.0
+                        wait = max(self.requests.wait_time(1, reserve), self.tokens.wait_time(tokens, reserve))
+                        if wait <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            break
+                        # Woken early if a higher priority request queues up.
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+        waited = time.monotonic() - started
+        if waited > 0.01:
+            metrics.increment("llm_wait_seconds_total", round(waited, 3), priority="interactive" if priority == INTERACTIVE else "background")
+
+    def _reconcile(self, result, estimated_tokens):
+        usage = getattr(result, "usage", None)
+        if usage is None or not getattr(usage, "total_tokens", None):
+            return
+        with self._cond:
+            self.tokens.take(usage.total_tokens - estimated_tokens)
+
+    def run(self, stage, call, estimated_tokens):
+        """
+        Runs call() once capacity is available, retrying rate limit and transient errors.
+
+        Args:
+            stage (str): Pipeline stage, which decides the priority (see STAGE_PRIORITIES).
+            call (function): Performs the request.
+            estimated_tokens (int): Estimated prompt plus completion tokens.
+
+        Returns:
+            The result of call.
+        """
+        priority = STAGE_PRIORITIES.get(stage, INTERACTIVE)
+        for attempt in range(MAX_RETRIES + 1):
+            self._acquire(priority, estimated_tokens)
+            metrics.increment("llm_requests_total", stage=stage)
+            try:
+                result = call()
+            except Exception as e:
+                if attempt == MAX_RETRIES or not _is_retryable(e):
+                    raise
+                delay = _retry_delay(e, attempt)
+                metrics.increment("llm_retries_total", stage=stage)
+                print(f"{stage} request failed ({type(e).__name__}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self._reconcile(result, estimated_tokens)
+            return result
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,77 @@
+import hashlib
+import json
+from ci_agent.services.ledger import token_ledger
+from ci_agent.utils.metrics import metrics
+
+metrics.describe("prompt_tokens_total", "Prompt tokens sent, by pipeline stage.")
+metrics.describe("prompt_cached_tokens_total", "Prompt tokens served from the provider's prompt cache, by pipeline stage.")
+metrics.describe("prompt_prefix_total", "Prompts whose stable prefix extended the previous prompt's (reused) or not (changed), by stage.")
+
+
+def context_message(context):
+    """The per-turn message carrying retrieved context. Always placed last, after the history."""
+    return {
+        "role": "system",
+        "content": f"""The data retrieval mechanism for the assistant has \
+        retrieved the following context which the assistant shall use to \
+        answer the user's question. The assistant should be advised that the user cannot see this context:\n {context}""".strip()
+    }
+
+
+def _message_hash(message):
+    return hashlib.sha256(json.dumps(message, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def record_usage(stage, usage, model=None, user_id=None, agent_id=None):
+    """
+    Records prompt and cached prompt tokens from an API usage object (if any), and the call
+    in the token ledger under its user and agent.
+    """
+    if usage is None:
+        return
+    token_ledger.record(stage, usage, model, user_id, agent_id)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    metrics.increment("prompt_tokens_total", usage.prompt_tokens, stage=stage)
+    metrics.increment("prompt_cached_tokens_total", cached, stage=stage)
+    print(f"{stage}: {usage.prompt_tokens} prompt tokens ({cached} cached)")
+
+
+class PromptAssembler:
+    """
+    Assembles the messages of one conversation for the provider's prompt cache.
+
+    The provider reuses the longest previously seen prompt prefix, so content goes from
+    most to least stable: static instructions (shared by every agent), per-company facts
+    (changing at most daily), the conversation history (append only), and last the
+    retrieved context of the current turn, which is never kept in the history.
+
+    Also tracks, per stage, whether each prompt's stable part extends the previous one.
+    """
+    def __init__(self):
+        self._stable_hashes = {}
+
+    def assemble(self, stage, stable_messages, context=None):
+        """
+        Args:
+            stage (str): Pipeline stage the prompt is for (e.g. 'planning', 'answer').
+            stable_messages (list): Instructions, facts and history, in that order.
+            context (str, optional): Retrieved context for this turn.
+
+        Returns:
+            list: The messages to send.
+        """
+        hashes = [_message_hash(message) for message in stable_messages]
+        previous = self._stable_hashes.get(stage)
+        if previous is not None:
+            reused = hashes[:len(previous)] == previous
+            metrics.increment("prompt_prefix_total", stage=stage, outcome="reused" if reused else "changed")
+            if not reused:
+                changed_at = next((idx for idx, (old, new) in enumerate(zip(previous, hashes)) if old != new), len(hashes))
+                print(f"{stage} prompt prefix changed at message {changed_at}")
+        self._stable_hashes[stage] = hashes
+
+        messages = list(stable_messages)
+        if context:
+            messages.append(context_message(context))
+        return messages
@@ -0,0 +1,119 @@
+import os
+import threading
+import zlib
+from ci_agent.config import CACHE_DIR, RAW_FILING_CACHE_MAX_BYTES
+from ci_agent.utils.diskcache import DiskCache
+from ci_agent.utils.metrics import metrics
+
+metrics.describe("raw_filing_cache_requests_total", "Raw filing cache lookups, by outcome (hit or miss).")
+
+# Loads of different filings run in parallel; loads of the same filing wait for each other.
+LOCK_STRIPES = 64
+
+# Parts holding documents as downloaded from EDGAR; other parts are derived from them.
+DOCUMENT_PARTS = {"primary", "xbrl"}
+
+
+def accession_number(filing):
+    """Accession number of an edgartools Filing or company report (TenK / TenQ), or None."""
+    # Company reports keep the underlying Filing in _filing.
+    for candidate in (filing, getattr(filing, "_filing", None)):
+        value = getattr(candidate, "accession_no", None)
+        if value:
+            return str(value)
+    return None
+
+
+def base_filing(filing):
+    """The edgartools Filing behind a company report or LazyReport (or the filing itself)."""
+    return getattr(filing, "_filing", None) or filing
+
+
+class LazyReport:
+    """
+    A filing from a company's filing list whose report object (TenK, TenQ, EightK) is only
+    built, which downloads the filing, when something beyond the listing data is used.
+    """
+    def __init__(self, filing):
+        self._filing = filing
+        self._report = None
+        self._lock = threading.Lock()
+
+    @property
+    def accession_no(self):
+        return self._filing.accession_no
+
+    @property
+    def filing_date(self):
+        return self._filing.filing_date
+
+    def report(self):
+        with self._lock:
+            if self._report is None:
+                self._report = self._filing.obj()
+        return self._report
+
+    def __getattr__(self, name):
+        return getattr(self.report(), name)
+
+    def __getitem__(self, key):
+        return self.report()[key]
+
+    def __str__(self):
+        return str(self.report())
+
+
+class RawFilingCache:
+    """
+    On-disk cache of EDGAR filing documents and text taken from them, keyed by
+    accession number.
+
+    The raw documents (the primary HTML document and the XBRL documents) are cached
+    alongside parts derived from them, such as section texts. A filing's content never
+    changes under its accession number, so entries never expire; the least recently used
+    ones are evicted past the size cap. Shared by all ingest paths (and all workers on
+    the host), so a filing is fetched from EDGAR once.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        # Loading a derived part may load a document, never the other way round, so with
+        # separate stripes locks are always taken in that order.
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._document_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def get(self, filing, part, load):
+        """
+        Returns part of a filing, loading and caching it on a miss.
+
+        Args:
+            filing (object): The edgartools filing (or LazyReport) the part comes from.
+            part (str): Name of the part: a document ('primary', 'xbrl') or a part derived
+                        from one, e.g. 'sections:Item 1,Item 7' or '8-K'.
+            load (function): Computes the part from the filing (this is what hits EDGAR).
+
+        Returns:
+            The (picklable) value returned by load.
+        """
+        accession = accession_number(filing)
+        if accession is None:
+            return load()
+        key = f"{accession}/{part}"
+        locks = self._document_locks if part in DOCUMENT_PARTS else self._locks
+        with locks[zlib.crc32(key.encode("utf-8")) % LOCK_STRIPES]:
+            value = self.cache.get(key)
+            if value is not None:
+                metrics.increment("raw_filing_cache_requests_total", outcome="hit")
+                return value
+            metrics.increment("raw_filing_cache_requests_total", outcome="miss")
+            value = load()
+            self.cache.set(key, value)
+            return value
+
+    def primary_document(self, filing):
+        """HTML of a filing's primary document (the 10-K / 10-Q / 8-K itself)."""
+        return self.get(filing, "primary", lambda: base_filing(filing).html())
+
+
+raw_filing_cache = RawFilingCache(
+    DiskCache(os.path.join(CACHE_DIR, "raw_filings.sqlite3"), RAW_FILING_CACHE_MAX_BYTES)
+)
@@ -1,23 +1,37 @@
+import json
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from ci_agent.services.llm_scheduler import DEFAULT_COMPLETION_TOKENS, llm_scheduler
+from ci_agent.services.prompts import record_usage
 from ci_agent.services.tools import tools
+from ci_agent.utils.tokens import estimate_message_tokens, estimate_tokens
 
 load_dotenv("./.env")
 
 class RetrievalLayer:
-  def __init__(self, system_prompt):
+  def __init__(self, system_prompt, tools=tools):
     self.system_prompt = system_prompt
-    self.client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    self.tools = tools
+    from openai import OpenAI
+    # Retries are handled by llm_scheduler, which also knows about the rate limits.
+    self.client = OpenAI(api_key=os.environ["OPENAI_API_KEY"], max_retries=0)
+    self.tools_tokens = estimate_tokens(json.dumps(self.tools))
 
-  def get_completion(self, user_content, model="gpt-4o-mini"):
-      completion = self.client.chat.completions.create(
+  def get_completion(self, user_content, model="gpt-4o-mini", owner=None):
+      messages = [
+          {"role": "system", "content": self.system_prompt},
+          {"role": "user", "content": user_content + f"\n\n##Tool Calls:"}
+      ]
+      completion = llm_scheduler.run(
+          "retrieval",
+          lambda: self.client.chat.completions.create(
                   model=model,
-                  messages=[
-                      {"role": "system", "content": self.system_prompt},
-                      {"role": "user", "content": user_content + f"\n\n##Tool Calls:"}
-                  ],
-                  tools=tools
-              )
+                  messages=messages,
+                  tools=self.tools
+              ),
+          estimate_message_tokens(messages) + self.tools_tokens + DEFAULT_COMPLETION_TOKENS
+      )
       print(f"Used: {completion.usage.total_tokens}")
+      # The system prompt and tool schemas are static, so only the user content misses the prompt cache.
+      record_usage("retrieval", completion.usage, completion.model, **(owner or {}))
       return completion.choices[0].message
\ No newline at end of file
@@ -0,0 +1,209 @@
+import re
+import threading
+import time
+from collections import deque
+from ci_agent.utils.tokens import estimate_tokens
+
+# Per pipeline stage: candidate models from most to least capable, the p95 latency target
+# (seconds) and the complexity score above which the most capable model is preferred.
+# For the streamed answer, latency is the time until the stream opens.
+STAGE_POLICIES = {
+    "planning": {"models": ["gpt-4o", "gpt-4o-mini"], "p95_target": 8.0, "complexity_threshold": 0.35},
+    "retrieval": {"models": ["gpt-4o-mini"], "p95_target": 6.0, "complexity_threshold": 1.0},
+    "answer": {"models": ["gpt-4o", "gpt-4o-mini"], "p95_target": 4.0, "complexity_threshold": 0.6},
+    "summary": {"models": ["gpt-4o-mini"], "p95_target": 30.0, "complexity_threshold": 1.0},
+}
+
+# Recent calls kept per (stage, model) for latency and error statistics.
+STATS_WINDOW = 200
+# Samples needed before a model's statistics are trusted.
+MIN_SAMPLES = 20
+# Error rate above which a model is skipped like a slow one.
+MAX_ERROR_RATE = 0.2
+# While a model is skipped, every Nth decision still goes to it so its statistics recover.
+PROBE_EVERY = 20
+# Routing decisions kept for inspection.
+DECISION_LOG_SIZE = 1000
+
+# Context size (tokens) at which retrieved context alone makes a request complex.
+LARGE_CONTEXT_TOKENS = 12000
+
+COMPLEX_QUERY_PATTERN = re.compile(
+    r"\b(compare|comparison|versus|vs\.?|trend|over the (?:last|past)|why|explain|impact|implication|strategy|"
+    r"relative|against|outlook|risk)\b",
+    re.IGNORECASE
+)
+
+
+def query_complexity(query="", context_tokens=0):
+    """
+    Heuristic complexity score in [0, 1] of a request.
+
+    Long, multi-part or analytical questions and large retrieved contexts score higher.
+
+    Args:
+        query (str): The user's question.
+        context_tokens (int): Estimated tokens of retrieved context sent along.
+
+    Returns:
+        float: The score.
+    """
+    score = min(estimate_tokens(query) / 200, 0.3)
+    score += min(len(COMPLEX_QUERY_PATTERN.findall(query)) * 0.15, 0.45)
+    score += min(max(query.count("?") - 1, 0) * 0.1, 0.2)
+    score += min(context_tokens / LARGE_CONTEXT_TOKENS, 1.0) * 0.3
+    return min(score, 1.0)
+
+
+def _p95(samples):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def model_family(model):
+    """The model name without a snapshot date ('gpt-4o-mini-2024-07-18' -> 'gpt-4o-mini')."""
+    return re.sub(r"-\d{4}-\d{2}-\d{2}$", "", model or "")
+
+
+class ModelRouter:
+    """
+    Picks the model for each pipeline stage and falls back to faster tiers.
+
+    The preferred model comes from the stage policy and the request's complexity. A
+    model whose observed p95 latency exceeds the stage target, or whose error rate is
+    too high, is skipped in favour of the next faster tier. Calls that fail are retried
+    once per remaining faster tier. Every decision is kept in a bounded log together
+    with the latency it ended up taking.
+    """
+    def __init__(self, policies=STAGE_POLICIES):
+        self.policies = policies
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._errors = {}
+        self._decisions = 0
+        self.decision_log = deque(maxlen=DECISION_LOG_SIZE)
+
+    def _window(self, store, stage, model):
+        return store.setdefault((stage, model), deque(maxlen=STATS_WINDOW))
+
+    def _health(self, stage, model):
+        """Returns (p95 latency or None, error rate or None) of a model for a stage."""
+        latencies = self._window(self._latencies, stage, model)
+        errors = self._window(self._errors, stage, model)
+        p95 = _p95(latencies) if len(latencies) >= MIN_SAMPLES else None
+        error_rate = sum(errors) / len(errors) if len(errors) >= MIN_SAMPLES else None
+        return p95, error_rate
+
+    def choose(self, stage, query="", context_tokens=0, downgrade=False):
+        """
+        Chooses the model for one request.
+
+        Args:
+            stage (str): 'planning', 'retrieval', 'answer' or 'summary'.
+            query (str): The user's question, if any.
+            context_tokens (int): Estimated tokens of context sent along.
+            downgrade (bool): Use the fastest (cheapest) tier, e.g. when a token budget runs low.
+
+        Returns:
+            dict: The routing decision; pass it to run() (or record()).
+        """
+        policy = self.policies[stage]
+        models = policy["models"]
+        complexity = query_complexity(query, context_tokens)
+        preferred = 0 if complexity >= policy["complexity_threshold"] else len(models) - 1
+
+        with self._lock:
+            self._decisions += 1
+            probe = self._decisions % PROBE_EVERY == 0
+            index, reason = preferred, "complex" if preferred == 0 else "simple"
+            while index < len(models) - 1 and not probe:
+                p95, error_rate = self._health(stage, models[index])
+                if p95 is not None and p95 > policy["p95_target"]:
+                    reason = f"{models[index]} p95 {p95:.1f}s over {policy['p95_target']:.1f}s target"
+                elif error_rate is not None and error_rate > MAX_ERROR_RATE:
+                    reason = f"{models[index]} error rate {error_rate:.0%}"
+                else:
+                    break
+                index += 1
+            if probe and preferred < len(models) - 1:
+                reason += " (probe)"
+            if downgrade and index < len(models) - 1:
+                index, reason = len(models) - 1, "token budget"
+
+        decision = {
+            "stage": stage,
+            "model": models[index],
+            "reason": reason,
+            "complexity": round(complexity, 2),
+            "context_tokens": context_tokens,
+            "p95_target": policy["p95_target"],
+            "latency": None,
+            "within_target": None,
+            "error": None,
+            "timestamp": time.time(),
+        }
+        print(f"Routing {stage} to {decision['model']} ({reason}, complexity {decision['complexity']})")
+        return decision
+
+    def record(self, decision, latency, error=None):
+        """Records the outcome (latency in seconds and the exception, if any) of a call made for a decision."""
+        with self._lock:
+            self._window(self._latencies, decision["stage"], decision["model"]).append(latency)
+            self._window(self._errors, decision["stage"], decision["model"]).append(error is not None)
+            decision["latency"] = round(latency, 3)
+            decision["error"] = type(error).__name__ if error is not None else None
+            decision["within_target"] = error is None and latency <= decision["p95_target"]
+            self.decision_log.append(dict(decision))
+
+    def run(self, decision, call):
+        """
+        Runs call(model) for a decision, timing it and falling back to faster tiers on
+        provider errors and timeouts. Any other exception is a bug in the caller and is
+        raised as is.
+
+        Args:
+            decision (dict): As returned by choose().
+            call (function): Accepts the model name and performs the request.
+
+        Returns:
+            The result of call.
+        """
+        # APIError also covers APIConnectionError and APITimeoutError.
+        from openai import APIError
+        models = self.policies[decision["stage"]]["models"]
+        while True:
+            start = time.perf_counter()
+            try:
+                result = call(decision["model"])
+            except (APIError, TimeoutError) as e:
+                self.record(decision, time.perf_counter() - start, error=e)
+                index = models.index(decision["model"])
+                if index == len(models) - 1:
+                    raise
+                print(f"{decision['model']} failed for {decision['stage']} ({e}); falling back to {models[index + 1]}")
+                decision = dict(decision, model=models[index + 1], reason=f"fallback after {type(e).__name__}")
+                continue
+            self.record(decision, time.perf_counter() - start)
+            return result
+
+    def stats(self):
+        """
+        Per stage and model: calls, p95 latency, error rate and the share of decisions that
+        stayed within the stage's latency target.
+        """
+        with self._lock:
+            decisions = list(self.decision_log)
+            report = {}
+            for (stage, model), latencies in self._latencies.items():
+                errors = self._errors[(stage, model)]
+                routed = [entry for entry in decisions if entry["stage"] == stage and entry["model"] == model]
+                report.setdefault(stage, {})[model] = {
+                    "calls": len(latencies),
+                    "p95_latency": round(_p95(latencies), 3) if latencies else None,
+                    "error_rate": round(sum(errors) / len(errors), 3) if errors else None,
+                    "within_target": round(sum(entry["within_target"] for entry in routed) / len(routed), 3) if routed else None,
+                }
+        return report
+
+
+model_router = ModelRouter()
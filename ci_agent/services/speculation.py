@@ -0,0 +1,184 @@
+import json
+import re
+from ci_agent.utils.metrics import metrics
+
+metrics.describe("speculation_total", "Speculative tool selections by outcome (used, rejected, not_needed, failed).")
+metrics.describe("speculation_wasted_tool_calls_total", "Tool calls selected speculatively and then discarded.")
+
+FINANCIAL_STATEMENT_TERMS = ("balance sheet", "income statement", "cash flow statement", "financial statement")
+METRIC_TERMS = ("growth", "trend", "margin", "over the last", "quarter over quarter", "year over year", "compare")
+STATEMENT_TYPES = ("balance sheet", "income statement", "cash flow statement")
+
+# Terms naming a filing section, mapped to a word of the section enum names in tools.py.
+SECTION_TERMS = {
+    "risk factor": "risk factors",
+    "md&a": "management discussion",
+    "management discussion": "management discussion",
+    "management's discussion": "management discussion",
+    "market risk": "market risk",
+    "legal proceeding": "legal proceedings",
+    "litigation": "legal proceedings",
+    "properties": "properties",
+    "business overview": "business",
+    "business description": "business",
+}
+
+YEAR_PATTERN = re.compile(r"\b(?:19|20)\d{2}\b")
+
+
+def _form(text):
+    """The filing form an entry names ('10-K', '10-Q' or '8-K'), or None."""
+    if "8 k" in text or "8k" in text:
+        return "8-K"
+    if "10 q" in text or "10q" in text or "quarterly" in text:
+        return "10-Q"
+    if "10 k" in text or "10k" in text or "annual" in text:
+        return "10-K"
+    return None
+
+
+def expected_tools(item):
+    """
+    The retrieval tools that can satisfy one of the planner's information_needed entries.
+
+    Returns:
+        set | None: Acceptable tool names, or None if the entry gives no hint (any tool will do).
+    """
+    text = item.lower().replace("-", " ")
+    form = _form(text)
+    if form == "8-K":
+        return {"retrieve_8K_documents", "search_filing_text"}
+    form = form.replace("-", "") if form else None
+
+    if any(term in text for term in METRIC_TERMS):
+        return {"compare_financial_metrics"} | (
+            {f"retrieve_{form}_financial_statement"} if form else
+            {"retrieve_10K_financial_statement", "retrieve_10Q_financial_statement"}
+        )
+    if any(term in text for term in FINANCIAL_STATEMENT_TERMS):
+        return {f"retrieve_{form}_financial_statement"} if form else {
+            "retrieve_10K_financial_statement", "retrieve_10Q_financial_statement", "compare_financial_metrics"
+        }
+    if form:
+        return {f"retrieve_{form}_sections", "search_filing_text"}
+    return None
+
+
+def expected_arguments(item):
+    """
+    The key arguments an information_needed entry pins down.
+
+    Returns:
+        dict: Any of 'form' ('10-K', '10-Q' or '8-K'), 'statement_type', 'section' (a word
+              of the section name) and 'years' (set of int), for what the entry names.
+    """
+    text = item.lower()
+    expected = {}
+    form = _form(text.replace("-", " "))
+    if form:
+        expected["form"] = form
+    statement_type = next((term for term in STATEMENT_TYPES if term in text), None)
+    if statement_type:
+        expected["statement_type"] = statement_type
+    section = next((name for term, name in SECTION_TERMS.items() if term in text), None)
+    if section:
+        expected["section"] = section
+    years = {int(year) for year in YEAR_PATTERN.findall(text)}
+    if years:
+        expected["years"] = years
+    return expected
+
+
+def _arguments(tool_call):
+    """The parsed arguments of a tool call ({} if they are not a JSON object)."""
+    try:
+        arguments = json.loads(tool_call.function.arguments or "{}")
+    except (TypeError, json.JSONDecodeError):
+        return {}
+    return arguments if isinstance(arguments, dict) else {}
+
+
+def _covers_years(arguments, years):
+    """
+    Whether a call's date range reaches every year. A filing about a fiscal year is often
+    filed early in the next one, so a range may also start in the following year.
+    """
+    date_range = arguments.get("date_range") or {}
+    try:
+        start_year = int(str(date_range["start_date"])[:4])
+        end_year = int(str(date_range["end_date"])[:4])
+    except (KeyError, ValueError):
+        # 'latest' retrievals and metric comparisons cannot be checked against a period.
+        return False
+    return all(start_year - 1 <= year <= end_year for year in years)
+
+
+def satisfies(item, name, arguments):
+    """
+    Whether a tool call can answer an information_needed entry: the tool must be one the
+    entry maps to and the section, statement, form and period it names must match.
+
+    Args:
+        item (str): The planner's information_needed entry.
+        name (str): Tool name of the call.
+        arguments (dict): Parsed arguments of the call.
+
+    Returns:
+        bool
+    """
+    acceptable = expected_tools(item)
+    if acceptable is not None and name not in acceptable:
+        return False
+
+    expected = expected_arguments(item)
+    if "statement_type" in expected and name.endswith("_financial_statement"):
+        if arguments.get("statement_type") != expected["statement_type"]:
+            return False
+    if "section" in expected and name.endswith("_sections"):
+        sections = " ".join(arguments.get("sections") or []).lower()
+        if expected["section"] not in sections:
+            return False
+    if "form" in expected and name == "search_filing_text":
+        document_types = arguments.get("document_types") or []
+        if document_types and expected["form"] not in document_types:
+            return False
+    if "years" in expected and not _covers_years(arguments, expected["years"]):
+        return False
+    return True
+
+
+def covers(information_needed, tool_calls):
+    """
+    Whether tool calls selected speculatively from the raw user message cover what the
+    planner decided is needed: every entry must be matched by a distinct call whose tool
+    and key arguments satisfy it.
+
+    Args:
+        information_needed (list): The planner's information_needed entries.
+        tool_calls (list): The speculative retrieval layer's tool calls.
+
+    Returns:
+        bool
+    """
+    if not tool_calls or len(tool_calls) < len(information_needed):
+        return False
+    calls = [(tool_call.function.name, _arguments(tool_call)) for tool_call in tool_calls]
+    candidates = [
+        [index for index, (name, arguments) in enumerate(calls) if satisfies(item, name, arguments)]
+        for item in information_needed
+    ]
+
+    # Bipartite matching of entries to calls (augmenting paths; both lists are short).
+    matched_entry = {}
+
+    def assign(entry, visited):
+        for call in candidates[entry]:
+            if call in visited:
+                continue
+            visited.add(call)
+            if call not in matched_entry or assign(matched_entry[call], visited):
+                matched_entry[call] = entry
+                return True
+        return False
+
+    return all(assign(entry, set()) for entry in range(len(information_needed)))
@@ -0,0 +1,143 @@
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from ci_agent.utils.tokens import estimate_tokens
+
+# Largest input sent to the model in one summarization request. Well below the context
+# limit, and small enough that each request returns quickly.
+MAX_CHUNK_TOKENS = 6000
+
+# Partial summaries combined per reduce request.
+REDUCE_FAN_IN = 8
+
+# Shared by all agents; chunk summaries are independent requests.
+SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="summary-chunk")
+
+# Lines that open a new logical part of a filing: markdown headings, 8-K item headers
+# (e.g. "**Item 2.02**") and 10-K/10-Q item headers (e.g. "Item 7. Management's ...").
+BOUNDARY_PATTERN = re.compile(r'^\s*(?:#{1,6}\s|\*\*\s*item\s+\d|item\s+\d+[a-z]?\s*[.:])', re.IGNORECASE | re.MULTILINE)
+PARAGRAPH_PATTERN = re.compile(r'\n\s*\n')
+
+
+class SummaryText(str):
+    """Summary text that remembers the model which wrote it (recorded in its metadata)."""
+    def __new__(cls, text, model=None):
+        summary = super().__new__(cls, text)
+        summary.model = model
+        return summary
+
+
+def source_hash(text):
+    """Content hash of the raw text a summary is generated from (to detect changed sources)."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _split_on(pattern, text):
+    """Splits text before every match of pattern, keeping the matched boundary in the piece."""
+    starts = [match.start() for match in pattern.finditer(text) if match.start() > 0]
+    bounds = [0] + starts + [len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:]) if text[start:end].strip()]
+
+
+def _split_paragraphs(text):
+    """Splits text after blank lines, keeping the separators so pieces join back losslessly."""
+    ends = [match.end() for match in PARAGRAPH_PATTERN.finditer(text)]
+    bounds = [0] + ends + [len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:]) if text[start:end].strip()]
+
+
+def _split_oversized(piece, max_tokens):
+    """Splits a piece larger than max_tokens on paragraph, then line, then character boundaries."""
+    if estimate_tokens(piece) <= max_tokens:
+        return [piece]
+    for splitter in (_split_paragraphs, lambda text: text.splitlines(keepends=True)):
+        parts = splitter(piece)
+        if len(parts) > 1:
+            return _pack([chunk for part in parts for chunk in _split_oversized(part, max_tokens)], max_tokens)
+    max_chars = max_tokens * 4
+    return [piece[idx:idx + max_chars] for idx in range(0, len(piece), max_chars)]
+
+
+def _pack(pieces, max_tokens):
+    """
+    Greedily packs consecutive pieces into chunks of at most max_tokens.
+
+    A tiny fragment (e.g. a lone item header) is carried into the next chunk rather than
+    sent on its own, which may overflow the limit by a few percent.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens and current_tokens > max_tokens // 20:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def split_into_chunks(text, max_tokens=MAX_CHUNK_TOKENS):
+    """
+    Splits a filing into chunks of at most max_tokens, preferring item/heading boundaries.
+
+    Consecutive small items are packed together; items that are too large on their own
+    are split on paragraph boundaries (then lines as a last resort).
+
+    Args:
+        text (str): The filing or section text.
+        max_tokens (int): Maximum estimated tokens per chunk.
+
+    Returns:
+        list: The chunks, in document order.
+    """
+    pieces = [chunk for part in _split_on(BOUNDARY_PATTERN, text) for chunk in _split_oversized(part, max_tokens)]
+    return _pack(pieces, max_tokens)
+
+
+class MapReduceSummarizer:
+    """
+    Summarizes texts of any length with bounded latency.
+
+    Texts that fit in one request are summarized directly. Larger ones are split into
+    chunks that are summarized in parallel (map), and the partial summaries are then
+    combined (reduce), in rounds of REDUCE_FAN_IN if there are many of them.
+    """
+    def __init__(self, complete, max_chunk_tokens=MAX_CHUNK_TOKENS, executor=SUMMARY_EXECUTOR):
+        """
+        Args:
+            complete (function): Accepts (system_message, user_content) and returns the model's reply.
+            max_chunk_tokens (int): Maximum estimated tokens per request.
+            executor (Executor): Pool the chunk requests run on.
+        """
+        self.complete = complete
+        self.max_chunk_tokens = max_chunk_tokens
+        self.executor = executor
+
+    def summarize(self, text, map_prompt, reduce_prompt):
+        """
+        Args:
+            text (str): The text to summarize.
+            map_prompt (str): System message used to summarize the text (or each chunk of it).
+            reduce_prompt (str): System message used to combine partial summaries.
+
+        Returns:
+            str: The summary.
+        """
+        chunks = split_into_chunks(text, self.max_chunk_tokens)
+        if len(chunks) <= 1:
+            return self.complete(map_prompt, text)
+
+        print(f"Summarizing {len(chunks)} chunks ({estimate_tokens(text)} tokens) in parallel")
+        partials = list(self.executor.map(
+            lambda indexed: self.complete(map_prompt, f"[Part {indexed[0] + 1} of {len(chunks)}]\n\n{indexed[1]}"),
+            enumerate(chunks)
+        ))
+        while len(partials) > 1:
+            groups = [partials[idx:idx + REDUCE_FAN_IN] for idx in range(0, len(partials), REDUCE_FAN_IN)]
+            partials = list(self.executor.map(
+                lambda group: group[0] if len(group) == 1 else self.complete(reduce_prompt, "\n\n---\n\n".join(group)),
+                groups
+            ))
+        return partials[0]
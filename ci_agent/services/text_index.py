@@ -0,0 +1,249 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from collections import Counter, defaultdict
+from ci_agent.config import CACHE_DIR
+
+# BM25 parameters (the usual defaults).
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Target passage length in words. Passages are what search returns, so they are kept
+# short enough to quote but long enough to carry a fact with its context.
+PASSAGE_WORDS = 120
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.'-][a-z0-9]+)*")
+PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which with".split()
+)
+
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords. Identifiers like '3.5' or '23-cv-456' stay one token."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def split_passages(text, passage_words=PASSAGE_WORDS):
+    """
+    Splits section text into passages of about passage_words words, on paragraph
+    boundaries where possible.
+    """
+    passages, current, current_words = [], [], 0
+    for paragraph in PARAGRAPH_PATTERN.split(text):
+        words = paragraph.split()
+        while words:
+            room = passage_words - current_words
+            if len(words) > room and current_words:
+                # Close the current passage rather than splitting a paragraph across two.
+                passages.append(" ".join(current))
+                current, current_words = [], 0
+                continue
+            taken, words = words[:passage_words], words[passage_words:]
+            current.extend(taken)
+            current_words += len(taken)
+            if current_words >= passage_words:
+                passages.append(" ".join(current))
+                current, current_words = [], 0
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+class TextIndex:
+    """
+    Per-company BM25 index over the raw text of filing sections.
+
+    Summaries drop specifics (named customers, case numbers, product lines); this index
+    keeps the raw section text as short passages so pinpoint questions can be answered
+    from snippets. Each company has one SQLite file holding the passages with their
+    metadata (filing key, form, date, section) and one postings list per term, stored
+    as a packed array of (passage id, term frequency) pairs.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    def _conn(self, cik):
+        cik = str(cik)
+        if cik not in self._connections:
+            conn = sqlite3.connect(os.path.join(self.root, f"{cik}.sqlite3"), check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS passages (
+                    id INTEGER PRIMARY KEY,
+                    filing_key TEXT NOT NULL,
+                    form TEXT NOT NULL,
+                    filing_date TEXT NOT NULL,
+                    section TEXT NOT NULL,
+                    length INTEGER NOT NULL,
+                    text TEXT NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS passages_filing ON passages (filing_key)")
+            conn.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT PRIMARY KEY, entries BLOB NOT NULL)")
+            conn.commit()
+            self._connections[cik] = conn
+        return self._connections[cik]
+
+    @staticmethod
+    def _read_postings(conn, terms):
+        """Returns {term: array('I') of interleaved passage id, term frequency}."""
+        postings = {}
+        terms = list(terms)
+        # Stay under SQLite's bound parameter limit.
+        for start in range(0, len(terms), 500):
+            batch = terms[start:start + 500]
+            rows = conn.execute(
+                f"SELECT term, entries FROM postings WHERE term IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            for term, blob in rows:
+                entries = array("I")
+                entries.frombytes(blob)
+                postings[term] = entries
+        return postings
+
+    def has_filing(self, cik, filing_key):
+        with self._lock:
+            row = self._conn(cik).execute(
+                "SELECT 1 FROM passages WHERE filing_key = ? LIMIT 1", (filing_key,)
+            ).fetchone()
+        return row is not None
+
+    def filing_keys(self, cik):
+        """The cik_filing_date keys of every filing indexed for a company."""
+        with self._lock:
+            rows = self._conn(cik).execute("SELECT DISTINCT filing_key FROM passages").fetchall()
+        return {row[0] for row in rows}
+
+    def add_filing(self, cik, filing_key, form, filing_date, sections):
+        """
+        Indexes (or re-indexes) the raw sections of one filing.
+
+        Args:
+            cik (str): Company CIK.
+            filing_key (str): The filing's cik_filing_date key.
+            form (str): '10-K', '10-Q' or '8-K'.
+            filing_date (str): Filing date (YYYY-MM-DD).
+            sections (dict): Section name to raw section text.
+
+        Returns:
+            int: Number of passages indexed.
+        """
+        with self._lock:
+            conn = self._conn(cik)
+            self._remove_filing(conn, filing_key)
+
+            term_entries = defaultdict(list)
+            count = 0
+            for section, text in sections.items():
+                if not text:
+                    continue
+                for passage in split_passages(str(text)):
+                    tokens = tokenize(passage)
+                    if not tokens:
+                        continue
+                    cursor = conn.execute(
+                        "INSERT INTO passages (filing_key, form, filing_date, section, length, text) VALUES (?, ?, ?, ?, ?, ?)",
+                        (filing_key, form, filing_date, section, len(tokens), passage)
+                    )
+                    for term, frequency in Counter(tokens).items():
+                        term_entries[term].extend((cursor.lastrowid, frequency))
+                    count += 1
+
+            postings = self._read_postings(conn, term_entries)
+            for term, entries in term_entries.items():
+                merged = postings.get(term, array("I"))
+                merged.extend(entries)
+                conn.execute(
+                    "INSERT OR REPLACE INTO postings (term, entries) VALUES (?, ?)", (term, merged.tobytes())
+                )
+            conn.commit()
+        print(f"Indexed {count} passages of {filing_key}")
+        return count
+
+    def _remove_filing(self, conn, filing_key):
+        rows = conn.execute("SELECT id, text FROM passages WHERE filing_key = ?", (filing_key,)).fetchall()
+        if not rows:
+            return
+        removed = {row[0] for row in rows}
+        terms = {term for _, text in rows for term in tokenize(text)}
+        for term, entries in self._read_postings(conn, terms).items():
+            kept = array("I")
+            for idx in range(0, len(entries), 2):
+                if entries[idx] not in removed:
+                    kept.extend(entries[idx:idx + 2])
+            if kept:
+                conn.execute("UPDATE postings SET entries = ? WHERE term = ?", (kept.tobytes(), term))
+            else:
+                conn.execute("DELETE FROM postings WHERE term = ?", (term,))
+        conn.execute("DELETE FROM passages WHERE filing_key = ?", (filing_key,))
+
+    def search(self, cik, query, forms=None, start_date=None, end_date=None, top_k=8):
+        """
+        Ranks a company's passages against a query with BM25.
+
+        Args:
+            cik (str): Company CIK.
+            query (str): Search terms.
+            forms (list, optional): Only return passages from these forms.
+            start_date (str, optional): Only return passages filed on or after this date (YYYY-MM-DD).
+            end_date (str, optional): Only return passages filed on or before this date (YYYY-MM-DD).
+            top_k (int): Number of passages to return.
+
+        Returns:
+            list: Passages ({'form', 'filing_date', 'section', 'text', 'score'}), best first.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            conn = self._conn(cik)
+            total, average_length = conn.execute("SELECT COUNT(*), AVG(length) FROM passages").fetchone()
+            if not total:
+                return []
+            postings = self._read_postings(conn, terms)
+
+            scores = defaultdict(float)
+            lengths = {}
+            for term, entries in postings.items():
+                ids, frequencies = entries[0::2], entries[1::2]
+                idf = math.log(1 + (total - len(ids) + 0.5) / (len(ids) + 0.5))
+                missing = [passage_id for passage_id in ids if passage_id not in lengths]
+                for start in range(0, len(missing), 500):
+                    batch = missing[start:start + 500]
+                    lengths.update(conn.execute(
+                        f"SELECT id, length FROM passages WHERE id IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall())
+                for passage_id, frequency in zip(ids, frequencies):
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[passage_id] / average_length)
+                    scores[passage_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+            results = []
+            # Filters are applied in rank order so only the passages returned are loaded.
+            for passage_id in sorted(scores, key=scores.get, reverse=True):
+                form, filing_date, section, text = conn.execute(
+                    "SELECT form, filing_date, section, text FROM passages WHERE id = ?", (passage_id,)
+                ).fetchone()
+                if forms and form not in forms:
+                    continue
+                if (start_date and filing_date < start_date) or (end_date and filing_date > end_date):
+                    continue
+                results.append({
+                    "form": form,
+                    "filing_date": filing_date,
+                    "section": section,
+                    "text": text,
+                    "score": scores[passage_id],
+                })
+                if len(results) >= top_k:
+                    break
+        return results
+
+
+text_index = TextIndex(os.path.join(CACHE_DIR, "text_index"))
@@ -1,3 +1,5 @@
+import copy
+from ci_agent.utils.financials import SUPPORTED_METRICS
 from ci_agent.utils.mappings import section_enums_mappings, tenq_section_enum_mappings
 
 tools = [
@@ -229,6 +231,86 @@ tools = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "compare_financial_metrics",
+            "description": "Compare financial metrics (values, growth versus the prior period and ratios such as margins) across the last N fiscal quarters (three-month values from 10-Qs, Q4 derived from the 10-K) or years (10-K). Prefer this over retrieving full financial statements for trend questions.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "metrics": {
+                        "type": "array",
+                        "items": {
+                            "type": "string",
+                            "enum": SUPPORTED_METRICS,
+                            "description": "Metric to compare."
+                        },
+                        "description": "List of metrics to compare."
+                    },
+                    "period_type": {
+                        "type": "string",
+                        "enum": ["quarterly", "annual"],
+                        "description": "Compare quarterly (10-Q) or annual (10-K) filings."
+                    },
+                    "periods": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "description": "Number of most recent periods to compare."
+                    }
+                },
+                "required": ["metrics", "period_type"],
+                "additionalProperties": False
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_filing_text",
+            "description": "Full-text search over the raw text of 10-K, 10-Q and 8-K filings. Returns short passages with their source. Use this for pinpoint facts that summaries may omit, such as named customers, litigation case numbers, specific products or contract terms.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Keywords to search for (names, identifiers, distinctive terms)."
+                    },
+                    "document_types": {
+                        "type": "array",
+                        "items": {
+                            "type": "string",
+                            "enum": ["10-K", "10-Q", "8-K"]
+                        },
+                        "description": "Only search these filing types. Leave empty to search all of them."
+                    },
+                    "date_range": {
+                        "type": "object",
+                        "properties": {
+                            "start_date": {
+                                "type": "string",
+                                "format": "date",
+                                "description": "Start date for the range (YYYY-MM-DD)."
+                            },
+                            "end_date": {
+                                "type": "string",
+                                "format": "date",
+                                "description": "End date for the range (YYYY-MM-DD)."
+                            }
+                        },
+                        "required": ["start_date", "end_date"],
+                        "description": "Only search filings filed within this date range."
+                    },
+                    "top_k": {
+                        "type": "integer",
+                        "description": "Number of passages to return (default 8)."
+                    }
+                },
+                "required": ["query"],
+                "additionalProperties": False
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -280,3 +362,28 @@ tools = [
     }
 ]
 
+
+def company_scoped_tools(company_names):
+    """
+    Copies of the retrieval tools that take a `companies` parameter, for agents covering
+    several companies. Each call is run once per listed company.
+
+    Args:
+        company_names (list): Names the model may pass in `companies`.
+
+    Returns:
+        list: Tool schemas in the same format as `tools`.
+    """
+    scoped = copy.deepcopy(tools)
+    for tool in scoped:
+        parameters = tool["function"]["parameters"]
+        parameters["properties"]["companies"] = {
+            "type": "array",
+            "items": {
+                "type": "string",
+                "enum": list(company_names)
+            },
+            "description": "Companies to retrieve this information for. Request several companies in one call when comparing them."
+        }
+        parameters["required"] = ["companies"] + parameters.get("required", [])
+    return scoped
@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from ci_agent.config import CACHE_DIR, FINANCIALS_CACHE_MAX_BYTES, XBRL_WORKERS
+from ci_agent.services.raw_filings import accession_number, base_filing, raw_filing_cache
+from ci_agent.utils.diskcache import DiskCache
+from ci_agent.utils.financials import COLUMNAR_VERSION, extract_financials
+
+
+# XBRL documents of a filing that the statements are parsed from, by edgartools doc type.
+XBRL_DOCUMENT_TYPES = ("instance", "schema", "label", "calculation", "presentation")
+
+
+def _extract_in_process(filing):
+    financials = getattr(filing, "financials", None)
+    return extract_financials(financials) if financials else {}
+
+
+def fetch_xbrl_documents(filing):
+    """
+    Downloads the XBRL documents of a filing (what edgartools fetches for its financials).
+
+    Returns:
+        dict: Doc type -> document text ({} if the filing has no XBRL).
+    """
+    from edgar.xbrl.xbrldata import XBRLAttachments
+    attachments = XBRLAttachments(base_filing(filing).attachments)
+    if attachments.empty or attachments.instance_only:
+        return {}
+    documents = {}
+    for doc_type in XBRL_DOCUMENT_TYPES:
+        attachment = attachments.get(doc_type)
+        if attachment is not None:
+            content = attachment.download()
+            documents[doc_type] = content.decode("utf-8") if isinstance(content, bytes) else content
+    return documents
+
+
+def _extract_from_documents(documents):
+    """
+    Worker process task: parses already downloaded XBRL documents and extracts the
+    statements, the way edgartools' XBRLData.from_filing does after downloading them.
+    """
+    if not documents.get("instance"):
+        return {}
+    from edgar.financials import Financials
+    from edgar.xbrl.calculations import CalculationLinkbase
+    from edgar.xbrl.labels import parse_label_linkbase
+    from edgar.xbrl.xbrldata import XBRLAttachments, XBRLData
+    # Filings without separate linkbase documents embed them in the schema.
+    embedded = XBRLAttachments.extract_embedded_linkbases(documents["schema"])["linkbases"] if documents.get("schema") else {}
+    label = documents.get("label") or embedded.get("label")
+    calculation = documents.get("calculation") or embedded.get("calculation")
+    xbrl_data = XBRLData.parse(
+        instance_xml=documents["instance"],
+        presentation_xml=documents.get("presentation") or embedded.get("presentation", ""),
+        labels=parse_label_linkbase(label) if label else {},
+        calculations=CalculationLinkbase.parse(calculation) if calculation else None
+    )
+    return extract_financials(Financials(xbrl_data))
+
+
+class XBRLExtractor:
+    """
+    Extracts the financial statements of filings in worker processes, cached on disk by
+    accession number.
+
+    The XBRL documents are read through the raw filing cache on a thread of this process
+    and handed to the worker as text, so the worker never contacts EDGAR. Parsing them and converting the
+    statements is CPU bound pandas work, so it runs in a process pool while the ingesting
+    thread generates the section summaries. A filing's content never changes under its
+    accession number, so re-ingests and rewrites are served from the cache without any
+    parsing.
+    """
+    def __init__(self, cache, max_workers=XBRL_WORKERS):
+        self.cache = cache
+        self.max_workers = max_workers
+        self._executor = None
+        self._fetcher = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="xbrl-fetch")
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Forking a process that runs an event loop and thread pools is unsafe.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def submit(self, filing):
+        """
+        Starts extracting the financials of a filing.
+
+        Args:
+            filing (object): The edgartools 10-K / 10-Q object being ingested.
+
+        Returns:
+            Future: Resolves to the stored financials map (statement type -> columnar blob);
+                    pass it to result().
+        """
+        accession = accession_number(filing)
+        future = Future()
+        if accession is None:
+            # The worker could not load the filing; extract in the caller instead.
+            future.set_result(None)
+            return future
+        # Statements extracted in an older storage format are not reused.
+        key = f"{accession}:v{COLUMNAR_VERSION}"
+        cached = self.cache.get(key)
+        if cached is not None:
+            future.set_result(cached)
+            return future
+        future = self._fetcher.submit(self._fetch_and_extract, filing)
+        future.add_done_callback(lambda done: self._store(key, done))
+        return future
+
+    def _fetch_and_extract(self, filing):
+        # Through the raw filing cache, so the documents are downloaded once per host.
+        documents = raw_filing_cache.get(filing, "xbrl", lambda: fetch_xbrl_documents(filing))
+        if not documents:
+            return {}
+        return self._pool().submit(_extract_from_documents, documents).result()
+
+    def _store(self, key, future):
+        # Empty results are not cached: they may come from a transient fetch failure.
+        if not future.cancelled() and future.exception() is None and future.result():
+            self.cache.set(key, future.result())
+
+    def result(self, future, filing):
+        """
+        Waits for a submitted extraction, falling back to extracting in this process if the
+        worker failed or could not be used.
+
+        Returns:
+            dict: Statement type -> columnar blob ({} if the filing has no financials).
+        """
+        try:
+            financials = future.result()
+        except Exception as e:
+            print(f"XBRL extraction in worker failed ({type(e).__name__}: {e}); extracting in process")
+            financials = None
+        return _extract_in_process(filing) if financials is None else financials
+
+
+xbrl_extractor = XBRLExtractor(
+    DiskCache(os.path.join(CACHE_DIR, "financials.sqlite3"), FINANCIALS_CACHE_MAX_BYTES)
+)
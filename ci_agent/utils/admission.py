@@ -0,0 +1,126 @@
+import asyncio
+import itertools
+from collections import Counter
+from ci_agent.utils.metrics import metrics
+
+
+class FairSemaphore:
+    """
+    Asyncio semaphore with per-user fairness.
+
+    Free slots go to the waiting user holding the fewest slots (earliest request first
+    among equals), so one user with many connections or queued turns cannot starve
+    others. An optional per-user limit caps how many slots a single user can hold.
+    Waiters can be told their position in line, and the number of holders and waiters
+    is published as gauges ('<name>_active' and '<name>_queue_depth').
+
+    Must only be used from the event loop thread.
+    """
+    def __init__(self, name, capacity, per_user_limit=None):
+        self.name = name
+        self.capacity = capacity
+        self.per_user_limit = per_user_limit
+        self._active = Counter()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._publish()
+
+    @property
+    def active(self):
+        return sum(self._active.values())
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    def _publish(self):
+        metrics.set_gauge(f"{self.name}_active", self.active)
+        metrics.set_gauge(f"{self.name}_queue_depth", self.queue_depth)
+
+    def _eligible(self, user_id):
+        return self.per_user_limit is None or self._active[user_id] < self.per_user_limit
+
+    def _order(self):
+        """Waiters in the order they would be granted a slot."""
+        return sorted(self._waiters, key=lambda waiter: (
+            not self._eligible(waiter["user_id"]), self._active[waiter["user_id"]], waiter["sequence"]
+        ))
+
+    def _dispatch(self):
+        """Grants free slots to waiters, then tells the rest their (new) positions."""
+        while self.active < self.capacity:
+            candidates = [waiter for waiter in self._order() if self._eligible(waiter["user_id"])]
+            if not candidates:
+                break
+            waiter = candidates[0]
+            self._waiters.remove(waiter)
+            self._active[waiter["user_id"]] += 1
+            waiter["future"].set_result(True)
+
+        for position, waiter in enumerate(self._order(), 1):
+            if waiter["position"] != position:
+                waiter["position"] = position
+                if waiter["on_position"] is not None:
+                    asyncio.create_task(waiter["on_position"](position))
+        self._publish()
+
+    async def acquire(self, user_id, on_position=None):
+        """
+        Waits for a slot.
+
+        Args:
+            user_id (str): The user requesting the slot.
+            on_position (coroutine function, optional): Awaited with the 1-based queue position
+                                                        whenever it changes while waiting.
+        """
+        if not self._waiters and self.active < self.capacity and self._eligible(user_id):
+            self._active[user_id] += 1
+            self._publish()
+            return
+
+        waiter = {
+            "user_id": user_id,
+            "sequence": next(self._sequence),
+            "future": asyncio.get_running_loop().create_future(),
+            "on_position": on_position,
+            "position": None,
+        }
+        self._waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter["future"]
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._dispatch()
+            elif waiter["future"].done() and not waiter["future"].cancelled():
+                # Granted just as the wait was cancelled; give the slot back.
+                self.release(user_id)
+            raise
+
+    def release(self, user_id):
+        """Returns a slot held by user_id."""
+        if self._active[user_id] <= 0:
+            return
+        self._active[user_id] -= 1
+        if not self._active[user_id]:
+            del self._active[user_id]
+        self._dispatch()
+
+    def slot(self, user_id, on_position=None):
+        """Async context manager holding a slot for the duration of the block."""
+        return _Slot(self, user_id, on_position)
+
+
+class _Slot:
+    def __init__(self, semaphore, user_id, on_position):
+        self.semaphore = semaphore
+        self.user_id = user_id
+        self.on_position = on_position
+
+    async def __aenter__(self):
+        await self.semaphore.acquire(self.user_id, self.on_position)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release(self.user_id)
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import re
+import numpy as np
+
+# Compiled once; _clean_markdown used to recompile these on every call.
+IMAGE_LINK_PATTERN = re.compile(r'!\[.*?\]\(.*?\)')  # Matches ![alt](url)
+INLINE_LINK_PATTERN = re.compile(r'\[.*?\]\(https?://.*?\)')  # Matches [text](url)
+STANDALONE_LINK_PATTERN = re.compile(r'^https?://\S+$')  # Matches full-line URLs
+RULE_PATTERN = re.compile(r'^-+$')  # Matches lines made only of dashes
+WORD_PATTERN = re.compile(r'\w+')
+YEAR_PATTERN = re.compile(r'\b(?:19|20)\d{2}\b')  # Copyright years and the like vary across pages
+
+SHINGLE_SIZE = 3
+SIMHASH_BITS = 64
+# Four 16-bit bands: two fingerprints within 3 bits of each other share at least one band.
+LSH_BANDS = 4
+# Candidates compared per band; keeps lookups constant time on pages full of similar lines.
+MAX_BUCKET_SIZE = 32
+
+
+def _line_digest(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+def iter_clean_lines(lines):
+    """
+    Cleans markdown lines in a single pass.
+
+    Removes image and inline links, blank and rule-only lines and standalone URLs,
+    strips whitespace and drops exact duplicate lines. Only 8-byte digests of the lines
+    seen so far are kept, so memory stays small even for multi-MB pages.
+
+    Args:
+        lines (Iterable[str]): Markdown lines (a file object or io.StringIO works).
+
+    Yields:
+        str: Cleaned lines.
+    """
+    seen = set()
+    for line in lines:
+        line = IMAGE_LINK_PATTERN.sub('', line)
+        line = INLINE_LINK_PATTERN.sub('', line).strip()
+        if not line or RULE_PATTERN.match(line) or STANDALONE_LINK_PATTERN.match(line):
+            continue
+        digest = _line_digest(line)
+        if digest in seen:
+            continue
+        seen.add(digest)
+        yield line
+
+
+def clean_markdown(markdown_text):
+    """Cleans a markdown page (see iter_clean_lines)."""
+    return '\n'.join(iter_clean_lines(io.StringIO(markdown_text)))
+
+
+def simhash(text):
+    """
+    64-bit simhash of a text block over word shingles.
+
+    Near-duplicate blocks (e.g. a footer whose year or a nav bar whose active item
+    differs) get fingerprints a few bits apart.
+
+    Returns:
+        int: The fingerprint.
+    """
+    words = WORD_PATTERN.findall(YEAR_PATTERN.sub('yyyy', text.lower()))
+    if not words:
+        return 0
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[idx:idx + SHINGLE_SIZE]) for idx in range(len(words) - SHINGLE_SIZE + 1)]
+
+    digests = np.frombuffer(b"".join(_line_digest(shingle) for shingle in shingles), dtype=np.uint8)
+    bits = np.unpackbits(digests).reshape(len(shingles), SIMHASH_BITS)
+    # Majority vote per bit position.
+    votes = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(votes).tobytes(), "big")
+
+
+def _bands(fingerprint):
+    width = SIMHASH_BITS // LSH_BANDS
+    mask = (1 << width) - 1
+    return [(band, (fingerprint >> (band * width)) & mask) for band in range(LSH_BANDS)]
+
+
+class BoilerplateFilter:
+    """
+    Learns the blocks (lines) that repeat across the pages of one site, allowing small
+    variations, and removes them from pages.
+
+    Usage is two passes over a site's pages: observe() every page, then clean() each
+    one. Only fingerprints are kept, so memory is bounded by the number of distinct
+    blocks rather than the size of the site.
+    """
+    def __init__(self, min_pages=3, max_distance=3):
+        """
+        Args:
+            min_pages (int): A block seen on at least this many pages is boilerplate.
+            max_distance (int): Maximum Hamming distance between near-duplicate fingerprints.
+        """
+        self.min_pages = min_pages
+        self.max_distance = max_distance
+        self.pages_observed = 0
+        self._page_counts = {}
+        self._buckets = {}
+
+    def _cluster(self, fingerprint, create=False):
+        """Returns the representative fingerprint of the cluster a fingerprint belongs to."""
+        if fingerprint in self._page_counts:
+            return fingerprint
+        for key in _bands(fingerprint):
+            for candidate in self._buckets.get(key, ()):
+                if (candidate ^ fingerprint).bit_count() <= self.max_distance:
+                    return candidate
+        if not create:
+            return None
+        for key in _bands(fingerprint):
+            bucket = self._buckets.setdefault(key, [])
+            if len(bucket) < MAX_BUCKET_SIZE:
+                bucket.append(fingerprint)
+        self._page_counts[fingerprint] = 0
+        return fingerprint
+
+    def observe(self, markdown_text):
+        """Records the blocks of one page."""
+        clusters = {
+            self._cluster(simhash(line), create=True)
+            for line in io.StringIO(markdown_text)
+            if line.strip()
+        }
+        for cluster in clusters:
+            self._page_counts[cluster] += 1
+        self.pages_observed += 1
+
+    def is_boilerplate(self, line):
+        cluster = self._cluster(simhash(line))
+        return cluster is not None and self._page_counts[cluster] >= self.min_pages
+
+    def clean(self, markdown_text):
+        """Removes boilerplate lines from a page (headings are always kept)."""
+        return '\n'.join(
+            line for line in iter_clean_lines(io.StringIO(markdown_text))
+            if line.startswith('#') or not self.is_boilerplate(line)
+        )
@@ -0,0 +1,147 @@
+import argparse
+import zstandard
+from ci_agent.dependencies import public_companies_table
+
+# Stored blobs are b"ZS" + a one byte codec version + the zstd frame.
+CODEC_MAGIC = b"ZS"
+CODEC_VERSION = 1
+COMPRESSION_LEVEL = 10
+
+# Item attribute recording how the summaries of an item are encoded.
+ENCODING_ATTRIBUTE = "summary_encoding"
+ENCODING_TAG = f"zstd-v{CODEC_VERSION}"
+
+
+def encode_text(text):
+    """
+    Compress a summary string for storage as a DynamoDB binary attribute.
+
+    Args:
+        text (str): Summary or rendered statement text.
+
+    Returns:
+        bytes: Versioned, zstd-compressed blob.
+    """
+    compressed = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(text.encode("utf-8"))
+    return CODEC_MAGIC + bytes([CODEC_VERSION]) + compressed
+
+
+def decode_text(value):
+    """
+    Decode a stored summary, accepting both compressed blobs and legacy plain strings.
+
+    Args:
+        value (str | bytes | boto3.dynamodb.types.Binary | None): The stored attribute.
+
+    Returns:
+        str | None: The summary text.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    # boto3 wraps binary attributes in a Binary object.
+    raw = bytes(getattr(value, "value", value))
+    if raw[:2] != CODEC_MAGIC:
+        return raw.decode("utf-8")
+    version = raw[2]
+    if version != CODEC_VERSION:
+        raise ValueError(f"Unsupported summary codec version: {version}")
+    return zstandard.ZstdDecompressor().decompress(raw[3:]).decode("utf-8")
+
+
+def decode_section(summaries, key):
+    """
+    Decode a single 10-K / 10-Q section summary without touching the rest of the map.
+
+    Sections are stored as {'summary': <blob>}; very old items stored the text directly.
+
+    Returns:
+        str | None: The section summary, or None if the section is missing.
+    """
+    section = summaries.get(key)
+    if isinstance(section, dict):
+        section = section.get('summary')
+    return decode_text(section)
+
+
+def encode_summaries(summaries):
+    """
+    Encode a 10-K / 10-Q summaries map in place of its text values.
+
+    Args:
+        summaries (dict): {section: {'summary': str}, 'financials': {statement: str}}.
+
+    Returns:
+        dict: The same structure with every text value compressed.
+    """
+    encoded = {}
+    for key, value in summaries.items():
+        if key == "financials":
+            encoded[key] = {
+                statement: encode_text(text) if isinstance(text, str) else text
+                for statement, text in value.items()
+            }
+        elif isinstance(value, dict):
+            encoded[key] = {
+                **value,
+                'summary': encode_text(value['summary']) if isinstance(value.get('summary'), str) else value.get('summary'),
+            }
+        elif isinstance(value, str):
+            encoded[key] = {'summary': encode_text(value)}
+        else:
+            encoded[key] = value
+    return encoded
+
+
+def encode_item(item):
+    """
+    Encode the summary fields of a public_companies_table item.
+
+    Returns:
+        dict: A copy of the item with compressed summaries and the encoding tag set.
+    """
+    encoded = dict(item)
+    if isinstance(item.get('summary'), str):
+        encoded['summary'] = encode_text(item['summary'])
+    if 'summaries' in item:
+        encoded['summaries'] = encode_summaries(item['summaries'])
+    encoded[ENCODING_ATTRIBUTE] = ENCODING_TAG
+    return encoded
+
+
+def reencode_table(table=public_companies_table, dry_run=False):
+    """
+    Re-encode every legacy (uncompressed) item in the table.
+
+    Args:
+        table: The DynamoDB table to scan.
+        dry_run (bool): If True, only report what would be rewritten.
+
+    Returns:
+        int: The number of items rewritten.
+    """
+    rewritten = 0
+    scan_kwargs = {}
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            if item.get(ENCODING_ATTRIBUTE) == ENCODING_TAG:
+                continue
+            if not dry_run:
+                table.put_item(Item=encode_item(item))
+            rewritten += 1
+            print(f"Re-encoded {item['cik_filing_date']}")
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+    print(f"{'Would re-encode' if dry_run else 'Re-encoded'} {rewritten} item(s)")
+    return rewritten
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compress legacy summaries in public_companies_table.")
+    parser.add_argument("--dry-run", action="store_true", help="Report items without rewriting them.")
+    args = parser.parse_args()
+    reencode_table(dry_run=args.dry_run)
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+from ci_agent.config import CACHE_DIR
+from ci_agent.utils.cleaning import BoilerplateFilter
+
+# Query parameters that only track the visitor and never change page content.
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "ref", "_hsenc", "_hsmi"}
+
+# Links to these resources are not pages worth scraping.
+SKIPPED_EXTENSIONS = re.compile(
+    r"\.(?:pdf|jpe?g|png|gif|svg|webp|ico|css|js|json|xml|zip|gz|mp4|mp3|mov|avi|woff2?|ttf|eot)$",
+    re.IGNORECASE
+)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url, base=None):
+    """
+    Normalizes a URL for deduplication.
+
+    Lowercases the scheme and host, drops default ports, fragments and tracking
+    parameters, sorts the query string and collapses duplicate / trailing slashes.
+
+    Args:
+        url (str): Absolute or relative URL.
+        base (str, optional): URL to resolve relative links against.
+
+    Returns:
+        str | None: The normalized URL, or None if it is not an http(s) page.
+    """
+    if base:
+        url = urljoin(base, url)
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    netloc = parts.hostname.lower()
+    if parts.port and parts.port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{parts.port}"
+
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    if SKIPPED_EXTENSIONS.search(path):
+        return None
+
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def site_of(url):
+    """The site a URL belongs to, ignoring a leading 'www.'."""
+    host = urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CrawlStore:
+    """
+    Per-company store of crawled pages (cleaned markdown plus the metadata needed to
+    recrawl incrementally: content hash, outgoing links and origin cache validators).
+    """
+    def __init__(self, company, root=None):
+        slug = re.sub(r"[^a-z0-9]+", "-", company.lower()).strip("-")
+        directory = os.path.join(root or CACHE_DIR, "crawls")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{slug}.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                markdown TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                links TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                changed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, url):
+        """Returns the stored page record for url, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, markdown, content_hash, links, etag, last_modified, fetched_at, changed_at "
+                "FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "url": row[0],
+            "markdown": row[1],
+            "content_hash": row[2],
+            "links": json.loads(row[3]),
+            "etag": row[4],
+            "last_modified": row[5],
+            "fetched_at": row[6],
+            "changed_at": row[7],
+        }
+
+    def put(self, url, markdown, links, etag=None, last_modified=None):
+        """
+        Stores a freshly scraped page.
+
+        Returns:
+            str: 'new', 'changed' or 'unchanged' (same content hash as the stored copy).
+        """
+        digest = content_hash(markdown)
+        previous = self.get(url)
+        now = time.time()
+        if previous is None:
+            status = "new"
+        elif previous["content_hash"] == digest:
+            status = "unchanged"
+        else:
+            status = "changed"
+        changed_at = previous["changed_at"] if status == "unchanged" else now
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, markdown, content_hash, links, etag, last_modified, fetched_at, changed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, markdown, digest, json.dumps(links), etag, last_modified, now, changed_at),
+            )
+            self._conn.commit()
+        return status
+
+    def touch(self, url):
+        """Marks a page as verified unchanged (e.g. after a 304)."""
+        with self._lock:
+            self._conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+    def pages(self, changed_since=None):
+        """Iterates (url, markdown) of stored pages, optionally only those changed since a timestamp."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, markdown FROM pages WHERE changed_at >= ? ORDER BY url",
+                (changed_since or 0,)
+            ).fetchall()
+        yield from rows
+
+    def clean_pages(self, changed_since=None, min_pages=3):
+        """
+        Iterates (url, markdown) of stored pages with the site's boilerplate removed.
+
+        Navigation, footers, cookie banners and other blocks repeated (allowing small
+        variations) on at least min_pages pages of the site are dropped. Pages are
+        stored with their boilerplate so content hashes stay stable across recrawls;
+        the filter learns from every stored page, then streams the requested ones.
+        """
+        boilerplate = BoilerplateFilter(min_pages=min_pages)
+        for _, markdown in self.pages():
+            boilerplate.observe(markdown)
+        for url, markdown in self.pages(changed_since):
+            yield url, boilerplate.clean(markdown)
@@ -0,0 +1,450 @@
+import json
+import math
+import re
+from datetime import datetime as dt
+from ci_agent.utils.codec import decode_text
+
+# Statement types as exposed to the retrieval tools, mapped to the edgartools getter.
+STATEMENT_GETTERS = {
+    "balance sheet": "get_balance_sheet",
+    "income statement": "get_income_statement",
+    "cash flow statement": "get_cash_flow_statement",
+}
+
+# Non-period columns present on edgartools statement frames.
+META_COLUMNS = {"concept", "level", "style", "units", "decimals"}
+
+COLUMNAR_VERSION = 1
+
+# Metrics available to the comparison tool: statement type and candidate XBRL concepts
+# (local names, in order of preference, since filers tag revenue etc. differently).
+METRIC_CONCEPTS = {
+    "revenue": ("income statement", [
+        "Revenues",
+        "RevenueFromContractWithCustomerExcludingAssessedTax",
+        "SalesRevenueNet",
+        "RevenueFromContractWithCustomerIncludingAssessedTax",
+    ]),
+    "gross profit": ("income statement", ["GrossProfit"]),
+    "operating income": ("income statement", ["OperatingIncomeLoss"]),
+    "net income": ("income statement", ["NetIncomeLoss", "ProfitLoss"]),
+    "diluted eps": ("income statement", ["EarningsPerShareDiluted"]),
+    "research and development": ("income statement", ["ResearchAndDevelopmentExpense"]),
+    "cash from operations": ("cash flow statement", [
+        "NetCashProvidedByUsedInOperatingActivities",
+        "NetCashProvidedByUsedInOperatingActivitiesContinuingOperations",
+    ]),
+    "capital expenditures": ("cash flow statement", ["PaymentsToAcquirePropertyPlantAndEquipment"]),
+    "cash and equivalents": ("balance sheet", ["CashAndCashEquivalentsAtCarryingValue"]),
+    "total assets": ("balance sheet", ["Assets"]),
+    "total liabilities": ("balance sheet", ["Liabilities"]),
+    "stockholders equity": ("balance sheet", ["StockholdersEquity"]),
+}
+
+# Ratio metrics, computed as numerator / denominator of two base metrics.
+RATIO_METRICS = {
+    "gross margin": ("gross profit", "revenue"),
+    "operating margin": ("operating income", "revenue"),
+    "net margin": ("net income", "revenue"),
+    "capex to revenue": ("capital expenditures", "revenue"),
+    "operating cash flow margin": ("cash from operations", "revenue"),
+    "debt to equity": ("total liabilities", "stockholders equity"),
+}
+
+SUPPORTED_METRICS = list(METRIC_CONCEPTS.keys()) + list(RATIO_METRICS.keys())
+
+# Statements whose line items cover a span of time; the balance sheet is point in time.
+FLOW_STATEMENTS = {"income statement", "cash flow statement"}
+
+# Per-share metrics cannot be de-cumulated by subtraction since share counts change.
+NON_ADDITIVE_METRICS = {"diluted eps"}
+
+# Consecutive 10-Qs further apart than this straddle a fiscal year end.
+FISCAL_YEAR_GAP_DAYS = 135
+
+_DURATION_WORDS = {"three": 3, "six": 6, "nine": 9, "twelve": 12}
+
+
+def _to_number(value):
+    """
+    Coerce a statement cell to a number.
+
+    edgartools renders cells as display strings ("1,234", "(56)", "") or numbers
+    depending on the statement, so both forms are accepted.
+
+    Returns:
+        int | float | None: The numeric value, or None for blank / non-numeric cells.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        return int(value) if float(value).is_integer() else float(value)
+
+    text = str(value).strip().replace(",", "").replace("$", "")
+    if not text or text in {"-", "—", "nan", "None"}:
+        return None
+    negative = text.startswith("(") and text.endswith(")")
+    text = text.strip("()")
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    if negative:
+        number = -number
+    return int(number) if number.is_integer() else number
+
+
+def statement_to_columnar(data):
+    """
+    Convert an edgartools statement DataFrame into the columnar storage form.
+
+    Args:
+        data (pd.DataFrame): Statement data indexed by line item label, with a 'concept'
+                             column and one column per reporting period.
+
+    Returns:
+        dict: {"v", "periods", "concept", "label", "values"} where values[i] is the
+              column of numbers for periods[i], aligned with concept/label.
+    """
+    periods = [str(col) for col in data.columns if col not in META_COLUMNS]
+    labels = [str(label) for label in data.index]
+    if "concept" in data.columns:
+        concepts = [str(c) if c is not None else "" for c in data["concept"]]
+    else:
+        concepts = labels
+
+    values = []
+    for period in periods:
+        values.append([_to_number(v) for v in data[period].tolist()])
+
+    return {
+        "v": COLUMNAR_VERSION,
+        "periods": periods,
+        "concept": concepts,
+        "label": labels,
+        "values": values,
+    }
+
+
+def dump_statement(statement):
+    """Serialize a columnar statement into the compact string blob stored in DynamoDB."""
+    return json.dumps(statement, separators=(",", ":"))
+
+
+def load_statement(blob):
+    """
+    Deserialize a stored statement blob.
+
+    Returns:
+        dict | None: The columnar statement, or None if the blob is a legacy markdown table.
+    """
+    if not is_columnar(blob):
+        return None
+    return json.loads(blob)
+
+
+def _local_concept(concept):
+    """Strip the taxonomy prefix from a concept name ('us-gaap_Revenues' -> 'Revenues')."""
+    return concept.rsplit(":", 1)[-1].split("_", 1)[-1]
+
+
+def statement_frame(blob):
+    """
+    Load a stored statement as a numeric DataFrame.
+
+    Returns:
+        pd.DataFrame | None: Concepts (local names) by periods, or None for legacy markdown.
+    """
+    # pandas is imported on first use; it is a large share of server startup time.
+    import numpy as np
+    import pandas as pd
+    statement = load_statement(blob)
+    if statement is None or not statement["periods"]:
+        return None
+    frame = pd.DataFrame(
+        np.array(statement["values"], dtype=float).T,
+        index=[_local_concept(concept) for concept in statement["concept"]],
+        columns=statement["periods"],
+    )
+    # Abstract rows can repeat a concept; keep the first occurrence.
+    return frame[~frame.index.duplicated()]
+
+
+def _period_months(period):
+    """
+    Duration in months named by a period label ('Three Months Ended ...', '9M 2024', 'Q2 2024').
+
+    Returns:
+        int | None: The duration, or None when the label is only a date.
+    """
+    text = str(period).lower()
+    for word, months in _DURATION_WORDS.items():
+        if f"{word} months" in text:
+            return months
+    match = re.search(r"\b(\d{1,2})\s*(?:m|mo|months?)\b", text)
+    if match:
+        return int(match.group(1))
+    if re.search(r"\bq[1-4]\b", text):
+        return 3
+    return None
+
+
+def _quarter_column(frame, statement_type):
+    """
+    Pick the current-quarter column of a 10-Q statement.
+
+    The first three-month column is used when the period labels name their durations.
+    Otherwise 10-Q cash flow statements are taken as year to date (they are only
+    reported that way) and income statements as leading with the three-month period.
+
+    Returns:
+        tuple: (column position, True if the column is year to date).
+    """
+    months = [_period_months(period) for period in frame.columns]
+    if 3 in months:
+        return months.index(3), False
+    if months[0] is not None:
+        return 0, months[0] > 3
+    return 0, statement_type == "cash flow statement"
+
+
+def _first_value(frame, candidates, column):
+    """Value of the first candidate concept reported in a column, or NaN."""
+    reported = frame.iloc[:, column].reindex(candidates).dropna()
+    return float(reported.iloc[0]) if len(reported) else math.nan
+
+
+def _filing_frames(filing, statement_types):
+    frames = {}
+    for statement_type in statement_types:
+        blob = decode_text(filing.get('summaries', {}).get('financials', {}).get(statement_type))
+        frames[statement_type] = statement_frame(blob) if blob else None
+    return frames
+
+
+def _quarterly_rows(filings, base_metrics, statement_types):
+    """
+    Three-month values per fiscal quarter from 10-Qs and the 10-Ks that close each year.
+
+    Quarters are numbered from the preceding 10-K (or a year-end gap between 10-Qs), and
+    a missing 10-Q leaves the position unknown until the next year starts.
+    Year-to-date columns are de-cumulated against the running total of the same fiscal
+    year, and each 10-K yields a Q4 row: the annual figure less the nine-month total.
+    Values that cannot be derived (no anchor, a missing quarter) are NaN.
+    """
+    rows = {}
+    year_to_date = {}
+    quarter = None
+    previous = None
+    for filing in filings:
+        frames = _filing_frames(filing, statement_types)
+        filing_date = filing['filing_date']
+        is_annual = filing.get('filing_type') != '10-Q'
+        gap = None
+        if previous is not None:
+            gap = (dt.strptime(filing_date, "%Y-%m-%d") - dt.strptime(previous['filing_date'], "%Y-%m-%d")).days
+        if is_annual:
+            current = 4
+        elif gap is None:
+            current = None
+        elif gap <= FISCAL_YEAR_GAP_DAYS:
+            # The next quarter; a 10-Q right after Q3 means the 10-K is missing.
+            current = quarter % 4 + 1 if quarter in (1, 2, 4) else None
+        elif quarter in (3, None) and gap <= 2 * FISCAL_YEAR_GAP_DAYS:
+            # Skipped over a fiscal year end without a stored 10-K.
+            current = 1
+        else:
+            # A 10-Q is missing, so the position in the fiscal year is unknown.
+            current = None
+
+        values = {}
+        for metric in base_metrics:
+            statement_type, candidates = METRIC_CONCEPTS[metric]
+            frame = frames[statement_type]
+            if frame is None:
+                values[metric] = math.nan
+                year_to_date[metric] = math.nan
+                continue
+            if statement_type not in FLOW_STATEMENTS:
+                values[metric] = _first_value(frame, candidates, 0)
+                continue
+
+            if current == 1:
+                prior = 0.0
+            elif current in (2, 3, 4) and quarter == current - 1:
+                prior = year_to_date.get(metric, math.nan)
+            else:
+                prior = math.nan
+            if metric in NON_ADDITIVE_METRICS:
+                prior = math.nan
+
+            if is_annual:
+                values[metric] = _first_value(frame, candidates, 0) - prior
+                continue
+            column, is_ytd = _quarter_column(frame, statement_type)
+            value = _first_value(frame, candidates, column)
+            if is_ytd:
+                values[metric] = value - prior if current != 1 else value
+                year_to_date[metric] = value
+            else:
+                values[metric] = value
+                year_to_date[metric] = prior + value
+
+        label = f"{filing_date} Q{current}" if current is not None else filing_date
+        rows[label] = values
+        quarter = current
+        previous = filing
+    return rows
+
+
+def metric_series(filings, metrics):
+    """
+    Align line items across filings and compute metric values, sequential growth and ratios.
+
+    Annual series (10-Ks only) use the current-period column of each filing. Quarterly
+    series compare three-month periods: year-to-date 10-Q columns are de-cumulated against
+    the prior quarter, and a Q4 row is derived from each 10-K as the annual figure less
+    the nine-month year to date. Balance sheet metrics are taken as reported.
+
+    Args:
+        filings (list): DynamoDB filing items with 'filing_date', 'filing_type' and 'summaries'.
+                        For quarterly series, pass the 10-Qs together with the 10-Ks closing
+                        each fiscal year, starting from the 10-K before the first quarter.
+        metrics (list): Names from SUPPORTED_METRICS.
+
+    Returns:
+        pd.DataFrame: One row per period (ascending) with one column per metric and, for
+                      non-ratio metrics, a '<metric> chg %' column. Quarterly rows are
+                      labelled '<filing date> Q<n>'.
+    """
+    import numpy as np
+    import pandas as pd
+    base_metrics = []
+    for metric in metrics:
+        needed = RATIO_METRICS.get(metric, (metric,))
+        base_metrics.extend(m for m in needed if m not in base_metrics)
+    statement_types = {METRIC_CONCEPTS[m][0] for m in base_metrics}
+
+    filings = sorted(filings, key=lambda filing: filing['filing_date'])
+    if any(filing.get('filing_type') == '10-Q' for filing in filings):
+        rows = _quarterly_rows(filings, base_metrics, statement_types)
+    else:
+        rows = {}
+        for filing in filings:
+            frames = _filing_frames(filing, statement_types)
+            rows[filing['filing_date']] = {
+                metric: (
+                    _first_value(frames[METRIC_CONCEPTS[metric][0]], METRIC_CONCEPTS[metric][1], 0)
+                    if frames[METRIC_CONCEPTS[metric][0]] is not None else math.nan
+                )
+                for metric in base_metrics
+            }
+    values = pd.DataFrame.from_dict(rows, orient="index", columns=base_metrics, dtype=float)
+
+    result = pd.DataFrame(index=values.index)
+    for metric in metrics:
+        if metric in RATIO_METRICS:
+            numerator, denominator = RATIO_METRICS[metric]
+            result[metric] = values[numerator] / values[denominator].replace(0, np.nan)
+        else:
+            result[metric] = values[metric]
+            result[f"{metric} chg %"] = values[metric].pct_change(fill_method=None) * 100
+    return result
+
+
+def render_metric_series(series):
+    """Render the output of metric_series as a compact markdown table."""
+    import pandas as pd
+    lines = [
+        "| Period | " + " | ".join(str(col) for col in series.columns) + " |",
+        "|---|" + "---|" * len(series.columns),
+    ]
+    for date, row in series.iterrows():
+        cells = []
+        for column, value in row.items():
+            if pd.isna(value):
+                cells.append("")
+            elif column.endswith("chg %"):
+                cells.append(f"{value:+.1f}%")
+            elif column in RATIO_METRICS:
+                cells.append(f"{value:.2f}" if column == "debt to equity" else f"{value * 100:.1f}%")
+            else:
+                cells.append(_format_number(float(value)))
+        lines.append(f"| {date} | " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+def is_columnar(blob):
+    """Returns True if a stored statement uses the columnar form rather than legacy markdown."""
+    return isinstance(blob, str) and blob.startswith('{"v":')
+
+
+def extract_financials(financials):
+    """
+    Build the stored financials map for a filing.
+
+    Args:
+        financials (Financials): The edgartools financials object of a 10-K / 10-Q.
+
+    Returns:
+        dict: Mapping of statement type to serialized columnar blob.
+    """
+    extracted = {}
+    for statement_type, getter in STATEMENT_GETTERS.items():
+        statement = getattr(financials, getter)()
+        if statement is None:
+            continue
+        extracted[statement_type] = dump_statement(statement_to_columnar(statement.data))
+    return extracted
+
+
+def _format_number(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:,.2f}"
+    return f"{int(value):,}"
+
+
+def render_statement(blob, periods=None, max_periods=None, concepts=None):
+    """
+    Render a stored statement as a trimmed markdown table.
+
+    Rows without any value in the selected periods are dropped and cells are not
+    padded, so the output is considerably smaller than DataFrame.to_markdown().
+
+    Args:
+        blob (str): Stored statement, either columnar or legacy markdown.
+        periods (list, optional): Period columns to include. Defaults to all.
+        max_periods (int, optional): Keep only the first N (most recent) periods.
+        concepts (list, optional): Restrict output to these XBRL concepts.
+
+    Returns:
+        str: Markdown table.
+    """
+    statement = load_statement(blob)
+    if statement is None:
+        # Legacy items still hold the pre-rendered markdown table.
+        return blob
+
+    columns = [
+        idx for idx, period in enumerate(statement["periods"])
+        if periods is None or period in periods
+    ]
+    if max_periods is not None:
+        columns = columns[:max_periods]
+
+    header = "| Line Item | " + " | ".join(statement["periods"][idx] for idx in columns) + " |"
+    rule = "|---|" + "---|" * len(columns)
+    lines = [header, rule]
+    wanted = set(concepts) if concepts else None
+    for row, (concept, label) in enumerate(zip(statement["concept"], statement["label"])):
+        if wanted is not None and concept not in wanted:
+            continue
+        cells = [statement["values"][idx][row] for idx in columns]
+        if all(cell is None for cell in cells):
+            continue
+        lines.append(f"| {label} | " + " | ".join(_format_number(cell) for cell in cells) + " |")
+    return "\n".join(lines)
@@ -1,48 +1,57 @@
-from datetime import datetime
-from ci_agent.dependencies import public_companies_table
-import datetime
 from datetime import datetime as dt
-from boto3.dynamodb.conditions import Key, Attr
-
-def retrieve_8K_documents(ent, retrieval_mode, date_range=None, latest_count=1):
-    # Query for filings of type '10-K' for this company via the GSI.
-    response = public_companies_table.query(
-        IndexName='cik-filing_date-index',
-        KeyConditionExpression=Key('cik').eq(str(ent.cik)),
-        FilterExpression=Attr('filing_type').eq('8-K')
-    )
-    items = response.get('Items', [])
-    
-    if not items:
-        return "No 8-K filings found."
+from ci_agent.services.filing_store import filing_store
+from ci_agent.services.text_index import text_index
+from ci_agent.utils.codec import decode_section, decode_text
+from ci_agent.utils.financials import SUPPORTED_METRICS, metric_series, render_metric_series, render_statement
 
-    sep ="\n" + ("*" * 50) + "\n"
+def _select_filings(ent, filing_type, retrieval_mode, date_range=None, latest_count=1, store=filing_store):
+    """
+    Select a company's filings of one type by date range or latest entries.
 
-    # Sort filings by filing_date in descending order.
-    sorted_filings = sorted(
-        items,
-        key=lambda item: dt.strptime(item['filing_date'], "%Y-%m-%d"),
-        reverse=True
-    )
+    Filings are listed without their summaries and only the selected items are fetched
+    in full through the filing store, which serves them from the local cache when it can.
+
+    Args:
+        filing_type (str): '10-K', '10-Q' or '8-K'.
+        retrieval_mode (str): Mode of retrieval, either 'date_range' or 'latest'.
+        date_range (dict, optional): For 'date_range' mode, a dict with "start_date" and "end_date".
+        latest_count (int, optional): Number of latest entries to retrieve if retrieval_mode is 'latest'.
+        store (FilingStore, optional): Where filings are read from (e.g. an agent's session store).
+
+    Returns:
+        list | None: The selected filing items, most recent first, or None if the company
+                     has no filings of this type.
+    """
+    stubs = store.list_filings(ent.cik, filing_type)
+    if not stubs:
+        return None
 
     if retrieval_mode == 'latest':
-        selected_filings = sorted_filings[:latest_count]
+        selected = stubs[:latest_count]
     elif retrieval_mode == 'date_range' and date_range:
         start_date = dt.strptime(date_range["start_date"], "%Y-%m-%d")
         end_date = dt.strptime(date_range["end_date"], "%Y-%m-%d")
-        selected_filings = [
-            item for item in sorted_filings 
-            if start_date <= dt.strptime(item['filing_date'], "%Y-%m-%d") <= end_date
+        selected = [
+            stub for stub in stubs
+            if start_date <= dt.strptime(stub['filing_date'], "%Y-%m-%d") <= end_date
         ]
     else:
         raise ValueError("Invalid retrieval_mode or missing date_range")
-    
+
+    return store.get_items([stub['cik_filing_date'] for stub in selected])
+
+def retrieve_8K_documents(ent, retrieval_mode, date_range=None, latest_count=1, store=filing_store):
+    selected_filings = _select_filings(ent, '8-K', retrieval_mode, date_range, latest_count, store)
+    if selected_filings is None:
+        return "No 8-K filings found."
+
+    sep = "\n" + ("*" * 50) + "\n"
     return "".join([
-        f"##8-K Summary from {item['filing_date']}\n\n{item['summary']}{sep}"
+        f"##8-K Summary from {item['filing_date']}\n\n{decode_text(item['summary'])}{sep}"
         for item in selected_filings
     ])
 
-def retrieve_10K_sections(ent, sections, retrieval_mode, date_range=None, latest_count=1):
+def retrieve_10K_sections(ent, sections, retrieval_mode, date_range=None, latest_count=1, store=filing_store):
     """
     Retrieve specific sections of 10-K summaries by date range or latest entries.
     
@@ -55,35 +64,9 @@ def retrieve_10K_sections(ent, sections, retrieval_mode, date_range=None, latest
     Returns:
         str: Formatted string containing the requested 10-K sections.
     """
-    # Query for filings of type '10-K' for this company via the GSI.
-    response = public_companies_table.query(
-        IndexName='cik-filing_date-index',
-        KeyConditionExpression=Key('cik').eq(str(ent.cik)),
-        FilterExpression=Attr('filing_type').eq('10-K')
-    )
-    items = response.get('Items', [])
-    
-    if not items:
+    selected_filings = _select_filings(ent, '10-K', retrieval_mode, date_range, latest_count, store)
+    if selected_filings is None:
         return "No 10-K filings found."
-
-    # Sort filings by filing_date in descending order.
-    sorted_filings = sorted(
-        items,
-        key=lambda item: dt.strptime(item['filing_date'], "%Y-%m-%d"),
-        reverse=True
-    )
-    
-    if retrieval_mode == 'latest':
-        selected_filings = sorted_filings[:latest_count]
-    elif retrieval_mode == 'date_range' and date_range:
-        start_date = dt.strptime(date_range["start_date"], "%Y-%m-%d")
-        end_date = dt.strptime(date_range["end_date"], "%Y-%m-%d")
-        selected_filings = [
-            item for item in sorted_filings 
-            if start_date <= dt.strptime(item['filing_date'], "%Y-%m-%d") <= end_date
-        ]
-    else:
-        raise ValueError("Invalid retrieval_mode or missing date_range")
     
     sep = "\n" + ("*" * 50) + "\n"
     return _format_10K_sections(selected_filings, sections, sep)
@@ -120,7 +103,7 @@ def _format_10K_sections(filings, sections, sep):
         parts = [f"## 10-K Filing Date: {filing_date}"]
         for key in section_keys:
             if key in summaries:
-                summary_text = summaries.get('key', 'Summary not available')
+                summary_text = decode_section(summaries, key) or 'Summary not available'
                 parts.append(f"### {key}\n\n{summary_text}")
             else:
                 parts.append(f"### {key}\n\nSection not found.")
@@ -129,7 +112,7 @@ def _format_10K_sections(filings, sections, sep):
     return sep.join(results)
 
 
-def retrieve_10Q_sections(ent, sections, retrieval_mode, date_range=None, latest_count=1):
+def retrieve_10Q_sections(ent, sections, retrieval_mode, date_range=None, latest_count=1, store=filing_store):
     """
     Retrieve specific sections of 10-Q summaries by date range or latest entries.
     
@@ -142,36 +125,10 @@ def retrieve_10Q_sections(ent, sections, retrieval_mode, date_range=None, latest
     Returns:
         str: Formatted string containing the requested 10-Q sections.
     """
-    # Query for filings of type '10-Q' for this company via the GSI.
-    response = public_companies_table.query(
-        IndexName='cik-filing_date-index',
-        KeyConditionExpression=Key('cik').eq(str(ent.cik)),
-        FilterExpression=Attr('filing_type').eq('10-Q')
-    )
-    items = response.get('Items', [])
-    
-    if not items:
+    selected_filings = _select_filings(ent, '10-Q', retrieval_mode, date_range, latest_count, store)
+    if selected_filings is None:
         return "No 10-Q filings found."
     
-    # Sort filings by filing_date in descending order.
-    sorted_filings = sorted(
-        items,
-        key=lambda item: dt.strptime(item['filing_date'], "%Y-%m-%d"),
-        reverse=True
-    )
-    
-    if retrieval_mode == 'latest':
-        selected_filings = sorted_filings[:latest_count]
-    elif retrieval_mode == 'date_range' and date_range:
-        start_date = dt.strptime(date_range["start_date"], "%Y-%m-%d")
-        end_date = dt.strptime(date_range["end_date"], "%Y-%m-%d")
-        selected_filings = [
-            item for item in sorted_filings
-            if start_date <= dt.strptime(item['filing_date'], "%Y-%m-%d") <= end_date
-        ]
-    else:
-        raise ValueError("Invalid retrieval_mode or missing date_range")
-    
     sep = "\n" + ("*" * 50) + "\n"
     return _format_10Q_sections(selected_filings, sections, sep)
 
@@ -202,11 +159,11 @@ def _format_10Q_sections(filings, sections, sep):
         for key in section_keys:
             if key in summaries:
                 # Look up the requested section in the summaries.
-                section_content = summaries.get(key, 'No data available.')
+                section_content = decode_section(summaries, key) or 'No data available.'
                 results.append(f"## Section: {key} from {filing_date}\n\n{section_content}{sep}")
     return "".join(results)
 
-def retrieve_10K_financial_statement(ent, statement_type, retrieval_mode, date_range=None, latest_count=1):
+def retrieve_10K_financial_statement(ent, statement_type, retrieval_mode, date_range=None, latest_count=1, store=filing_store):
     """
     Retrieve specific financial statements (balance sheet, income statement, or cash flow statement)
     from 10-K filings by date range or latest entries.
@@ -222,41 +179,15 @@ def retrieve_10K_financial_statement(ent, statement_type, retrieval_mode, date_r
     Returns:
         str: Formatted string containing the requested financial statements.
     """
-    # Query filings for this company of type "10-K" using the GSI.
-    response = public_companies_table.query(
-        IndexName='cik-filing_date-index',
-        KeyConditionExpression=Key('cik').eq(str(ent.cik)),
-        FilterExpression=Attr('filing_type').eq('10-K')
-    )
-    items = response.get('Items', [])
-    if not items:
+    selected_filings = _select_filings(ent, '10-K', retrieval_mode, date_range, latest_count, store)
+    if selected_filings is None:
         return "No 10-K filings found."
     
-    # Sort filings by filing_date in descending order.
-    sorted_filings = sorted(
-        items,
-        key=lambda item: dt.strptime(item['filing_date'], "%Y-%m-%d"),
-        reverse=True
-    )
-    
-    # Filter by retrieval mode.
-    if retrieval_mode == 'latest':
-        selected_filings = sorted_filings[:latest_count]
-    elif retrieval_mode == 'date_range' and date_range:
-        start_date = dt.strptime(date_range["start_date"], "%Y-%m-%d")
-        end_date = dt.strptime(date_range["end_date"], "%Y-%m-%d")
-        selected_filings = [
-            filing for filing in sorted_filings
-            if start_date <= dt.strptime(filing['filing_date'], "%Y-%m-%d") <= end_date
-        ]
-    else:
-        raise ValueError("Invalid retrieval_mode or missing date_range")
-    
     sep = "\n" + ("*" * 50) + "\n"
     return _format_financials(selected_filings, statement_type, sep)
 
 
-def retrieve_10Q_financial_statement(ent, statement_type, retrieval_mode, date_range=None, latest_count=1):
+def retrieve_10Q_financial_statement(ent, statement_type, retrieval_mode, date_range=None, latest_count=1, store=filing_store):
     """
     Retrieve specific financial statements (balance sheet, income statement, or cash flow statement)
     from 10-Q filings by date range or latest entries.
@@ -272,36 +203,10 @@ def retrieve_10Q_financial_statement(ent, statement_type, retrieval_mode, date_r
     Returns:
         str: Formatted string containing the requested financial statements.
     """
-    # Query filings for this company of type "10-Q" using the GSI.
-    response = public_companies_table.query(
-        IndexName='cik-filing_date-index',
-        KeyConditionExpression=Key('cik').eq(str(ent.cik)),
-        FilterExpression=Attr('filing_type').eq('10-Q')
-    )
-    items = response.get('Items', [])
-    if not items:
+    selected_filings = _select_filings(ent, '10-Q', retrieval_mode, date_range, latest_count, store)
+    if selected_filings is None:
         return "No 10-Q filings found."
     
-    # Sort filings by filing_date in descending order.
-    sorted_filings = sorted(
-        items,
-        key=lambda item: dt.strptime(item['filing_date'], "%Y-%m-%d"),
-        reverse=True
-    )
-    
-    # Filter by retrieval mode.
-    if retrieval_mode == 'latest':
-        selected_filings = sorted_filings[:latest_count]
-    elif retrieval_mode == 'date_range' and date_range:
-        start_date = dt.strptime(date_range["start_date"], "%Y-%m-%d")
-        end_date = dt.strptime(date_range["end_date"], "%Y-%m-%d")
-        selected_filings = [
-            filing for filing in sorted_filings
-            if start_date <= dt.strptime(filing['filing_date'], "%Y-%m-%d") <= end_date
-        ]
-    else:
-        raise ValueError("Invalid retrieval_mode or missing date_range")
-    
     sep = "\n" + ("*" * 50) + "\n"
     return _format_financials(selected_filings, statement_type, sep)
 
@@ -323,13 +228,115 @@ def _format_financials(filings, statement_type, sep):
         filing_date = filing.get('filing_date', 'Unknown Date')
         # In our new schema, financial statements are stored inside filing['summaries']['financials'].
         financials = filing.get('summaries', {}).get('financials', {})
-        statement = financials.get(statement_type)
+        statement = decode_text(financials.get(statement_type))
         if statement:
             formatted_output.append(
-                f"## Financial Statement: {statement_type.title()} from {filing_date}\n\n{statement}{sep}"
+                f"## Financial Statement: {statement_type.title()} from {filing_date}\n\n{render_statement(statement)}{sep}"
             )
         else:
             formatted_output.append(
                 f"## Financial Statement: {statement_type.title()} from {filing_date}\n\nNo data available.{sep}"
             )
-    return "".join(formatted_output)
\ No newline at end of file
+    return "".join(formatted_output)
+
+def compare_financial_metrics(ent, metrics, period_type="quarterly", periods=4, store=filing_store):
+    """
+    Compare financial metrics across the most recent 10-Q or 10-K filings.
+
+    Line items are aligned across the stored financial statements and growth rates and
+    ratios are computed in pandas, so only a compact series table is returned instead of
+    every full statement.
+
+    Args:
+        metrics (list): Metrics to compare (see financials.SUPPORTED_METRICS).
+        period_type (str): 'quarterly' for 10-Q filings or 'annual' for 10-K filings.
+        periods (int): Number of most recent filings to include.
+
+    Returns:
+        str: Formatted table with one row per filing.
+    """
+    if period_type not in ("quarterly", "annual"):
+        raise ValueError("period_type must be either 'quarterly' or 'annual'")
+    unknown = [metric for metric in metrics if metric not in SUPPORTED_METRICS]
+    if unknown:
+        raise ValueError(f"Unsupported metrics: {unknown}")
+    # The model may pass 0 or a negative count; compare at least the latest period.
+    periods = max(1, int(periods))
+
+    if period_type == "annual":
+        selected_filings = _select_filings(ent, "10-K", "latest", latest_count=periods, store=store)
+        if selected_filings is None:
+            return "No 10-K filings found."
+        series = metric_series(selected_filings, metrics)
+        return (
+            f"## {', '.join(metric.title() for metric in metrics)} across the last "
+            f"{len(selected_filings)} 10-K filings (chg % is versus the prior year)\n\n"
+            f"{render_metric_series(series)}"
+        )
+
+    selected_filings = _quarterly_filings(ent, periods, store)
+    if selected_filings is None:
+        return "No 10-Q filings found."
+    series = metric_series(selected_filings, metrics).iloc[-periods:]
+    return (
+        f"## {', '.join(metric.title() for metric in metrics)} across the last "
+        f"{len(series)} fiscal quarters (three-month values; Q4 is the 10-K less the "
+        f"nine-month year to date; chg % is versus the prior quarter)\n\n"
+        f"{render_metric_series(series)}"
+    )
+
+def _quarterly_filings(ent, periods, store=filing_store):
+    """
+    Select the filings covering a company's last N fiscal quarters.
+
+    10-Qs and 10-Ks are listed together since each 10-K stands for the fourth quarter.
+    The selection reaches back to the 10-K preceding the earliest quarter so that
+    quarters can be numbered and year-to-date values de-cumulated from a year start.
+
+    Returns:
+        list | None: The selected filing items, or None if the company has no 10-Q filings.
+    """
+    stubs = store.list_filings(ent.cik, "10-Q") + store.list_filings(ent.cik, "10-K")
+    if not any(stub['filing_type'] == "10-Q" for stub in stubs):
+        return None
+    stubs.sort(key=lambda stub: stub['filing_date'], reverse=True)
+
+    selected = stubs[:periods]
+    for stub in stubs[periods:]:
+        selected.append(stub)
+        if stub['filing_type'] == "10-K":
+            break
+    return store.get_items([stub['cik_filing_date'] for stub in selected])
+
+def search_filing_text(ent, query, document_types=None, date_range=None, top_k=8, store=filing_store):
+    """
+    Search the raw text of a company's filings for specific facts (named customers,
+    case numbers, product lines, etc.) that summaries may leave out.
+
+    Args:
+        query (str): Search terms.
+        document_types (list, optional): Only search these forms ('10-K', '10-Q', '8-K').
+        date_range (dict, optional): A dict with "start_date" and "end_date" (YYYY-MM-DD).
+        top_k (int, optional): Number of passages to return.
+        store (FilingStore, optional): Unused; accepted like the other retrieval tools (passages come from the text index).
+
+    Returns:
+        str: The best matching passages, each with its citation.
+    """
+    date_range = date_range or {}
+    passages = text_index.search(
+        ent.cik,
+        query,
+        forms=document_types,
+        start_date=date_range.get("start_date"),
+        end_date=date_range.get("end_date"),
+        top_k=top_k
+    )
+    if not passages:
+        return f"No passages found for '{query}'."
+
+    sep = "\n" + ("*" * 50) + "\n"
+    return "".join([
+        f"## Passage from {passage['form']}, {passage['section']}, {passage['filing_date']}\n\n{passage['text']}{sep}"
+        for passage in passages
+    ])
@@ -20,5 +20,7 @@ FUNCTION_MAPPINGS = {
     "retrieve_10K_sections": retrieve_10K_sections,
     "retrieve_10K_financial_statement" : retrieve_10K_financial_statement,
     "retrieve_10Q_sections": retrieve_10Q_sections,
-    "retrieve_10Q_financial_statement": retrieve_10Q_financial_statement
+    "retrieve_10Q_financial_statement": retrieve_10Q_financial_statement,
+    "compare_financial_metrics": compare_financial_metrics,
+    "search_filing_text": search_filing_text
 }
\ No newline at end of file
@@ -0,0 +1,64 @@
+import threading
+
+
+class Metrics:
+    """
+    Process-wide counters and gauges, exposed in the Prometheus text format at /metrics.
+
+    Series are identified by a name and optional labels, e.g.
+    metrics.increment("speculation_total", outcome="used").
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, help_text):
+        """Sets the help text of a metric."""
+        self._help[name] = help_text
+
+    def increment(self, name, value=1, **labels):
+        """Adds value to a counter."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """Sets a gauge to value."""
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def value(self, name, **labels):
+        """Current value of a counter or gauge (0 if never set)."""
+        key = self._key(name, labels)
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0))
+
+    def snapshot(self):
+        """Returns {'counters': {...}, 'gauges': {...}} keyed by (name, labels)."""
+        with self._lock:
+            return {"counters": dict(self._counters), "gauges": dict(self._gauges)}
+
+    def render(self):
+        """Renders all series in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for kind, series in (("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])):
+            described = set()
+            for (name, labels), value in sorted(series.items()):
+                if name not in described:
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    described.add(name)
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
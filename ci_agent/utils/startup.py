@@ -0,0 +1,99 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from ci_agent.config import STARTUP_TARGET_SECONDS
+
+
+def import_profile(module="ci_agent.main"):
+    """
+    Imports a module in a fresh interpreter with -X importtime.
+
+    Args:
+        module (str): The module to import.
+
+    Returns:
+        list: (module name, self seconds, cumulative seconds) for every module loaded.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    profile = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        profile.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return profile
+
+
+def render_import_profile(profile, module="ci_agent.main", top=25):
+    """Renders the slowest imports, by top level package and by module."""
+    total = next((cumulative for name, _, cumulative in profile if name == module), 0.0)
+    lines = [f"import {module}: {total:.3f}s", "", "Slowest packages (total of their modules):"]
+    packages = {}
+    for name, self_seconds, _ in profile:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + self_seconds
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"  {seconds:8.3f}s  {package}")
+    lines += ["", "Slowest modules (self):"]
+    for name, self_seconds, _ in sorted(profile, key=lambda item: -item[1])[:top]:
+        lines.append(f"  {self_seconds:8.3f}s  {name}")
+    return "\n".join(lines)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_cold_start(timeout=60):
+    """
+    Launches the production server (one worker) and times it until /health answers.
+
+    Returns:
+        float: Seconds from launch to the first successful /health response.
+    """
+    port = _free_port()
+    env = dict(os.environ, HOST="127.0.0.1", PORT=str(port), WEB_CONCURRENCY="1", ENV="production")
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "ci_agent.server"], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with status {process.returncode} before it was ready")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.02)
+        raise TimeoutError(f"/health did not answer within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report import times and cold start time of the API server.")
+    parser.add_argument("--module", default="ci_agent.main", help="Module to profile the import of.")
+    parser.add_argument("--top", type=int, default=25, help="Number of entries per table.")
+    parser.add_argument("--cold-start", action="store_true", help="Also time launching the server until /health answers.")
+    parser.add_argument("--target", type=float, default=STARTUP_TARGET_SECONDS, help="Cold start budget in seconds.")
+    args = parser.parse_args()
+
+    print(render_import_profile(import_profile(args.module), args.module, args.top))
+    if args.cold_start:
+        seconds = measure_cold_start()
+        print(f"\nCold start to first /health: {seconds:.3f}s (target {args.target:.1f}s)")
+        if seconds > args.target:
+            sys.exit(1)
@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+# Sent after the last frame of an answer so clients know the stream is complete.
+STREAM_END_MESSAGE = {
+    "MESSAGE_TYPE": "AGENT_STATUS",
+    "MESSAGE_SUBTYPE": "STREAM_END",
+    "PAYLOAD": ""
+}
+
+_END_OF_STREAM = object()
+
+
+class StreamConfig:
+    """
+    Per-session settings for coalescing streamed answer chunks into websocket frames.
+    """
+    def __init__(self, flush_bytes=64, flush_ms=30, max_pending_chunks=256):
+        """
+        Args:
+            flush_bytes (int): Send a frame once this many bytes are buffered.
+            flush_ms (int): Send a frame once the oldest buffered chunk is this old.
+            max_pending_chunks (int): Chunks buffered ahead of a slow client before the
+                                      upstream stream is paused.
+        """
+        self.flush_bytes = max(1, flush_bytes)
+        self.flush_interval = max(0, flush_ms) / 1000
+        self.max_pending_chunks = max(1, max_pending_chunks)
+
+
+class StreamCoalescer:
+    """
+    Forwards a (blocking) chunk generator to a websocket in coalesced frames.
+
+    The generator is drained on a worker thread into a bounded queue, so the event loop
+    is never blocked on the upstream stream and a slow client pauses the upstream read
+    instead of buffering the whole answer in memory.
+    """
+    def __init__(self, websocket, config=None):
+        self.websocket = websocket
+        self.config = config or StreamConfig()
+        self.frames_sent = 0
+        self._stopped = False
+
+    async def stream(self, generator):
+        """
+        Sends every chunk of the generator, then the stream end marker.
+
+        Args:
+            generator (Generator[str]): Answer chunks, e.g. from Agent.chat(streaming=True).
+
+        Returns:
+            str: The full streamed text.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.config.max_pending_chunks)
+        producer = loop.run_in_executor(None, self._produce, generator, queue, loop)
+
+        sent = []
+        buffer = []
+        buffered_bytes = 0
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    chunk = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    chunk = None
+
+                if chunk is _END_OF_STREAM:
+                    break
+                if chunk:
+                    if not buffer:
+                        deadline = time.monotonic() + self.config.flush_interval
+                    buffer.append(chunk)
+                    buffered_bytes += len(chunk.encode("utf-8"))
+
+                if buffer and (buffered_bytes >= self.config.flush_bytes or time.monotonic() >= deadline):
+                    frame = "".join(buffer)
+                    await self._send(frame)
+                    sent.append(frame)
+                    buffer, buffered_bytes, deadline = [], 0, None
+
+            if buffer:
+                frame = "".join(buffer)
+                await self._send(frame)
+                sent.append(frame)
+            # Surface any exception raised while producing.
+            await producer
+        finally:
+            if not producer.done():
+                # Bailing out early (e.g. the client went away): stop and unblock the producer.
+                self._stopped = True
+                while not queue.empty():
+                    queue.get_nowait()
+
+        await self.websocket.send_json(STREAM_END_MESSAGE)
+        return "".join(sent)
+
+    async def _send(self, frame):
+        await self.websocket.send_text(frame)
+        self.frames_sent += 1
+
+    def _produce(self, generator, queue, loop):
+        try:
+            for chunk in generator:
+                if self._stopped:
+                    break
+                if chunk:
+                    # Blocks this thread while the queue is full (client backpressure).
+                    asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+        finally:
+            if self._stopped:
+                if hasattr(generator, "close"):
+                    generator.close()
+            else:
+                asyncio.run_coroutine_threadsafe(queue.put(_END_OF_STREAM), loop).result()
@@ -0,0 +1,29 @@
+# Rough characters-per-token ratio for English prose with OpenAI tokenizers. Good enough
+# for budgeting and reporting; exact counts come back in the API usage fields.
+CHARS_PER_TOKEN = 4
+
+# Per-message overhead of the chat format (role, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    """Estimates the number of tokens in a string."""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_message_tokens(messages):
+    """Estimates the prompt tokens of a list of chat messages."""
+    return sum(
+        estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+        for message in messages
+    )
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Truncates a string to roughly max_tokens tokens."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "\n[...truncated]"
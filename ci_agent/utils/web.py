@@ -1,44 +1,75 @@
+import asyncio
+from collections import deque
+import os
+import random
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import httpx
 import requests
-import re
+from ci_agent.config import CACHE_DIR, SCRAPE_CACHE_MAX_BYTES
+from ci_agent.utils.cleaning import clean_markdown
+from ci_agent.utils.crawl import CrawlStore, normalize_url, site_of
+from ci_agent.utils.diskcache import DiskCache
+
+# Cached scrapes are served without revalidation for this long.
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+# Responses worth retrying (rate limited or transient server errors).
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
 
 class FireCrawler:
-    def __init__(self, server_url: str):
+    def __init__(
+            self,
+            server_url: str,
+            cache_dir: str = None,
+            cache_ttl: float = DEFAULT_CACHE_TTL,
+            max_concurrency: int = 16,
+            per_domain_concurrency: int = 2,
+            per_domain_delay: float = 1.0,
+            max_retries: int = 3,
+            timeout: float = 60.0,
+            transport: httpx.AsyncBaseTransport = None
+        ):
+        """
+        Args:
+            server_url (str): Base URL of the Firecrawl server.
+            cache_dir (str, optional): Directory of the on-disk response cache. Defaults to CACHE_DIR.
+            cache_ttl (float): Seconds a cached page is served before it is revalidated.
+            max_concurrency (int): Maximum scrapes in flight for bulk scraping.
+            per_domain_concurrency (int): Maximum scrapes in flight per target domain.
+            per_domain_delay (float): Minimum seconds between requests to the same domain.
+            max_retries (int): Retries for transport errors, 429s and 5xx responses.
+            timeout (float): Request timeout in seconds.
+            transport (httpx.AsyncBaseTransport, optional): Custom transport for the async
+                client, e.g. httpx.MockTransport when testing against a mock server.
+        """
         self.url = server_url
-    
+        self.cache_ttl = cache_ttl
+        self.max_concurrency = max_concurrency
+        self.per_domain_concurrency = per_domain_concurrency
+        self.per_domain_delay = per_domain_delay
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.transport = transport
+        self.cache = DiskCache(
+            os.path.join(cache_dir or CACHE_DIR, "scrape.sqlite3"),
+            SCRAPE_CACHE_MAX_BYTES
+        )
+        # Keep-alive connections for the synchronous API.
+        self.session = requests.Session()
+        # Per event loop, since asyncio primitives are bound to the loop that uses them.
+        self._domain_slots = weakref.WeakKeyDictionary()
+        self._domain_pacing = weakref.WeakKeyDictionary()
+        self._domain_last_request = {}
+
     def _clean_markdown(self, markdown_text):
-        cleaned_lines = []
-        seen_content = set()
-        
-        # Regex patterns to remove image links and long-form links
-        image_link_pattern = re.compile(r'!\[.*?\]\(.*?\)')  # Matches ![alt](url)
-        standalone_link_pattern = re.compile(r'^https?://\S+$')  # Matches full-line URLs
-        inline_link_pattern = re.compile(r'\[.*?\]\(https?://.*?\)')  # Matches [text](url)
-        
-        lines = markdown_text.split('\n')
-        
-        for line in lines:
-            line = image_link_pattern.sub('', line)  # Remove image links
-            line = inline_link_pattern.sub('', line)  # Remove inline links
-            
-            # Skip empty lines or just dashes
-            if not line.strip() or line.strip() == '-' * len(line.strip()):
-                continue
-            
-            # Skip standalone URLs
-            if standalone_link_pattern.match(line.strip()):
-                continue
-            
-            # Keep headers and text content
-            if line.strip().startswith('#') or line.strip():
-                # Check for duplicate content
-                if line.strip() not in seen_content:
-                    cleaned_lines.append(line.strip())
-                    seen_content.add(line.strip())
-        
-        return '\n'.join(cleaned_lines)
-    
-    def scrape(self, url):
-        payload = {
+        return clean_markdown(markdown_text)
+
+    def _payload(self, url):
+        return {
             "url":  url,
             "formats": ["markdown"],
             # "onlyMainContent": True,
@@ -63,19 +94,259 @@ class FireCrawler:
             "blockAds": True,
             "proxy": "basic"
         }
+
+    def _cache_entry(self, data):
+        """
+        Builds the cache entry for a successful scrape.
+
+        Cache validators are taken from the origin headers Firecrawl reports in the scrape
+        metadata; pages without them are simply re-scraped once stale.
+        """
+        metadata = {key.lower(): value for key, value in (data.get("metadata") or {}).items()}
+        return {
+            "markdown": data["markdown"],
+            "links": data.get("links", []),
+            "fetched_at": time.time(),
+            "etag": metadata.get("etag"),
+            "last_modified": metadata.get("last-modified"),
+        }
+
+    @staticmethod
+    def _cache_key(url, formats):
+        return f"{','.join(sorted(formats))}|{url}"
+
+    def _is_fresh(self, entry):
+        return time.time() - entry["fetched_at"] < self.cache_ttl
+
+    @staticmethod
+    def _conditional_headers(entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def scrape(self, url):
+        cache_key = self._cache_key(url, ["markdown"])
+        entry = self.cache.get(cache_key)
+        if entry and self._is_fresh(entry):
+            return self._clean_markdown(entry["markdown"])
+
+        payload = self._payload(url)
         headers = {
             "Content-Type": "application/json"
         }
 
-        response = requests.request("POST", f"{self.url}/v1/scrape", json=payload, headers=headers)
+        response = self.session.post(f"{self.url}/v1/scrape", json=payload, headers=headers, timeout=self.timeout)
         if response.status_code == 200:
             dictionary = response.json()
+            self.cache.set(cache_key, self._cache_entry(dictionary["data"]))
             markdown = dictionary["data"]["markdown"]
             return self._clean_markdown(markdown)
         return "Something went wrong"
 
+    async def scrape_many(self, urls, formats=None):
+        """
+        Scrapes many URLs concurrently over a shared keep-alive connection pool.
+
+        Concurrency is bounded globally and per domain, requests to the same domain are
+        spaced by per_domain_delay, failures are retried with exponential backoff, and
+        responses are served from the on-disk cache (revalidated once stale).
+
+        Args:
+            urls (list): URLs to scrape.
+            formats (list, optional): Firecrawl formats to request. Defaults to ["markdown"].
+
+        Returns:
+            dict: url -> cleaned markdown, or None if the page could not be scraped.
+        """
+        results = await self.scrape_entries(urls, formats)
+        return {
+            url: self._clean_markdown(entry["markdown"]) if entry else None
+            for url, entry in results.items()
+        }
+
+    async def scrape_entries(self, urls, formats=None):
+        """
+        Like scrape_many, but returns the raw cache entries ({'markdown', 'links', 'fetched_at',
+        'etag', 'last_modified'}) instead of cleaned markdown.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._async_client() as client:
+            async def bounded(url):
+                async with semaphore:
+                    return await self._scrape_async(client, url, formats or ["markdown"])
+            entries = await asyncio.gather(*(bounded(url) for url in urls))
+        return dict(zip(urls, entries))
+
+    async def _scrape_async(self, client, url, formats):
+        cache_key = self._cache_key(url, formats)
+        entry = self.cache.get(cache_key)
+        if entry and self._is_fresh(entry):
+            return entry
+
+        if entry and await self._not_modified(client, url, entry):
+            # Stale but unchanged at the origin: no need for a full re-scrape.
+            entry["fetched_at"] = time.time()
+            self.cache.set(cache_key, entry)
+            return entry
+
+        entry = await self._fetch(client, url, formats)
+        if entry is not None:
+            self.cache.set(cache_key, entry)
+        return entry
+
+    async def crawl(self, start_url, company, max_depth=3, max_pages=500):
+        """
+        Crawls a competitor's site from start_url and stores the cleaned pages per company.
+
+        The frontier is explored breadth first within the start URL's site, with URLs
+        normalized and deduplicated. On a recrawl, pages whose origin answers a conditional
+        HEAD with 304 are not scraped again, and scraped pages are compared by content hash
+        so only real changes are reported.
+
+        Args:
+            start_url (str): URL to start from (e.g. the company's home page).
+            company (str): Company the pages are stored under.
+            max_depth (int): Maximum link depth from start_url.
+            max_pages (int): Maximum number of pages to visit.
+
+        Returns:
+            dict: Counts of 'new', 'changed', 'unchanged' and 'failed' pages.
+        """
+        store = CrawlStore(company)
+        start = normalize_url(start_url)
+        if start is None:
+            raise ValueError(f"Cannot crawl {start_url}")
+        site = site_of(start)
+
+        stats = {"new": 0, "changed": 0, "unchanged": 0, "failed": 0}
+        frontier = deque([(start, 0)])
+        seen = {start}
+        visited = 0
+        async with self._async_client() as client:
+            while frontier and visited < max_pages:
+                batch = [frontier.popleft() for _ in range(min(len(frontier), self.max_concurrency, max_pages - visited))]
+                visited += len(batch)
+                results = await asyncio.gather(*(self._crawl_page(client, store, url) for url, _ in batch))
+                for (url, depth), (status, links) in zip(batch, results):
+                    stats[status] += 1
+                    if depth >= max_depth:
+                        continue
+                    for link in links:
+                        link = normalize_url(link, base=url)
+                        if link and link not in seen and site_of(link) == site:
+                            seen.add(link)
+                            frontier.append((link, depth + 1))
+
+        print(f"Crawled {visited} page(s) of {site} for {company}: {stats}")
+        return stats
+
+    async def _crawl_page(self, client, store, url):
+        """Returns (status, links) for one page, scraping it only if it may have changed."""
+        record = store.get(url)
+        if record and await self._not_modified(client, url, record):
+            store.touch(url)
+            return "unchanged", record["links"]
+
+        entry = await self._fetch(client, url, ["markdown", "links"])
+        if entry is None:
+            return "failed", record["links"] if record else []
+
+        status = store.put(
+            url,
+            self._clean_markdown(entry["markdown"]),
+            entry["links"],
+            etag=entry["etag"],
+            last_modified=entry["last_modified"]
+        )
+        return status, entry["links"]
+
+    async def _not_modified(self, client, url, entry):
+        """Revalidates an entry with a conditional HEAD; True if the origin answers 304."""
+        if not (entry.get("etag") or entry.get("last_modified")):
+            return False
+        response = await self._request(client, "HEAD", url, headers=self._conditional_headers(entry))
+        return response is not None and response.status_code == 304
+
+    async def _fetch(self, client, url, formats):
+        """
+        Scrapes a URL through Firecrawl.
+
+        Returns:
+            dict | None: A cache entry, or None if the page could not be scraped.
+        """
+        payload = self._payload(url)
+        payload["formats"] = formats
+        response = await self._request(client, "POST", f"{self.url}/v1/scrape", domain_of=url, json=payload)
+        if response is None or response.status_code != 200:
+            print(f"Failed to scrape {url}")
+            return None
+
+        return self._cache_entry(response.json()["data"])
+
+    def _async_client(self):
+        """Shared keep-alive client for bulk operations."""
+        limits = httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency
+        )
+        return httpx.AsyncClient(limits=limits, timeout=self.timeout, transport=self.transport)
+
+    async def _request(self, client, method, url, domain_of=None, **kwargs):
+        """
+        Sends a request with per-domain politeness and retries.
+
+        Args:
+            domain_of (str, optional): URL whose domain the politeness limits apply to.
+                                       Defaults to url itself.
+
+        Returns:
+            httpx.Response | None: The response, or None if all attempts failed.
+        """
+        domain = urlsplit(domain_of or url).netloc.lower()
+        slots = self._domain_slots.setdefault(asyncio.get_running_loop(), {})
+        slot = slots.setdefault(domain, asyncio.Semaphore(self.per_domain_concurrency))
+        pacing = self._domain_pacing.setdefault(asyncio.get_running_loop(), {})
+        pace = pacing.setdefault(domain, asyncio.Lock())
+        for attempt in range(self.max_retries + 1):
+            async with slot:
+                # Requests in flight to a domain may overlap, but their starts are spaced out.
+                async with pace:
+                    wait = self._domain_last_request.get(domain, 0) + self.per_domain_delay - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    self._domain_last_request[domain] = time.monotonic()
+                try:
+                    response = await client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    print(f"{method} {url} failed: {e!r}")
+                    response = None
+
+            if response is not None and response.status_code not in RETRY_STATUS_CODES:
+                return response
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt, response))
+        return None
+
+    @staticmethod
+    def _backoff(attempt, response=None):
+        """Exponential backoff with jitter, honouring Retry-After when the server sends one."""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        return min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random())
+
 #### TESTING
 if __name__ == "__main__":
     f = FireCrawler("http://localhost:3002")
     response = f.scrape("https://icon.me/")
-    print(response)
\ No newline at end of file
+    print(response)
+    print(asyncio.run(f.scrape_many(["https://icon.me/", "https://icon.me/about"])))